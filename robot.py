@@ -2,7 +2,6 @@
 import re
 import sys
 import threading
-import time
 from typing import Union, List
 
 import botpy
@@ -12,8 +11,13 @@ from botpy.message import Message, GroupMessage, C2CMessage, DirectMessage
 
 from src.core.bot.decorator import command, PermissionLevel
 from src.core.bot.interact import RobotMessage
-from src.core.bot.transit import clear_message_queue, dispatch_message, activate_scheduled_jobs
+from src.core.bot.loop_monitor import get_loop_lag_stats, start_loop_monitor
+from src.core.bot.message import get_media_cache_stats, get_outbound_stats
+from src.core.bot.reload import reload_module
+from src.core.bot.transit import drain_for_restart, dispatch_message, activate_scheduled_jobs, replay_message_journal, \
+    get_worker_pool_stats, get_admission_counters, get_scene_usage
 from src.core.constants import Constants
+from src.core.util.http_client import get_response_cache
 
 tasks_sched = BlockingScheduler()
 
@@ -25,8 +29,7 @@ def tasks_sched_thread():
 @command(tokens=["去死", "重启", "restart", "reboot"], permission_level=PermissionLevel.ADMIN)
 def reply_restart_bot(message: RobotMessage):
     message.reply("好的捏，捏？欸我怎么似了" if message.tokens[0] == '/去死' else "好的捏，正在重启bot")
-    clear_message_queue()
-    time.sleep(2)  # 等待 message 通知消息线程发送回复
+    drain_for_restart(Constants.modules_conf.transit.get("drain_timeout", 10))  # 未处理的消息由新进程重放
     Constants.log.info("[obot-core] 正在重启")
     os.execl(sys.executable, sys.executable, *sys.argv)
 
@@ -39,17 +42,76 @@ def reply_reload_conf(message: RobotMessage):
     Constants.log.info("[obot-core] 已重载配置文件")
 
 
-@command(tokens=["对话场景ID", "chat_scene_id"])
+@command(tokens=["重载模块", "reload_module"], permission_level=PermissionLevel.ADMIN)
+def reply_reload_module(message: RobotMessage):
+    if len(message.tokens) < 2:
+        message.reply("请提供需要重载的模块，如 /reload_module cp.cf", modal_words=False)
+        return
+
+    try:
+        result = reload_module(message.tokens[1])
+    except ModuleNotFoundError:
+        message.reply(f"未找到模块 {message.tokens[1]}", modal_words=False)
+        return
+
+    message.reply(f"已重载模块 {result.module_path}\n\n"
+                  f"指令: {result.command_count} 条，定时任务: {result.job_count} 个\n"
+                  f"耗时: {result.cost * 1000:.0f}ms", modal_words=False)
+
+
+@command(tokens=["队列状态", "queue_stat"], permission_level=PermissionLevel.ADMIN, cost="light")
+def reply_queue_stat(message: RobotMessage):
+    stats = get_worker_pool_stats()
+    light_stats = get_worker_pool_stats(light=True)
+    busiest = sorted(stats.key_depths.items(), key=lambda kv: -kv[1])[:5]
+    busiest_info = '\n'.join(f"{key}: {depth}" for key, depth in busiest) if busiest else "暂无"
+    counters = get_admission_counters()
+    media_stats = get_media_cache_stats()
+    lag_stats = get_loop_lag_stats()
+    outbound_stats = get_outbound_stats()
+    cache_info = '\n'.join(f"{item.host}: 命中率 {item.hit_ratio * 100:.0f}%，"
+                           f"未命中 {item.misses}，节省 {item.bytes_saved / 1024:.0f}KB"
+                           for item in get_response_cache().stats()) or "暂无"
+    admission_info = '\n'.join(f"{name}: 限流 {counters['rejected'].get(name, 0)}，丢弃 {counters['shed'].get(name, 0)}"
+                                for name in sorted(set(counters['rejected']) | set(counters['shed']))) or "暂无"
+    message.reply(f"[Transit] 工作线程池状态\n\n"
+                  f"工作线程: {stats.busy_workers}/{stats.workers} 忙碌\n"
+                  f"活跃队列: {stats.active_keys}，排队请求: {stats.queued}\n"
+                  f"排队耗时: 平均 {stats.avg_wait * 1000:.0f}ms，最长 {stats.max_wait * 1000:.0f}ms\n"
+                  f"已处理请求: {stats.processed}\n"
+                  f"快速通道: {light_stats.busy_workers}/{light_stats.workers} 忙碌，"
+                  f"排队 {light_stats.queued}，已处理 {light_stats.processed}\n\n"
+                  f"事件循环延迟: 平均 {lag_stats.avg_lag * 1000:.0f}ms，最长 {lag_stats.max_lag * 1000:.0f}ms\n"
+                  f"出站回复: 排队 {outbound_stats.queued}，已发送 {outbound_stats.sent}，"
+                  f"合并 {outbound_stats.merged}，重试 {outbound_stats.retried}，失败 {outbound_stats.failed}\n"
+                  f"媒体缓存: {media_stats.entries} 条，命中 {media_stats.hits}，"
+                  f"未命中 {media_stats.misses}，作废 {media_stats.invalidated}\n\n"
+                  f"最繁忙的队列:\n{busiest_info}\n\n"
+                  f"准入限制:\n{admission_info}\n\n"
+                  f"网络缓存:\n{cache_info}", modal_words=False)
+
+
+@command(tokens=["场景用量", "scene_usage"], permission_level=PermissionLevel.ADMIN, cost="light")
+def reply_scene_usage(message: RobotMessage):
+    usages = get_scene_usage()
+    weights = Constants.modules_conf.transit.get("scene_weights", {})
+    usage_info = '\n'.join(f"{usage.scene} (权重 {weights.get(usage.scene, 1)}): "
+                           f"{usage.count} 次，耗时 {usage.wall_time:.1f}s，CPU {usage.cpu_time:.1f}s"
+                           for usage in usages[:10]) if usages else "暂无"
+    message.reply(f"[Transit] 最近一小时各对话场景的用量\n\n{usage_info}", modal_words=False)
+
+
+@command(tokens=["对话场景ID", "chat_scene_id"], cost="light")
 def reply_chat_scene_id(message: RobotMessage):
     message.reply(f'当前对话场景 ID\n\n{message.uuid}', modal_words=False)
 
 
-@command(tokens=["我的ID", "my_id"])
+@command(tokens=["我的ID", "my_id"], cost="light")
 def reply_my_id(message: RobotMessage):
     message.reply(f'你的 ID（不同对话场景下你的 ID 是不同的）\n\n{message.author_id}', modal_words=False)
 
 
-@command(tokens=["实例ID", "inst_id"], permission_level=PermissionLevel.ADMIN)
+@command(tokens=["实例ID", "inst_id"], permission_level=PermissionLevel.ADMIN, cost="light")
 def reply_my_id(message: RobotMessage):
     message.reply(f'当前正在运行的 OBot 实例的 ID\n\n{Constants.inst_id}', modal_words=False)
 
@@ -99,9 +161,15 @@ class MyClient(Client):
                            f"版本 {Constants.core_version}-{Constants.git_commit.hash_short}")
         Constants.log.info(f"[obot-core] 当前运行实例 ID: {Constants.inst_id}")
 
+        # 监测事件循环是否被阻塞
+        start_loop_monitor(self.loop)
+
         # 激活所有定时主动消息任务
         activate_scheduled_jobs(self.api, self.loop, tasks_sched)
 
+        # 重放重启前尚未处理的消息
+        replay_message_journal(self.api, self.loop)
+
     async def on_at_message_create(self, message: Message):
         attachment_info = (f" | {message.attachments}"
                            if len(message.attachments) > 0 else "")
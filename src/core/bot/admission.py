@@ -0,0 +1,137 @@
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+
+
+class Verdict(Enum):
+    ACCEPT = "accept"
+    REJECTED = "rejected"  # 触发频率限制
+    SHED = "shed"  # 队列已满，主动丢弃
+
+
+@dataclass(frozen=True)
+class AdmissionRule:
+    """
+    一组准入限制，字段为 None 时不限制
+
+    :param queue_cap: 单个工作队列中最多排队的请求数 (含正在处理的请求)
+    :param scene_rate: 同一对话场景每秒补充的令牌数
+    :param scene_burst: 同一对话场景的令牌桶容量
+    :param user_rate: 同一用户每秒补充的令牌数
+    :param user_burst: 同一用户的令牌桶容量
+    """
+    name: str  # 规则生效的范围，为指令名、模块名或 default，同一范围共享令牌桶
+    queue_cap: int | None = None
+    scene_rate: float | None = None
+    scene_burst: float | None = None
+    user_rate: float | None = None
+    user_burst: float | None = None
+
+    _FIELDS = ("queue_cap", "scene_rate", "scene_burst", "user_rate", "user_burst")
+
+    def merge(self, name: str, conf: dict) -> "AdmissionRule":
+        """以 conf 中的字段覆盖当前规则"""
+        values = {key: conf.get(key, getattr(self, key)) for key in self._FIELDS}
+        return AdmissionRule(name=name, **values)
+
+
+class _TokenBucket:
+    __slots__ = ("tokens", "updated", "notified")
+
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.notified = False  # 本轮限流是否已经提示过，避免刷屏
+
+    def refill(self, rate: float, burst: float):
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def take(self):
+        self.tokens -= 1
+        self.notified = False
+
+
+class AdmissionController:
+    """
+    按对话场景与用户的令牌桶限流，规则可按模块或指令配置。
+    配置对象变化 (如 /配置重载) 后自动重新解析规则
+    """
+
+    _MAX_BUCKETS = 4096
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conf: dict | None = None
+        self._rules: dict[tuple[str, str], AdmissionRule] = {}
+        self._buckets: dict[tuple, _TokenBucket] = {}
+        self._rejected: dict[str, int] = {}
+        self._shed: dict[str, int] = {}
+
+    def resolve(self, conf: dict, module: str, command: str) -> AdmissionRule:
+        """
+        按 default < 模块 < 指令 的优先级合并规则
+
+        :param conf: transit 配置中的 admission 部分
+        """
+        with self._lock:
+            if conf is not self._conf:
+                self._conf = conf
+                self._rules.clear()
+            rule = self._rules.get((module, command))
+            if rule is None:
+                rule = AdmissionRule("default").merge("default", conf.get("default", {}))
+                rules_conf = conf.get("rules", {})
+                for name in (module, command):
+                    if name in rules_conf:
+                        rule = rule.merge(name, rules_conf[name])
+                self._rules[(module, command)] = rule
+            return rule
+
+    def acquire(self, rule: AdmissionRule, uuid: str, author_id: str) -> tuple[Verdict, bool]:
+        """
+        为一次请求消耗场景与用户的令牌，两者都有剩余时才一并扣除，被拒绝的请求不消耗任何令牌
+
+        :return: 判定结果，以及是否需要提示用户 (每轮限流只提示一次)
+        """
+        limits = [(rule.scene_rate, rule.scene_burst, (rule.name, uuid)),
+                  (rule.user_rate, rule.user_burst, (rule.name, uuid, author_id))]
+        with self._lock:
+            if len(self._buckets) > self._MAX_BUCKETS:
+                self._prune()
+            buckets = []
+            for rate, burst, key in limits:
+                if rate is None:
+                    continue
+                burst = max(1.0, burst if burst is not None else rate)
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = _TokenBucket(burst)
+                bucket.refill(rate, burst)
+                if bucket.tokens < 1:
+                    self._rejected[rule.name] = self._rejected.get(rule.name, 0) + 1
+                    notify = not bucket.notified
+                    bucket.notified = True
+                    return Verdict.REJECTED, notify
+                buckets.append(bucket)
+            for bucket in buckets:
+                bucket.take()
+        return Verdict.ACCEPT, False
+
+    def record_shed(self, rule: AdmissionRule):
+        with self._lock:
+            self._shed[rule.name] = self._shed.get(rule.name, 0) + 1
+
+    def _prune(self):
+        # 移除长时间未使用的令牌桶，调用方需持有锁
+        now = time.monotonic()
+        idle = [key for key, bucket in self._buckets.items() if now - bucket.updated > 600]
+        for key in idle:
+            del self._buckets[key]
+
+    def counters(self) -> dict[str, dict[str, int]]:
+        """获取各规则范围被限流 (rejected) 与被丢弃 (shed) 的请求数"""
+        with self._lock:
+            return {"rejected": dict(self._rejected), "shed": dict(self._shed)}
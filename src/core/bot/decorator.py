@@ -1,11 +1,12 @@
+import contextlib
 import logging
-from dataclasses import dataclass
-from typing import Callable
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Hashable, Literal, Iterator
 
-from thefuzz import process
-
-from src.core.bot.message import MessageType
+from src.core.bot.message import MessageType, RobotMessage
 from src.core.bot.perm import PermissionLevel
+from src.core.bot.suggest import SuggestionIndex
 
 @dataclass(frozen=True)
 class CommandScope:
@@ -28,8 +29,17 @@ class CommandScope:
 
 __commands_primary__: dict[str, dict[str, str]] = {}
 __commands__: dict[str, dict[str, tuple[Callable, PermissionLevel, bool, bool,
-                                          CommandScope | None]]] = {}
+                                          CommandScope | None, bool | Callable, str,
+                                          float | None, Callable | None]]] = {}
 __modules__: dict[str, str | Callable[[], str]] = {}
+__module_names__: dict[str, str] = {}  # python 模块路径 -> 模块名
+
+registry_lock = threading.RLock()  # 热重载时持有，避免分发过程中读到不完整的注册表
+
+_registry_revision = 0  # 每次注册指令时自增，用于判断路由表等预计算结构是否过期
+
+_suggestion_index: SuggestionIndex | None = None
+_suggestion_revision = -1
 
 
 @dataclass(frozen=True)
@@ -45,9 +55,44 @@ class ScheduledJobInfo:
 __scheduled_jobs__: dict[str, list[ScheduledJobInfo]] = {}
 
 
+@dataclass
+class StagedModule:
+    """热重载时暂存的模块注册内容，导入完成后由 replace_module 整体替换到注册表"""
+    module_path: str
+    commands: dict[str, tuple] = field(default_factory=dict)
+    commands_primary: dict[str, str] = field(default_factory=dict)
+    scheduled_jobs: list[ScheduledJobInfo] = field(default_factory=list)
+    name: str | None = None
+    version: str | Callable[[], str] | None = None
+
+
+_staging = threading.local()
+
+
+@contextlib.contextmanager
+def stage_module(module_path: str) -> Iterator[StagedModule]:
+    """
+    在此范围内，当前线程中 module_path 注册的指令、定时任务与模块信息暂存起来而不写入注册表，
+    使导入模块时不需要持有 registry_lock
+    """
+    staged = StagedModule(module_path)
+    _staging.module = staged
+    try:
+        yield staged
+    finally:
+        _staging.module = None
+
+
+def _staged_of(module_name: str) -> StagedModule | None:
+    staged = getattr(_staging, "module", None)
+    return staged if staged is not None and staged.module_path == module_name else None
+
+
 def command(tokens: list, permission_level: PermissionLevel = PermissionLevel.USER,
             is_command: bool = True, multi_thread: bool = False,
-            scope: CommandScope | None = None):
+            scope: CommandScope | None = None, coalesce: bool | Callable[[RobotMessage], Hashable | None] = False,
+            cost: Literal["light", "heavy"] = "heavy", timeout: float | None = None,
+            fast_path: Callable[[RobotMessage], Callable | None] | None = None):
     """
         创建一条命令。
 
@@ -57,25 +102,46 @@ def command(tokens: list, permission_level: PermissionLevel = PermissionLevel.US
         :param multi_thread: 同一文件下注册的函数是否只有一个工作线程，若为多线程则同文件同上下文（如同一群组）只有一个工作线程
         :param scope: 限制该指令可用的对话场景，为 CommandScope，不指定时无限制。
                       失配时将以 CommandScope.denied_reply 回复
-
-        multi_thread为真时，线程生命周期最多一小时
+        :param coalesce: 合并执行中的相同请求。为 True 时以对话场景、指令与参数作为键，
+                         也可传入以 message 为参数、返回键的方法，返回 None 时不合并 (如需区分对话场景可将 uuid 放入键中)。
+                         键相同的请求在前一个请求完成前到达时不会重复执行，而是复用其回复内容。
+                         权限等级不同的用户发起的请求总是不合并
+        :param cost: 指令的开销，默认为 heavy。light 指令进入独立的快速通道，不会排在同模块的 heavy 指令之后，
+                     通道内仍按模块串行。仅适用于不依赖模块内其他指令执行顺序、且能很快完成的指令
+        :param timeout: 指令的截止时间，秒。为 None 时使用配置中的 transit.command_timeout，小于等于 0 时不限制。
+                        超时后将回复用户并释放工作线程，同时取消指令的取消令牌，网络请求、渲染与子进程会随之中止
+
+        :param fast_path: 以 message 为参数，返回用于处理该消息的 async def 方法，返回 None 时仍在工作线程中执行 func。
+                          用于只有部分子指令为纯网络请求的指令，其余子指令仍经过工作线程池排队
+
+        func 可以为 async def，此时指令作为任务直接运行在 botpy 的事件循环上，不占用工作线程，
+        需使用 message.reply_async 等异步接口，且不能调用阻塞方法
     """
 
     def decorator(func):
+        global _registry_revision
+        if cost not in ("light", "heavy"):
+            raise ValueError(f'Function {func.__name__} has invalid cost {cost!r}')
         if not tokens:
             raise ValueError(f'Function {func.__name__} requires tokens')
 
         module_name = func.__module__ or "default.unknown"  # 根据函数注册的位置分类处理
 
-        __commands__.setdefault(module_name, {})
-        __commands_primary__.setdefault(module_name, {})
+        staged = _staged_of(module_name)
+        if staged is not None:
+            module_commands, module_primary = staged.commands, staged.commands_primary
+        else:
+            module_commands = __commands__.setdefault(module_name, {})
+            module_primary = __commands_primary__.setdefault(module_name, {})
         primary_token_name = (f'/{tokens[0]}' if is_command else f'{tokens[0]}').lower()
-        __commands_primary__[module_name][primary_token_name] = func.__name__  # 记录第一个 token 对应的方法
+        module_primary[primary_token_name] = func.__name__  # 记录第一个 token 对应的方法
 
         for token in tokens:
             token_name = (f'/{token}' if is_command else f'{token}').lower()  # 忽略大小写直接匹配
-            __commands__[module_name][token_name] = (
-                func, permission_level, is_command, multi_thread, scope)
+            module_commands[token_name] = (
+                func, permission_level, is_command, multi_thread, scope, coalesce, cost, timeout, fast_path)
+        if staged is None:
+            _registry_revision += 1
         return func
 
     return decorator
@@ -91,7 +157,12 @@ def module(name: str,
     """
 
     def decorator(func):
-        __modules__[name] = version
+        staged = _staged_of(func.__module__)
+        if staged is not None:
+            staged.name, staged.version = name, version
+        else:
+            __modules__[name] = version
+            __module_names__[func.__module__] = name
         return func
 
     logging.getLogger("entry").debug(f'[obot-init] 载入模块 {name} '
@@ -133,15 +204,16 @@ def scheduled(cron: str, targets: list[str], no_target: bool = False):
     def decorator(func):
         module_name = func.__module__ or "default.unknown"
 
-        __scheduled_jobs__.setdefault(module_name, [])
+        staged = _staged_of(module_name)
+        module_jobs = staged.scheduled_jobs if staged is not None else __scheduled_jobs__.setdefault(module_name, [])
         if no_target:
             # 纯定时任务，不传递 message 参数
-            __scheduled_jobs__[module_name].append(
+            module_jobs.append(
                 ScheduledJobInfo(func=func, cron=cron, module_name=module_name))
         else:
             for uuid in targets:
                 message_type, target_id = parse_uuid(uuid)
-                __scheduled_jobs__[module_name].append(
+                module_jobs.append(
                     ScheduledJobInfo(func=func, cron=cron,
                                      message_type=message_type, target=target_id,
                                      module_name=module_name))
@@ -150,11 +222,85 @@ def scheduled(cron: str, targets: list[str], no_target: bool = False):
     return decorator
 
 
+def unregister_module(module_path: str) -> dict:
+    """
+    移除 python 模块注册的所有指令、定时任务与模块信息，返回被移除的内容，可用于 restore_module 回滚
+
+    :param module_path: python 模块路径，如 src.module.cp.cf
+    """
+    global _registry_revision
+    with registry_lock:
+        name = __module_names__.pop(module_path, None)
+        removed = {
+            "commands": __commands__.pop(module_path, None),
+            "commands_primary": __commands_primary__.pop(module_path, None),
+            "scheduled_jobs": __scheduled_jobs__.pop(module_path, None),
+            "name": name,
+            "version": __modules__.pop(name, None) if name is not None else None,
+        }
+        _registry_revision += 1
+        return removed
+
+
+def replace_module(staged: StagedModule) -> dict:
+    """以暂存的内容整体替换模块的注册内容，只在替换期间持有 registry_lock，返回被替换的内容，可用于 restore_module 回滚"""
+    global _registry_revision
+    with registry_lock:
+        removed = unregister_module(staged.module_path)
+        module_path = staged.module_path
+        if staged.commands:
+            __commands__[module_path] = staged.commands
+            __commands_primary__[module_path] = staged.commands_primary
+        if staged.scheduled_jobs:
+            __scheduled_jobs__[module_path] = staged.scheduled_jobs
+        if staged.name is not None:
+            __module_names__[module_path] = staged.name
+            __modules__[staged.name] = staged.version
+        _registry_revision += 1
+        return removed
+
+
+def restore_module(module_path: str, removed: dict):
+    """将 unregister_module 移除的内容恢复到注册表"""
+    global _registry_revision
+    with registry_lock:
+        for registry, key in ((__commands__, "commands"), (__commands_primary__, "commands_primary"),
+                              (__scheduled_jobs__, "scheduled_jobs")):
+            if removed[key] is not None:
+                registry[module_path] = removed[key]
+            else:
+                registry.pop(module_path, None)
+        current_name = __module_names__.pop(module_path, None)
+        if current_name is not None:
+            __modules__.pop(current_name, None)
+        if removed["name"] is not None:
+            __module_names__[module_path] = removed["name"]
+            __modules__[removed["name"]] = removed["version"]
+        _registry_revision += 1
+
+
+def get_registry_revision() -> int:
+    """获取指令注册表的版本号，注册表变化后版本号会增加"""
+    return _registry_revision
+
+
 def get_command_count() -> int:
     """获取当前注册的主指令数量 (不包括别名)"""
     return sum(len(module_commands) for module_commands in __commands_primary__.values())
 
 
+def _get_suggestion_index() -> SuggestionIndex:
+    """
+    获取模糊匹配索引，指令注册表发生变化后自动重建
+    """
+    global _suggestion_index, _suggestion_revision
+    with registry_lock:
+        if _suggestion_index is None or _suggestion_revision != _registry_revision:
+            _suggestion_index = SuggestionIndex(__commands__)
+            _suggestion_revision = _registry_revision
+        return _suggestion_index
+
+
 def find_similar_commands(input_cmd: str, limit: int = 3,
                           permission_level: PermissionLevel = PermissionLevel.USER) -> list[str]:
     """
@@ -168,26 +314,7 @@ def find_similar_commands(input_cmd: str, limit: int = 3,
     if not input_cmd:
         return []
 
-    command_levels: dict[str, PermissionLevel] = {}
-    for module_commands in __commands__.values():
-        for cmd, (_, execute_level, _, _, _) in module_commands.items():
-            if not cmd.startswith('/'):
-                continue
-            name = cmd[:-1] if cmd.endswith('*') else cmd
-            if name not in command_levels:
-                command_levels[name] = execute_level
-
-    accessible_commands = [name for name, level in command_levels.items()
-                           if level <= permission_level]
-    candidates = process.extract(input_cmd, accessible_commands, limit=limit)
-
-    suggestions: list[str] = []
-    for candidate, ratio in candidates:
-        if ratio >= 50 and candidate not in suggestions:
-            suggestions.append(candidate)
-        if len(suggestions) >= limit:
-            break
-    return suggestions
+    return _get_suggestion_index().find(input_cmd, limit, permission_level)
 
 
 def get_command_alias_count() -> int:
@@ -1,5 +1,6 @@
 import random
 import secrets
+import threading
 from typing import Callable
 
 from pypinyin import pinyin, Style
@@ -8,8 +9,13 @@ from thefuzz import process
 from src.core.bot.decorator import find_similar_commands
 from src.core.bot.message import RobotMessage
 from src.core.constants import Constants
+from src.core.util.aho_corasick import AhoCorasick
 from src.core.util.tools import check_is_int
 
+_key_words_lock = threading.Lock()
+_key_words_matcher: AhoCorasick | None = None
+_key_words_source: tuple = (None, None)  # 构建自动机时的 (关键词列表, 配置) 对象
+
 
 def no_reply():
     """
@@ -38,19 +44,37 @@ def reply_command_not_found(message: RobotMessage, content: str):
         message.reply("没有找到该指令，输入 /help 查看可用指令")
 
 
+def _to_pinyin(text: str) -> str:
+    return ''.join(word[0] for word in pinyin(text, Style.NORMAL))
+
+
+def _get_key_words_matcher() -> tuple[AhoCorasick, list]:
+    """
+    获取关键词拼音的匹配自动机及其对应的关键词列表，关键词列表被替换或配置重载后自动重建
+    """
+    global _key_words_matcher, _key_words_source
+    key_words, modules_conf = Constants.key_words, Constants.modules_conf
+    with _key_words_lock:
+        built_key_words, built_conf = _key_words_source
+        if _key_words_matcher is None or built_key_words is not key_words or built_conf is not modules_conf:
+            _key_words_matcher = AhoCorasick((_to_pinyin(ask), idx)
+                                             for idx, (asks, _) in enumerate(key_words)
+                                             for ask in asks)
+            _key_words_source = (key_words, modules_conf)
+        return _key_words_matcher, _key_words_source[0]
+
+
 def reply_key_words(message: RobotMessage, content: str):
     """
     回复关键词匹配，精确到拼音
     """
-    random.shuffle(Constants.key_words)  # 多个关键词时的处理
     reply = random.choice(["你干嘛", "干什么", "咋了", "how", "what"])
 
-    for asks, answers in Constants.key_words:
-        for ask in asks:
-            ask_pinyin = ''.join(word[0] for word in pinyin(ask, Style.NORMAL))
-            ctx_pinyin = ''.join(word[0] for word in pinyin(content.lower(), Style.NORMAL))
-            if ask_pinyin in ctx_pinyin:
-                reply = random.choice(answers)
+    matcher, key_words = _get_key_words_matcher()
+    hits = matcher.search(_to_pinyin(content.lower()))
+    if hits:  # 多个关键词时随机选一个
+        _, answers = key_words[random.choice(sorted(hits))]
+        reply = random.choice(answers)
 
     message.reply(reply)
 
@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from src.core.constants import Constants
+
+
+@dataclass(frozen=True)
+class LoopLagStats:
+    """事件循环的调度延迟，反映事件循环被同步操作阻塞的程度"""
+    samples: int
+    avg_lag: float  # 秒
+    max_lag: float  # 秒，统计窗口内的最大值
+    last_lag: float  # 秒
+
+
+class LoopLagMonitor:
+    """
+    在事件循环中定期休眠，以实际唤醒时间与预期的差值作为调度延迟
+    """
+
+    def __init__(self, interval: float = 0.5, window: int = 240):
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._lags: deque[float] = deque(maxlen=window)
+        self._task: asyncio.Task | None = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """在 loop 中启动监测，需在该事件循环所在的线程调用，重复调用无效"""
+        if self._task is not None and not self._task.done():
+            return
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        Constants.log.info("[obot-core] 事件循环延迟监测已启动.")
+        while True:
+            expected = time.monotonic() + self._interval
+            await asyncio.sleep(self._interval)
+            lag = max(0.0, time.monotonic() - expected)
+            with self._lock:
+                self._lags.append(lag)
+            if lag > 1:
+                Constants.log.warning(f"[obot-core] 事件循环被阻塞 {lag:.2f}s")
+
+    def stats(self) -> LoopLagStats:
+        with self._lock:
+            lags = list(self._lags)
+        return LoopLagStats(
+            samples=len(lags),
+            avg_lag=sum(lags) / len(lags) if lags else 0.0,
+            max_lag=max(lags) if lags else 0.0,
+            last_lag=lags[-1] if lags else 0.0
+        )
+
+
+_loop_monitor = LoopLagMonitor()
+
+
+def start_loop_monitor(loop: asyncio.AbstractEventLoop):
+    """在 botpy 的事件循环中启动延迟监测"""
+    _loop_monitor.start(loop)
+
+
+def get_loop_lag_stats() -> LoopLagStats:
+    return _loop_monitor.stats()
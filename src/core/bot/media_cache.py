@@ -0,0 +1,75 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class MediaCacheStats:
+    """媒体上传缓存的命中情况"""
+    entries: int
+    hits: int
+    misses: int
+    invalidated: int  # 因过期或被平台拒绝而作废的条目数
+
+
+class MediaCache:
+    """
+    缓存 post_group_file / post_c2c_file 的上传结果，按 (文件内容哈希, 媒体类型, 对话场景) 区分。
+    file_info 只在上传时的对话场景内有效，过期时间取自平台返回的 ttl
+    """
+
+    _MAX_ENTRIES = 1024
+    _TTL_MARGIN = 60  # 提前作废，避免发送时恰好过期
+    _DEFAULT_TTL = 86400  # ttl 为 0 表示可长期使用，此时也定期重新上传
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, tuple[dict, float]] = OrderedDict()  # key -> (media, 过期时间)
+        self._hits = 0
+        self._misses = 0
+        self._invalidated = 0
+
+    @staticmethod
+    def hash_file(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get(self, key: tuple) -> dict | None:
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[1] <= time.monotonic():
+                del self._entries[key]
+                self._invalidated += 1
+                cached = None
+            if cached is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return cached[0]
+
+    def put(self, key: tuple, media: dict):
+        ttl = media.get('ttl', 0) if isinstance(media, dict) else 0
+        ttl = self._DEFAULT_TTL if not ttl or ttl <= 0 else min(ttl, self._DEFAULT_TTL)
+        if ttl <= self._TTL_MARGIN:
+            return
+        with self._lock:
+            self._entries[key] = (media, time.monotonic() + ttl - self._TTL_MARGIN)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: tuple):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._invalidated += 1
+
+    def stats(self) -> MediaCacheStats:
+        with self._lock:
+            return MediaCacheStats(entries=len(self._entries), hits=self._hits,
+                                   misses=self._misses, invalidated=self._invalidated)
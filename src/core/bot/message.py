@@ -1,17 +1,27 @@
 import asyncio
 import base64
+import concurrent.futures
+import contextvars
+import functools
+import os
 import random
 import re
 import threading
+import time
 import uuid
 from enum import Enum
-from typing import Optional, Union, Literal
+from types import SimpleNamespace
+from typing import Optional, Union, Literal, Callable, Any
 
 from botpy import BotAPI
+from botpy.errors import ServerError
 from botpy.message import Message, GroupMessage, C2CMessage, DirectMessage
 
+from src.core.bot.media_cache import MediaCache, MediaCacheStats
+from src.core.bot.outbound import OutboundJob, OutboundScheduler, OutboundStats
 from src.core.bot.perm import PermissionLevel
 from src.core.constants import Constants
+from src.core.util.cancel import get_cancel_token
 from src.core.util.exception import handle_exception
 from src.core.util.img_transform import patch_img_transform
 from src.core.util.tools import reverse_text_on_41
@@ -24,6 +34,95 @@ class MessageType(Enum):
     C2C = "c2c"
 
 
+_pending_sends: set[concurrent.futures.Future] = set()  # 已提交到事件循环但尚未完成的发送
+_pending_sends_lock = threading.Lock()
+
+
+def _track_send(future: concurrent.futures.Future):
+    with _pending_sends_lock:
+        _pending_sends.add(future)
+
+    def _discard(done: concurrent.futures.Future):
+        with _pending_sends_lock:
+            _pending_sends.discard(done)
+
+    future.add_done_callback(_discard)
+
+
+_media_cache = MediaCache()
+
+_outbound = OutboundScheduler(lambda: Constants.modules_conf.transit.get("outbound", {}))
+
+# 图片变换、读取文件与 base64 编码等阻塞操作在独立的线程池中进行，避免阻塞事件循环
+_media_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=max(1, Constants.modules_conf.transit.get("media_workers", 2)),
+    thread_name_prefix="Media Prep")
+
+_MEDIA_REJECTED_KEYWORDS = ("file_info", "file info", "文件信息")
+_B64_CHUNK = 3 << 18  # 需为 3 的倍数，保证分块编码的结果可以直接拼接
+
+
+async def _run_media_prep(func: Callable, *args) -> Any:
+    """在媒体线程池中执行阻塞操作，并沿用调用方的上下文 (如指令的取消令牌)"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        _media_executor, functools.partial(context.run, func, *args))
+
+
+def _is_media_rejected(error: Exception) -> bool:
+    """是否为平台以 file_info 无效或过期拒绝发送，botpy 对这类 4xx 响应抛出 ServerError"""
+    if not isinstance(error, ServerError):
+        return False
+    text = str(error).lower()
+    return any(keyword in text for keyword in _MEDIA_REJECTED_KEYWORDS)
+
+
+def _encode_file_base64(path: str) -> str:
+    """
+    分块读取文件并编码到预分配的缓冲区，不需要同时持有完整的原始文件。
+    上传接口经由 botpy 以 JSON 发送，file_data 只能为 str，转换时仍会复制一次编码结果，
+    因此峰值内存约为编码结果的两倍，节省的是原始文件的那一份
+    """
+    encoded = bytearray(4 * ((os.path.getsize(path) + 2) // 3))
+    chunk = memoryview(bytearray(_B64_CHUNK))
+    pos = 0
+    with open(path, "rb") as f:
+        while True:
+            filled = 0
+            while filled < len(chunk):
+                read = f.readinto(chunk[filled:])
+                if not read:
+                    break
+                filled += read
+            if filled == 0:
+                break
+            part = base64.b64encode(chunk[:filled])
+            encoded[pos:pos + len(part)] = part
+            pos += len(part)
+            if filled < len(chunk):
+                break
+    del encoded[pos:]  # 读取期间文件变小时截去多余部分
+    return encoded.decode("ascii")
+
+
+def get_media_cache_stats() -> MediaCacheStats:
+    """获取媒体上传缓存的命中情况"""
+    return _media_cache.stats()
+
+
+def get_outbound_stats() -> OutboundStats:
+    """获取出站回复的发送情况"""
+    return _outbound.stats()
+
+
+def wait_pending_sends(timeout: float) -> int:
+    """等待已提交的回复发送完成，返回超时后仍未完成的数量"""
+    with _pending_sends_lock:
+        pending = list(_pending_sends)
+    _, not_done = concurrent.futures.wait(pending, timeout=max(0.0, timeout))
+    return len(not_done)
+
+
 class RobotMessage:
     """合并多种消息类型的操作"""
 
@@ -41,6 +140,7 @@ class RobotMessage:
         self.seq_lock = threading.Lock()
         self.user_permission_level: PermissionLevel = PermissionLevel.USER
         self.uuid = str(uuid.uuid4())  # 默认值，正常来说会被覆盖
+        self.received_at = time.time()
         self._guild_public = False  # Guild only
         self._group_public = False  # Group only，非 @bot 的群公屏消息
         self._active = False  # 主动消息标记
@@ -48,6 +148,10 @@ class RobotMessage:
         self._channel_id: Optional[str] = None
         self._guild_id: Optional[str] = None
         self._group_openid: Optional[str] = None
+        self._reply_listeners: list[Callable[[str, dict], None]] = []  # 回复被发出时调用，参数为方法名与参数
+        self._progress_lock = threading.Lock()
+        self._progress_gen = 0
+        self._progress_pending: Optional[tuple[str, bool]] = None  # 尚未发出的进度提示 (内容, modal_words)
 
     def is_guild_public(self):
         return self._guild_public
@@ -138,108 +242,296 @@ class RobotMessage:
         self.author_id = openid  # C2C 使用 author_id 存储 openid
         self.uuid = f"c2c_{openid}"
 
-    def reply(self, content: str, img_path: str = None, img_url: str = None, modal_words: bool = True):
-        """异步发送回复的入口方法"""
-        if not self.loop:
-            raise RuntimeError("Event loop not initialized")
+    def to_journal(self) -> dict:
+        """序列化重放该消息所需的内容，用于重启前持久化尚未处理的消息"""
+        return {
+            "message_type": self.message_type.value,
+            "content": self.message.content,
+            "author_id": self.author_id,
+            "msg_id": self.message.id,
+            "msg_seq": self.msg_seq,
+            "uuid": self.uuid,
+            "guild_id": getattr(self.message, "guild_id", None),
+            "channel_id": getattr(self.message, "channel_id", None),
+            "group_openid": getattr(self.message, "group_openid", None),
+            "attachments": [dict(vars(attachment)) for attachment in self.attachments or []],
+            "guild_public": self._guild_public,
+            "group_public": self._group_public,
+            "received_at": self.received_at,
+        }
+
+    @classmethod
+    def from_journal(cls, api: BotAPI, loop: asyncio.AbstractEventLoop, entry: dict) -> "RobotMessage":
+        """由 to_journal 的结果还原消息，回复时沿用原消息的 msg_id 与 msg_seq"""
+        author = SimpleNamespace(id=entry["author_id"], member_openid=entry["author_id"],
+                                 user_openid=entry["author_id"])
+        raw_message = SimpleNamespace(id=entry["msg_id"], content=entry["content"], author=author,
+                                      guild_id=entry["guild_id"], channel_id=entry["channel_id"],
+                                      group_openid=entry["group_openid"],
+                                      attachments=[SimpleNamespace(**attachment)
+                                                   for attachment in entry["attachments"]])
+        packed_message = cls(api)
+        message_type = MessageType(entry["message_type"])
+        if message_type == MessageType.GUILD:
+            packed_message.setup_guild_message(loop, raw_message, is_public=entry["guild_public"])
+        elif message_type == MessageType.DIRECT:
+            packed_message.setup_direct_message(loop, raw_message)
+        elif message_type == MessageType.GROUP:
+            packed_message.setup_group_message(loop, raw_message, is_public=entry["group_public"])
+        else:
+            packed_message.setup_c2c_message(loop, raw_message)
+        packed_message.msg_seq = entry["msg_seq"]
+        packed_message.received_at = entry["received_at"]
+        return packed_message
+
+    def add_reply_listener(self, listener: Callable[[str, dict], None]):
+        """监听该消息发出的回复，用于将回复转发给其他消息"""
+        self._reply_listeners.append(listener)
+
+    def _notify_reply_listeners(self, method: str, kwargs: dict):
+        for listener in self._reply_listeners:
+            try:
+                listener(method, kwargs)
+            except Exception as e:
+                Constants.log.warning("[obot-act] 回复监听器出现异常.")
+                Constants.log.exception(f"[obot-act] {e}")
 
+    def _drop_if_cancelled(self) -> bool:
+        """所属指令已超时取消时弃置回复，避免在超时提示之后再发出过期的内容"""
+        token = get_cancel_token()
+        if token is not None and token.cancelled:
+            Constants.log.info("[obot-act] 指令已被取消，弃置回复")
+            return True
+        return False
+
+    def _make_friendly_content(self, content: str, modal_words: bool) -> str:
         friendly_content = content + random.choice(Constants.modal_words) if modal_words else content
-        friendly_content = reverse_text_on_41(friendly_content)
+        return reverse_text_on_41(friendly_content)
 
+    def _next_msg_seq(self) -> int:
         with self.seq_lock:
             self.msg_seq += 1
-            asyncio.run_coroutine_threadsafe(  # 不能使用 loop.create_task，会造成资源竞争
-                self._send_message(friendly_content, self.msg_seq, img_path, img_url),
+            return self.msg_seq
+
+    def progress(self, content: str, modal_words: bool = True):
+        """
+        提示正在处理，仅当 progress_delay 秒内指令仍未发出其他回复时才发送，
+        避免很快就能得到结果的查询多占用一次回复
+        """
+        if not self.loop:
+            raise RuntimeError("Event loop not initialized")
+        if self._drop_if_cancelled():
+            return
+
+        delay = Constants.modules_conf.transit.get("progress_delay", 0.8)
+        if delay <= 0:
+            self.reply(content, modal_words=modal_words)
+            return
+
+        with self._progress_lock:
+            self._progress_gen += 1
+            gen = self._progress_gen
+            self._progress_pending = (content, modal_words)
+        self.loop.call_soon_threadsafe(self.loop.call_later, delay, self._fire_progress, gen)
+
+    def _fire_progress(self, gen: int):
+        with self._progress_lock:
+            if gen != self._progress_gen or self._progress_pending is None:
+                return
+            content, modal_words = self._progress_pending
+            self._progress_pending = None
+        self._submit_message(self._make_friendly_content(content, modal_words))
+
+    def discard_progress(self):
+        """弃置尚未发出的进度提示，发出其他回复或指令结束时调用"""
+        with self._progress_lock:
+            self._progress_pending = None
+
+    def _submit_message(self, friendly_content: str, img_path: str = None, img_url: str = None):
+        with self.seq_lock:  # 持有锁提交，保证同一场景内的发送顺序与 msg_seq 一致
+            self.msg_seq += 1
+            _track_send(asyncio.run_coroutine_threadsafe(  # 不能使用 loop.create_task，会造成资源竞争
+                self._enqueue_message(friendly_content, self.msg_seq, img_path, img_url),
                 self.loop
-            )
+            ))
+
+    def reply(self, content: str, img_path: str = None, img_url: str = None, modal_words: bool = True,
+              forward: bool = True):
+        """
+        异步发送回复的入口方法
+
+        :param forward: 是否通知回复监听器，因人而异的回复 (如排队位次) 不应转发给合并的请求
+        """
+        if not self.loop:
+            raise RuntimeError("Event loop not initialized")
+        self.discard_progress()
+        if self._drop_if_cancelled():
+            return
+
+        friendly_content = self._make_friendly_content(content, modal_words)
+        if forward:
+            self._notify_reply_listeners("reply", {"content": content, "img_path": img_path,
+                                                   "img_url": img_url, "modal_words": modal_words})
+        self._submit_message(friendly_content, img_path, img_url)
 
     def reply_audio(self, audio_path: str = None, audio_url: str = None):
         """异步发送语音的入口方法"""
         if not self.loop:
             raise RuntimeError("Event loop not initialized")
+        self.discard_progress()
+        if self._drop_if_cancelled():
+            return
+
+        self._notify_reply_listeners("reply_audio", {"audio_path": audio_path, "audio_url": audio_url})
 
         with self.seq_lock:
             self.msg_seq += 1
-            asyncio.run_coroutine_threadsafe(  # 不能使用 loop.create_task，会造成资源竞争
-                self._send_audio(self.msg_seq, audio_path, audio_url),
+            _track_send(asyncio.run_coroutine_threadsafe(  # 不能使用 loop.create_task，会造成资源竞争
+                self._enqueue_audio(self.msg_seq, audio_path, audio_url),
                 self.loop
-            )
+            ))
+
+    async def reply_async(self, content: str, img_path: str = None, img_url: str = None,
+                          modal_words: bool = True):
+        """在事件循环中直接发送回复，供 async 指令使用，发送完成后返回"""
+        if not self.loop:
+            raise RuntimeError("Event loop not initialized")
+        self.discard_progress()
+        if self._drop_if_cancelled():
+            return
+
+        friendly_content = self._make_friendly_content(content, modal_words)
+        self._notify_reply_listeners("reply", {"content": content, "img_path": img_path,
+                                               "img_url": img_url, "modal_words": modal_words})
+        await self._enqueue_message(friendly_content, self._next_msg_seq(), img_path, img_url)
+
+    async def reply_audio_async(self, audio_path: str = None, audio_url: str = None):
+        """在事件循环中直接发送语音，供 async 指令使用，发送完成后返回"""
+        if not self.loop:
+            raise RuntimeError("Event loop not initialized")
+        self.discard_progress()
+        if self._drop_if_cancelled():
+            return
+
+        self._notify_reply_listeners("reply_audio", {"audio_path": audio_path, "audio_url": audio_url})
+        await self._enqueue_audio(self._next_msg_seq(), audio_path, audio_url)
+
+    async def _enqueue_message(self, content: str, msg_seq: int,
+                               img_path: str = None, img_url: str = None):
+        """交给出站调度器按场景排队发送"""
+        await _outbound.send(self.uuid, OutboundJob(
+            sender=lambda merged_content, seq: self._send_message(merged_content, seq, img_path, img_url),
+            content=content,
+            msg_seq=msg_seq,
+            mergeable=not img_path and not img_url,
+            owner=self
+        ))
+
+    async def _enqueue_audio(self, msg_seq: int, audio_path: str = None, audio_url: str = None):
+        await _outbound.send(self.uuid, OutboundJob(
+            sender=lambda _, seq: self._send_audio(seq, audio_path, audio_url),
+            content="",
+            msg_seq=msg_seq
+        ))
 
     async def _send_message(self, content: str, msg_seq: int,
                             img_path: str = None, img_url: str = None):
-        """统一消息发送入口"""
+        """统一消息发送入口，发送失败时抛出异常，由出站调度器记录"""
         if self._active:
             Constants.log.info(f"[obot-act] 向 {self.uuid} 发起主动回复: {content}")
         else:
             Constants.log.info(f"[obot-act] 发起回复: {content}")
 
-        try:
-            if img_path:
-                img_path = patch_img_transform(self.author_id, img_path)
-
-            # 处理媒体文件上传
-            media = (await self._upload_media(img_path, img_url, media_type="Image")
-                     if (img_path or img_url) and
-                        self.message_type not in [MessageType.GUILD, MessageType.DIRECT] else None)
+        if img_path:
+            img_path = await _run_media_prep(patch_img_transform, self.author_id, img_path)
 
-            base_params = await self._pack_message_params(content, msg_seq, media)
-            if not base_params:
-                return
-            params = base_params
+        # 处理媒体文件上传
+        if (img_path or img_url) and self.message_type not in [MessageType.GUILD, MessageType.DIRECT]:
+            await self._send_media_message(content, msg_seq, img_path, img_url, media_type="Image")
+            return
 
-            # 频道api只需传递参数
-            if self.message_type in [MessageType.GUILD, MessageType.DIRECT]:
-                params = {**base_params, 'file_image': img_path, 'image': img_url}
+        base_params = await self._pack_message_params(content, msg_seq, None)
+        if not base_params:
+            return
+        params = base_params
 
-            await self._handle_send_request(params)
+        # 频道api只需传递参数
+        if self.message_type in [MessageType.GUILD, MessageType.DIRECT]:
+            params = {**base_params, 'file_image': img_path, 'image': img_url}
 
-        except Exception as e:
-            Constants.log.warning("[obot-act] 发起回复失败.")
-            Constants.log.exception(f"[obot-act] {e}")
+        await self._handle_send_request(params)
 
     async def _send_audio(self, msg_seq: int, audio_path: str = None, audio_url: str = None):
-        """语音发送入口"""
+        """语音发送入口，发送失败时抛出异常"""
         if self.message_type in [MessageType.GUILD, MessageType.DIRECT]:
             await self._send_message("频道不支持发送语音消息", msg_seq)
             return
 
         Constants.log.info("[obot-act] 发起语音回复")
 
-        try:
-            if not audio_path and not audio_url:
-                raise ValueError("Missing audio path or url")
-
-            # 处理媒体文件上传
-            media = await self._upload_media(audio_path, audio_url, media_type="Audio")
-
-            params = await self._pack_message_params("", msg_seq, media)
+        if not audio_path and not audio_url:
+            raise ValueError("Missing audio path or url")
+
+        # 处理媒体文件上传
+        await self._send_media_message("", msg_seq, audio_path, audio_url, media_type="Audio")
+
+    async def _send_media_message(self, content: str, msg_seq: int, path: str, url: str,
+                                  media_type: Literal["Image", "Audio"]):
+        """
+        上传媒体文件并发送，缓存的 file_info 被平台以无效或过期拒绝时作废并重新上传一次，
+        网络异常等其他失败直接抛出，不影响缓存
+        """
+        for attempt in range(2):
+            media = await self._upload_media(path, url, media_type)
+            params = await self._pack_message_params(content, msg_seq, media)
             if not params:
                 return
+            try:
+                await self._handle_send_request(params)
+                return
+            except Exception as e:
+                cache_key = media.get('cache_key')
+                if attempt > 0 or cache_key is None or not _is_media_rejected(e):
+                    raise
+                _media_cache.invalidate(cache_key)
+                Constants.log.warning("[obot-act] 缓存的媒体文件已失效，重新上传.")
 
-            await self._handle_send_request(params)
-
-        except Exception as e:
-            Constants.log.warning("[obot-act] 发起语音回复失败.")
-            Constants.log.exception(f"[obot-act] {e}")
+    def _media_target(self) -> str:
+        if self.message_type == MessageType.GROUP:
+            return self._group_openid if self._active else self.message.group_openid
+        return self.author_id
 
     async def _upload_media(self, path: str, url: str,
                             media_type: Literal["Image", "Audio"]) -> dict:
-        """带重试机制的媒体上传"""
+        """带重试机制的媒体上传，本地文件的上传结果在 file_info 有效期内复用"""
         type_id = {
             "Image": 1,
             "Audio": 3
         }
+        cache_key = None
+        if path:
+            try:
+                cache_key = (await _run_media_prep(MediaCache.hash_file, path), media_type,
+                             self.message_type.value, self._media_target())
+                cached_media = _media_cache.get(cache_key)
+                if cached_media is not None:
+                    return {'status': 'ok', 'data': cached_media, 'cache_key': cache_key}
+            except Exception as e:
+                Constants.log.warning("[obot-act] 读取媒体上传缓存失败.")
+                Constants.log.exception(f"[obot-act] {e}")
+
         for _ in range(3):  # 最多重试3次
             try:
                 if path:
-                    with open(path, "rb") as f:
-                        file_data = base64.b64encode(f.read()).decode()
+                    file_data = await _run_media_prep(_encode_file_base64, path)
                     received_media = await self._call_upload_api(file_type=type_id[media_type],
                                                                  file_data=file_data)
                 else:
                     received_media = await self._call_upload_api(file_type=type_id[media_type],
                                                                  url=url)
                 if received_media['status'] == 'ok':
+                    if cache_key is not None:
+                        _media_cache.put(cache_key, received_media['data'])
                     return received_media
             except Exception as e:
                 Constants.log.warning("[obot-act] 上传媒体文件失败.")
@@ -320,7 +612,7 @@ class RobotMessage:
             api_method = self.api.post_c2c_message
 
         intended_params = {name: params[name] for name in intended_params_name if name in params}
-        await api_method(**intended_params)
+        await _outbound.call_with_retry(api_method, intended_params)
 
     async def _send_fallback_message(self, text: str, msg_seq: int):
         """发送失败回退消息"""
@@ -0,0 +1,210 @@
+import asyncio
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+import aiohttp
+from botpy.errors import SequenceNumberError
+
+from src.core.constants import Constants
+
+_NETWORK_ERRORS = (asyncio.TimeoutError, aiohttp.ClientConnectionError, ConnectionError)
+
+
+def _is_transient(error: Exception) -> bool:
+    """
+    是否为可以重试的发送失败：频率超限 (429)、5xx 与网络异常。
+    botpy 对未单独映射的状态码 (包括 400 等) 统一抛出不带状态码的 ServerError，
+    无法与服务端错误区分，因此不重试，避免对 msg_id 过期等永久性拒绝反复发送
+    """
+    if isinstance(error, SequenceNumberError):  # botpy 中 429 对应的异常
+        return True
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, _NETWORK_ERRORS)
+
+
+@dataclass
+class OutboundJob:
+    """
+    一次待发送的回复
+
+    :param sender: 实际发送的协程函数，参数为内容与 msg_seq
+    :param mergeable: 是否为可以与相邻回复合并的纯文本回复
+    :param owner: 回复所属的消息，只合并同一条消息的回复
+    """
+    sender: Callable[[str, int], Awaitable[None]]
+    content: str
+    msg_seq: int
+    mergeable: bool = False
+    owner: Any = None
+    created: float = field(default_factory=time.monotonic)
+    done: asyncio.Future | None = None
+
+
+@dataclass(frozen=True)
+class OutboundStats:
+    """出站回复的发送情况"""
+    targets: int  # 有待发送回复的对话场景数
+    queued: int
+    sent: int  # 实际调用的发送次数，合并后的回复只计一次
+    merged: int  # 被合并到前一条回复中的回复数
+    retried: int
+    failed: int
+
+
+class _AsyncBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self, rate: float, burst: float) -> float:
+        """预订一个令牌，返回需要等待的秒数，令牌不足时允许透支"""
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / rate
+
+
+class OutboundScheduler:
+    """
+    按对话场景排队发送回复，运行在 botpy 的事件循环中。
+    同一场景的回复按提交顺序 (即 msg_seq 顺序) 逐条发送，并按场景与全局的令牌桶限速，
+    可选地将短时间内同一消息的多条纯文本回复合并为一次调用
+    """
+
+    _MAX_MERGED_LENGTH = 2000
+
+    def __init__(self, conf_getter: Callable[[], dict]):
+        """
+        :param conf_getter: 获取 transit 配置中的 outbound 部分，每次发送时读取以支持配置重载
+        """
+        self._conf_getter = conf_getter
+        self._queues: dict[str, deque[OutboundJob]] = {}
+        self._buckets: dict[str, _AsyncBucket] = {}
+        self._global_bucket: _AsyncBucket | None = None
+        self._sent = 0
+        self._merged = 0
+        self._retried = 0
+        self._failed = 0
+
+    async def send(self, target: str, job: OutboundJob):
+        """提交回复并等待发送完成，同一 target 的回复按调用顺序发送"""
+        loop = asyncio.get_running_loop()
+        job.done = loop.create_future()
+        queue = self._queues.get(target)
+        if queue is None:
+            queue = self._queues[target] = deque()
+            loop.create_task(self._drain(target, queue))
+        queue.append(job)
+        await job.done
+
+    async def _drain(self, target: str, queue: deque[OutboundJob]):
+        try:
+            while queue:
+                job = queue.popleft()
+                if job.done.done():  # 等待方已取消
+                    continue
+                batch = await self._collect_batch(job, queue)
+
+                await self._throttle(target)
+                content = '\n'.join(item.content for item in batch)
+                try:
+                    await job.sender(content, job.msg_seq)
+                    self._sent += 1
+                    self._merged += len(batch) - 1
+                except Exception as e:
+                    self._failed += 1
+                    Constants.log.warning(f"[obot-act] 向 {target} 发送回复失败.")
+                    Constants.log.exception(f"[obot-act] {e}")
+                for item in batch:
+                    if not item.done.done():
+                        item.done.set_result(None)
+        finally:
+            if self._queues.get(target) is queue:
+                del self._queues[target]
+            for job in queue:  # 仅在事件循环关闭等异常情况下残留
+                if not job.done.done():
+                    job.done.cancel()
+
+    async def _collect_batch(self, job: OutboundJob, queue: deque[OutboundJob]) -> list[OutboundJob]:
+        batch = [job]
+        merge_window = self._conf_getter().get("merge_window", 0)
+        if not job.mergeable or merge_window <= 0:
+            return batch
+
+        await asyncio.sleep(max(0.0, job.created + merge_window - time.monotonic()))
+        length = len(job.content)
+        while queue:
+            nxt = queue[0]
+            if (not nxt.mergeable or nxt.owner is not job.owner or
+                    nxt.created - batch[-1].created > merge_window or
+                    length + len(nxt.content) + 1 > self._MAX_MERGED_LENGTH):
+                break
+            queue.popleft()
+            if not nxt.done.done():
+                batch.append(nxt)
+                length += len(nxt.content) + 1
+        return batch
+
+    async def _throttle(self, target: str):
+        conf = self._conf_getter()
+        target_rate = conf.get("target_rate", 2)
+        target_burst = max(1.0, conf.get("target_burst", 5))
+        global_rate = conf.get("global_rate", 20)
+        global_burst = max(1.0, conf.get("global_burst", 40))
+
+        wait = 0.0
+        if target_rate > 0:
+            bucket = self._buckets.get(target)
+            if bucket is None:
+                if len(self._buckets) > 4096:
+                    self._prune()
+                bucket = self._buckets[target] = _AsyncBucket(target_burst)
+            wait = bucket.reserve(target_rate, target_burst)
+        if global_rate > 0:
+            if self._global_bucket is None:
+                self._global_bucket = _AsyncBucket(global_burst)
+            wait = max(wait, self._global_bucket.reserve(global_rate, global_burst))
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def _prune(self):
+        now = time.monotonic()
+        idle = [target for target, bucket in self._buckets.items()
+                if now - bucket.updated > 600 and target not in self._queues]
+        for target in idle:
+            del self._buckets[target]
+
+    async def call_with_retry(self, api_method: Callable[..., Awaitable], params: dict) -> Any:
+        """调用发送接口，遇到频率超限或网络异常时按指数退避重试，msg_seq 不变以避免重复发送"""
+        conf = self._conf_getter()
+        max_retries = conf.get("max_retries", 3)
+        backoff = conf.get("retry_backoff", 0.5)
+        for attempt in range(max_retries + 1):
+            try:
+                return await api_method(**params)
+            except Exception as e:
+                if not _is_transient(e) or attempt >= max_retries:
+                    raise
+                self._retried += 1
+                delay = backoff * (2 ** attempt) * random.uniform(0.8, 1.2)
+                Constants.log.warning(f"[obot-act] 发送失败，{delay:.1f}s 后重试: {e}")
+                await asyncio.sleep(delay)
+        return None
+
+    def stats(self) -> OutboundStats:
+        queues = list(self._queues.values())  # 可能在其他线程中调用，先复制一份
+        return OutboundStats(
+            targets=len(queues),
+            queued=sum(len(queue) for queue in queues),
+            sent=self._sent,
+            merged=self._merged,
+            retried=self._retried,
+            failed=self._failed
+        )
@@ -0,0 +1,79 @@
+import importlib
+import importlib.util
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+from src.core.bot.decorator import __commands__, __module_names__, stage_module, replace_module, restore_module
+from src.core.constants import Constants
+
+_MODULE_PACKAGE = "src.module"
+
+_reload_lock = threading.Lock()  # 同时只重载一个模块
+
+
+@dataclass(frozen=True)
+class ReloadResult:
+    module_path: str
+    command_count: int
+    job_count: int
+    cost: float  # 秒
+
+
+def resolve_module_path(target: str) -> str:
+    """
+    将用户输入解析为 python 模块路径，支持模块名 (如 Codeforces)、
+    相对路径 (如 cp.cf)、文件名 (如 cf) 与完整路径 (如 src.module.cp.cf)
+    """
+    target = target.strip()
+    for module_path, name in __module_names__.items():
+        if name.lower() == target.lower():
+            return module_path
+    if target in __commands__ or target in __module_names__:
+        return target  # 已注册过指令的模块，如 robot
+
+    if target.startswith(f"{_MODULE_PACKAGE}."):
+        candidates = [target]
+    else:
+        candidates = [f"{_MODULE_PACKAGE}.{target}"]
+        candidates.extend(module_path for module_path in sys.modules
+                          if module_path.startswith(f"{_MODULE_PACKAGE}.") and
+                          module_path.rsplit('.', 1)[-1] == target)
+
+    for module_path in candidates:
+        if module_path in sys.modules or importlib.util.find_spec(module_path) is not None:
+            return module_path
+    raise ModuleNotFoundError(f"Module {target} not found")
+
+
+def reload_module(target: str) -> ReloadResult:
+    """
+    热重载一个功能模块：重新导入后以新的注册内容整体替换其指令与定时任务，导入失败时保留旧的注册内容。
+    导入期间注册的内容先暂存，不持有 registry_lock，事件循环上的分发不会被阻塞。
+    已排队的消息在处理时按指令名重新查找，因此会由新版本处理。
+    其他模块通过 import 直接引用的对象不会被替换，需要一并重载
+    """
+    from src.core.bot.transit import reactivate_scheduled_jobs  # transit 依赖本模块的注册表，延迟导入
+
+    module_path = resolve_module_path(target)
+    start_time = time.perf_counter()
+    with _reload_lock:
+        with stage_module(module_path) as staged:
+            if module_path in sys.modules:
+                importlib.reload(sys.modules[module_path])
+            else:
+                importlib.import_module(module_path)
+
+        removed = replace_module(staged)
+        try:
+            job_count = reactivate_scheduled_jobs(module_path)
+        except BaseException:
+            restore_module(module_path, removed)
+            raise
+        command_count = len(staged.commands)
+
+    cost = time.perf_counter() - start_time
+    Constants.log.info(f"[obot-core] 已重载模块 {module_path}，{command_count} 条指令，"
+                       f"{job_count} 个定时任务，耗时 {cost * 1000:.0f}ms")
+    return ReloadResult(module_path, command_count, job_count, cost)
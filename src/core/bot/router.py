@@ -0,0 +1,113 @@
+import inspect
+from dataclasses import dataclass
+from typing import Callable
+
+from src.core.bot.perm import PermissionLevel
+
+
+@dataclass(frozen=True)
+class RouteEntry:
+    """
+    路由表中的一条指令，预先计算好分发时需要的元数据
+    """
+    order: int  # 注册顺序，保证多条指令同时命中时与逐条遍历的结果一致
+    module: str
+    command: str  # __commands__ 中的原始键，通配指令带有 '*' 后缀
+    func: Callable
+    permission_level: PermissionLevel
+    is_command: bool
+    public_allowed: bool  # 频道/群聊无at消息只响应需要前置 '/' 的指令，避免spam
+    multi_thread: bool
+    is_async: bool  # 是否为 async def 指令
+    scope_types: frozenset | None
+    denied_reply: str | None
+    wildcard: bool
+    coalesce: bool | Callable  # 见 @command 的 coalesce 参数
+    light: bool  # 是否走快速通道
+    timeout: float | None  # 为 None 时使用默认截止时间
+    fast_path: Callable | None  # 见 @command 的 fast_path 参数
+
+    @property
+    def prefix(self) -> str:
+        return self.command[:-1] if self.wildcard else self.command
+
+
+class _TrieNode:
+    __slots__ = ("children", "entries")
+
+    def __init__(self):
+        self.children: dict[str, _TrieNode] = {}
+        self.entries: list[RouteEntry] = []
+
+
+class CommandRouter:
+    """
+    指令路由表，由精确匹配的哈希表和通配指令 (如 '/来只*') 的前缀树组成。
+    在模块注册完成后构建一次，避免每条消息都遍历所有指令
+    """
+
+    def __init__(self, commands: dict[str, dict[str, tuple]]):
+        self._exact: dict[str, list[RouteEntry]] = {}
+        self._trie = _TrieNode()
+        self._has_wildcard = False
+        self.size = 0
+
+        for module_name, module_commands in commands.items():
+            for cmd, (func, permission_level, is_command, multi_thread, scope,
+                      coalesce, cost, timeout, fast_path) in module_commands.items():
+                wildcard = cmd.endswith('*')
+                entry = RouteEntry(
+                    order=self.size,
+                    module=module_name,
+                    command=cmd,
+                    func=func,
+                    permission_level=permission_level,
+                    is_command=is_command,
+                    public_allowed=is_command,
+                    multi_thread=multi_thread,
+                    is_async=inspect.iscoroutinefunction(func),
+                    scope_types=scope.types if scope else None,
+                    denied_reply=scope.denied_reply if scope else None,
+                    wildcard=wildcard,
+                    coalesce=coalesce,
+                    light=cost == "light",
+                    timeout=timeout,
+                    fast_path=fast_path
+                )
+                self.size += 1
+
+                self._exact.setdefault(cmd, []).append(entry)
+                if wildcard:
+                    self._insert_wildcard(entry)
+
+    def _insert_wildcard(self, entry: RouteEntry):
+        node = self._trie
+        for ch in entry.prefix:
+            node = node.children.setdefault(ch, _TrieNode())
+        node.entries.append(entry)
+        self._has_wildcard = True
+
+    def match(self, func: str) -> list[RouteEntry]:
+        """
+        获取所有命中 func 的指令，按注册顺序排列，调用方依次检查对话场景等限制
+        """
+        exact = self._exact.get(func)
+        if not self._has_wildcard:
+            return list(exact) if exact else []
+
+        matched: list[RouteEntry] = []
+        node = self._trie
+        matched.extend(node.entries)
+        for ch in func:
+            node = node.children.get(ch)
+            if node is None:
+                break
+            matched.extend(node.entries)
+
+        if exact:
+            # 通配指令本身也可以被精确命中，去重后合并
+            matched.extend(entry for entry in exact if not entry.wildcard)
+
+        if len(matched) > 1:
+            matched.sort(key=lambda e: e.order)
+        return matched
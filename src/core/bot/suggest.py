@@ -0,0 +1,96 @@
+from collections import Counter
+
+from rapidfuzz import fuzz, process
+from thefuzz import utils
+
+from src.core.bot.perm import PermissionLevel
+
+# WRatio 四舍五入到整数后与 50 比较，对应的原始得分下界
+_MIN_RAW_SCORE = 49.5
+
+
+class _Candidate:
+    __slots__ = ("name", "processed", "multi_token")
+
+    def __init__(self, name: str):
+        self.name = name
+        # 与 process.extract 对候选项的预处理一致 (WRatio 会额外去除非 ascii 字符)
+        self.processed = utils.full_process(name, force_ascii=True)
+        self.multi_token = ' ' in self.processed
+
+
+class SuggestionIndex:
+    """
+    指令模糊匹配的预计算索引，在注册表变化后构建一次。
+    按权限等级预先划分候选指令，并以单字符倒排索引估计相似度上界，
+    只有可能达到阈值的候选才交给 thefuzz 计算得分，结果与逐条计算完全一致
+    """
+
+    def __init__(self, commands: dict[str, dict[str, tuple]]):
+        command_levels: dict[str, PermissionLevel] = {}
+        for module_commands in commands.values():
+            for cmd, (_, execute_level, *_) in module_commands.items():
+                if not cmd.startswith('/'):
+                    continue
+                name = cmd[:-1] if cmd.endswith('*') else cmd
+                if name not in command_levels:
+                    command_levels[name] = execute_level
+
+        self._levels: dict[PermissionLevel, list[_Candidate]] = {}
+        self._postings: dict[PermissionLevel, dict[str, list[tuple[int, int]]]] = {}
+        for permission_level in PermissionLevel:
+            candidates = [_Candidate(name) for name, level in command_levels.items()
+                          if level <= permission_level]
+            postings: dict[str, list[tuple[int, int]]] = {}
+            for idx, candidate in enumerate(candidates):
+                for ch, count in Counter(candidate.processed).items():
+                    postings.setdefault(ch, []).append((idx, count))
+            self._levels[permission_level] = candidates
+            self._postings[permission_level] = postings
+        self.size = len(command_levels)
+
+    def _prefilter(self, query: str, permission_level: PermissionLevel) -> list[_Candidate]:
+        candidates = self._levels[permission_level]
+        if ' ' in query:
+            # 多个单词时 token_set 等得分不受字符重合数约束，退回全量计算
+            return candidates
+
+        common: dict[int, int] = {}
+        for ch, count in Counter(query).items():
+            for idx, candidate_count in self._postings[permission_level].get(ch, ()):
+                common[idx] = common.get(idx, 0) + min(count, candidate_count)
+
+        # 单个单词时 WRatio 的各项得分都不超过 200c / (min_len + c)，c 为重合的字符数
+        matched: list[_Candidate] = []
+        for idx, candidate in enumerate(candidates):
+            if candidate.multi_token:
+                matched.append(candidate)
+                continue
+            overlap = common.get(idx, 0)
+            if overlap == 0:
+                continue
+            shortest = min(len(query), len(candidate.processed))
+            if 200 * overlap >= _MIN_RAW_SCORE * (shortest + overlap):
+                matched.append(candidate)
+        return matched
+
+    def find(self, input_cmd: str, limit: int, permission_level: PermissionLevel) -> list[str]:
+        # thefuzz 会对输入依次应用自身与 WRatio 的预处理
+        query = utils.full_process(utils.full_process(input_cmd), force_ascii=True)
+        if not query:
+            return []
+
+        # 直接用 thefuzz 底层的 rapidfuzz 对预处理好的候选打分，省去每次重复预处理。
+        # 过滤掉的候选得分一定低于 50，保持原有顺序即可保证同分时的排序不变
+        matched = self._prefilter(query, permission_level)
+        results = process.extract(query, [candidate.processed for candidate in matched],
+                                  scorer=fuzz.WRatio, processor=None, limit=limit)
+
+        suggestions: list[str] = []
+        for _, score, idx in results:
+            name = matched[idx].name
+            if int(round(score)) >= 50 and name not in suggestions:
+                suggestions.append(name)
+            if len(suggestions) >= limit:
+                break
+        return suggestions
@@ -1,37 +1,61 @@
+import asyncio
+import concurrent.futures
 import datetime
-import queue
+import inspect
 import threading
 import time
 from dataclasses import dataclass
-from typing import Callable
+from typing import Callable, Hashable
 
 from apscheduler.triggers.cron import CronTrigger
 
-from src.core.bot.decorator import __commands__, __scheduled_jobs__
+from src.core.bot.admission import AdmissionController, AdmissionRule, Verdict
+from src.core.bot.decorator import __commands__, __scheduled_jobs__, get_registry_revision, registry_lock
 from src.core.bot.interact import reply_key_words, no_reply, reply_command_not_found, reply_specified
-from src.core.bot.message import RobotMessage, MessageType
+from src.core.bot.message import RobotMessage, MessageType, wait_pending_sends
+from src.core.bot.router import CommandRouter
+from src.core.bot.usage import UsageLedger, SceneUsage
+from src.core.bot.worker_pool import KeyedWorkerPool, PoolStats, QueueFullError, PoolClosedError
 from src.core.constants import Constants
-from src.core.util.exception import UnauthorizedError
+from src.core.util.cancel import CancelToken, use_cancel_token, reset_cancel_token, get_cancel_token
+from src.core.util.exception import UnauthorizedError, OperationCancelledError
+from src.data.data_message_journal import save_journal, pop_journal
 
-_query_queue: dict[str, queue.Queue] = {}
-_count_queue: dict[str, queue.Queue] = {}
-_work_thread_life: dict[str, int] = {"default.manual": -1}
+_MAINTAINING_SIGNAL = False
 
-_terminate_lock = threading.Lock()
-_terminate_signal = False
+_draining = False  # 重启前停止接收消息，新消息直接写入日志
+_journal: list[dict] = []
+_journal_saved = False  # 日志写入后到达的消息需要追加写入
+_journal_lock = threading.Lock()
 
-_MAINTAINING_SIGNAL = False
+_router: CommandRouter | None = None
+_router_revision = -1
+_router_lock = threading.Lock()
+
+_async_tasks: set[asyncio.Task] = set()
+_async_futures: set = set()  # 从其他线程提交的 async 指令
+
+_scheduler_context: tuple | None = None  # (api, loop, scheduler)，on_ready 后可用，供热重载时重新注册定时任务
+
+_admission = AdmissionController()
+_usage = UsageLedger()
+
+_flights: dict[Hashable, "_Flight"] = {}
+_flights_lock = threading.Lock()
 
 
 @dataclass(frozen=True)
 class MessageID:
     """
-    消息的身份，包含所属模块，命令名，是否多线程，指定回复内容
+    消息的身份，包含所属模块，命令名，是否多线程，指定回复内容，是否为 async 指令，合并请求的键，是否为 light 指令
     """
     module: str
     command: str
     multi_thread: bool = False
     specified_reply: str | None = None
+    is_async: bool = False
+    coalesce_key: Hashable | None = None  # 不为 None 时，键相同的执行中请求会被合并
+    light: bool = False  # 是否走快速通道
 
     def __eq__(self, other):
         if not isinstance(other, MessageID):
@@ -42,6 +66,22 @@ class MessageID:
         return hash((self.module, self.command))
 
 
+def _get_router() -> CommandRouter:
+    """
+    获取指令路由表，指令注册表发生变化后自动重建
+    """
+    global _router, _router_revision
+    revision = get_registry_revision()
+    if _router is None or _router_revision != revision:
+        with _router_lock, registry_lock:
+            revision = get_registry_revision()
+            if _router is None or _router_revision != revision:
+                _router = CommandRouter(__commands__)
+                _router_revision = revision
+                Constants.log.info(f"[obot-core] 已构建指令路由表，共 {_router.size} 条指令")
+    return _router
+
+
 def get_message_id(message: RobotMessage) -> MessageID:
     """
     获取消息的身份
@@ -54,31 +94,24 @@ def get_message_id(message: RobotMessage) -> MessageID:
 
         denied_reply = None
         func = content[0].lower()
-        for module in __commands__:
-            module_commands = __commands__[module]
-            for cmd in module_commands:
-                starts_with = cmd[-1] == '*' and func.startswith(cmd[:-1])
-                if starts_with or cmd == func:
-                    original_command, _, is_command, multi_thread, scope = module_commands[cmd]
-
-                    if not is_command and (message.is_guild_public() or message.is_group_public()):
-                        # 对频道/群聊无at消息的过滤，避免spam
-                        continue
-
-                    if scope and message.message_type not in scope.types:
-                        # 指令限定了对话场景，记录失配回复后继续尝试下一条指令
-                        if denied_reply is None:
-                            denied_reply = scope.denied_reply
-                        continue
-
-                    if multi_thread:
-                        # 多线程时，同一上下文一个线程
-                        worker_id = f"{module}_{message.uuid}"
-                        _work_thread_life[worker_id] = 60 * 60  # 一小时生命周期
-                        return MessageID(module, cmd, True)
-
-                    _work_thread_life[module] = -1
-                    return MessageID(module, cmd)
+        is_public = message.is_guild_public() or message.is_group_public()
+        for entry in _get_router().match(func):
+            if not entry.public_allowed and is_public:
+                # 对频道/群聊无at消息的过滤，避免spam
+                continue
+
+            if entry.scope_types is not None and message.message_type not in entry.scope_types:
+                # 指令限定了对话场景，记录失配回复后继续尝试下一条指令
+                if denied_reply is None:
+                    denied_reply = entry.denied_reply
+                continue
+
+            is_async = entry.is_async or (entry.fast_path is not None and entry.fast_path(message) is not None)
+            return MessageID(entry.module, entry.command, entry.multi_thread,  # 多线程时，同一上下文串行处理
+                             is_async=is_async,
+                             coalesce_key=_make_coalesce_key(message, entry.module, entry.command,
+                                                             entry.coalesce),
+                             light=entry.light)
 
         # 命中了受限指令但场景失配，按自定义内容回复而不是静默忽略
         if denied_reply is not None:
@@ -99,6 +132,103 @@ def get_message_id(message: RobotMessage) -> MessageID:
         return MessageID("default.manual", "no_reply")
 
 
+class _Flight:
+    """
+    一个执行中的可合并请求，记录其发出的回复并转发给后到的相同请求
+    """
+
+    def __init__(self, leader: RobotMessage):
+        self.leader = leader
+        self.followers: list[RobotMessage] = []
+        self.history: list[tuple[str, dict]] = []
+        self.lock = threading.Lock()
+
+    def record(self, method: str, kwargs: dict):
+        with self.lock:
+            self.history.append((method, kwargs))
+            followers = list(self.followers)
+        for follower in followers:
+            getattr(follower, method)(**kwargs)
+
+    def join(self, follower: RobotMessage):
+        with self.lock:
+            self.followers.append(follower)
+            history = list(self.history)
+        for method, kwargs in history:  # 补发加入前已产生的回复
+            getattr(follower, method)(**kwargs)
+
+
+def _make_coalesce_key(message: RobotMessage, module: str, command: str,
+                       coalesce: bool | Callable) -> Hashable | None:
+    if not coalesce:
+        return None
+    # 权限不足等检查结果因人而异，权限等级不同的请求不合并，避免将拒绝的回复转发给有权限的用户
+    level = message.user_permission_level
+    if callable(coalesce):
+        key = coalesce(message)
+        return None if key is None else (module, command, level, key)
+    # 对话场景也会影响检查结果 (如部分场景禁用了模块)，默认只合并同一场景内的请求
+    return module, command, level, message.uuid, message.tokens[0].lower(), tuple(message.tokens[1:])
+
+
+def _try_join_flight(message: RobotMessage, message_id: MessageID) -> bool:
+    """
+    若已有相同的请求在执行，则加入其中复用回复，否则将当前消息登记为执行者。
+    返回是否已加入其他请求
+    """
+    with _flights_lock:
+        flight = _flights.get(message_id.coalesce_key)
+        if flight is None:
+            flight = _Flight(message)
+            _flights[message_id.coalesce_key] = flight
+            message.add_reply_listener(flight.record)
+            return False
+
+    try:
+        # 合并的请求不经过工作线程，需要在此单独完成检查
+        if Constants.inst_paused:
+            Constants.log.warning(f"[obot-core] 实例被暂停，弃置消息")
+            return True
+        with registry_lock:
+            execute_level = __commands__[message_id.module][message_id.command][1]
+        _check_permission(execute_level, message.tokens[0].lower(), message, message_id)
+    except Exception as e:
+        message.report_exception('Core.Transit', e)
+        return True
+
+    Constants.log.info(f"[obot-core] 合并执行中的请求 {message_id.command}: {message_id.coalesce_key}")
+    flight.join(message)
+    return True
+
+
+def _finish_flight(message: RobotMessage, message_id: MessageID):
+    if message_id.coalesce_key is None:
+        return
+    with _flights_lock:
+        flight = _flights.get(message_id.coalesce_key)
+        if flight is not None and flight.leader is message:
+            del _flights[message_id.coalesce_key]
+
+
+def _get_admission_rule(message: RobotMessage, message_id: MessageID) -> AdmissionRule | None:
+    """获取消息适用的准入规则，内置回复与管理员的消息不受限制"""
+    if message_id.module == "default.manual" or message.user_permission_level.is_admin():
+        return None
+    admission_conf = Constants.modules_conf.transit.get("admission", {})
+    return _admission.resolve(admission_conf, message_id.module, message_id.command)
+
+
+def _check_rate_limit(message: RobotMessage, rule: AdmissionRule) -> bool:
+    verdict, notify = _admission.acquire(rule, message.uuid, message.author_id)
+    if verdict == Verdict.ACCEPT:
+        return True
+
+    Constants.log.info(f"[obot-core] 请求被限流: {message.uuid} {message.author_id} -> {rule.name}")
+    if notify:
+        message.reply("你发送得太频繁了，休息一下再试试吧")
+    return False
+
+
 def dispatch_message(message: RobotMessage):
     """
     分发消息
@@ -109,26 +239,158 @@ def dispatch_message(message: RobotMessage):
                       f"{datetime.datetime.now()}\n", modal_words=False)
         return
 
+    if _draining:
+        _journal_message(message)
+        return
+
     message_id = get_message_id(message)
+    rule = _get_admission_rule(message, message_id)
+    if rule is not None and not _check_rate_limit(message, rule):
+        return
+
+    if message_id.coalesce_key is not None and _try_join_flight(message, message_id):
+        return
+
+    if message_id.is_async:
+        _dispatch_async(message, message_id)
+        return
+
     worker_id = message_id.module
     if message_id.multi_thread:
         worker_id = f"{message_id.module}_{message.uuid}"
 
-    if (worker_id not in _count_queue
-            or worker_id not in _query_queue):
-        _count_queue[worker_id] = queue.Queue()
-        _query_queue[worker_id] = queue.Queue()
+    def _notify_queued(ahead: int):
+        if ahead > 0:
+            # 位次只对执行者成立，不转发给合并的请求
+            message.reply(f"已加入处理队列，当前对话前方还有 {ahead} 个请求", forward=False)
+
+    # light 指令使用独立的线程池，不与 heavy 指令竞争工作线程与队列
+    pool = _light_pool if message_id.light else _worker_pool
+    try:
+        pool.submit(worker_id, (message, message_id), on_queued=_notify_queued,
+                    limit=rule.queue_cap if rule is not None else None, flow=message.uuid)
+    except QueueFullError:
+        _admission.record_shed(rule)
+        Constants.log.info(f"[obot-core] 队列 {worker_id} 已满，弃置消息")
+        # 先撤下执行者，之后不会再有请求加入，已加入的请求经由回复监听收到同样的提示
+        _finish_flight(message, message_id)
+        message.reply("O宝正忙不过来，请稍后再试")
+    except PoolClosedError:
+        # 与重启前的排空并发，连同已合并的请求一并写入日志，由新进程重放
+        Constants.log.warning(f"[obot-core] 消息队列已关闭，写入消息日志")
+        followers = _pop_drained_followers(message, message_id)
+        for queued_message in [message] + followers:
+            _journal_message(queued_message)
+
+
+def _prepare_command(message: RobotMessage, message_id: MessageID) -> Callable | None:
+    """
+    完成指令执行前的准备工作，返回需要执行的指令方法，已被内置处理的消息返回 None
+    """
+    if Constants.inst_paused and message_id != MessageID("robot", "/resume_inst"):
+        Constants.log.warning(f"[obot-core] 实例被暂停，弃置消息")
+        return None
+
+    fixed_handlers = {
+        None: (no_reply, {}),
+        MessageID("default.manual", "no_reply"): (no_reply, {}),
+        MessageID("default.manual", "reply_specified"): (
+            reply_specified,
+            {"message": message, "content": message_id.specified_reply}
+        ),
+        MessageID("default.manual", "reply_not_implemented"): (
+            reply_command_not_found,
+            {"message": message, "content": message.tokens[0].lower()}
+        ),
+        MessageID("default.manual", "reply_key_words_empty"): (
+            reply_key_words,
+            {"message": message, "content": ""}
+        ),
+        MessageID("default.manual", "reply_key_words_func"): (
+            reply_key_words,
+            {"message": message, "content": "" if len(message.tokens) == 0 else message.tokens[0].lower()}
+        ),
+    }
+
+    if message_id in fixed_handlers:
+        handler_func, handler_kwargs = fixed_handlers[message_id]
+        handler_func(**handler_kwargs)
+        return None
+
+    func = message.tokens[0].lower()
+
+    with registry_lock:  # 热重载期间等待新版本注册完成
+        (original_command, execute_level, *_, fast_path) = __commands__[message_id.module][message_id.command]
+
+    _check_permission(execute_level, func, message, message_id)
+
+    starts_with = message_id.command[-1] == '*' and func.startswith(message_id.command[:-1])
+    if starts_with:
+        name = message_id.command[:-1]
+        replaced = func.replace(name, '')
+        message.tokens = [name] + ([replaced] if replaced else []) + message.tokens[1:]
+
+    if message_id.is_async and fast_path is not None:
+        original_command = fast_path(message) or original_command
+    return original_command
+
+
+def _get_command_timeout(message_id: MessageID) -> float | None:
+    """获取指令的截止时间，不限制时返回 None"""
+    with registry_lock:
+        timeout = __commands__[message_id.module][message_id.command][7]
+    if timeout is None:
+        timeout = Constants.modules_conf.transit.get("command_timeout", 120)
+    return timeout if timeout and timeout > 0 else None
+
+
+def _reply_timeout(message: RobotMessage, message_id: MessageID, timeout: float):
+    Constants.log.warning(f"[obot-core] 指令 {message_id.command} 超过 {timeout}s 未完成，已取消")
+    message.reply("处理超时了，可能是上游服务不稳定，请稍后再试")
+
+
+def _run_command(message: RobotMessage, message_id: MessageID, original_command: Callable,
+                 token: CancelToken):
+    reset_token = use_cancel_token(token)
+    start_time, start_cpu = time.monotonic(), time.thread_time()
+    try:
+        original_command(message)
+    except OperationCancelledError:
+        Constants.log.info(f"[obot-core] 指令 {message_id.command} 已响应取消")
+    except Exception as e:
+        if not token.cancelled:
+            message.report_exception(f'{message_id.module}.{message_id.command}', e)
+    finally:
+        reset_cancel_token(reset_token)
+        message.discard_progress()  # 指令没有发出回复就结束时，不再补发进度提示
+        _usage.record(message.uuid, time.monotonic() - start_time, time.thread_time() - start_cpu)
+
+
+def _run_command_with_deadline(message: RobotMessage, message_id: MessageID,
+                               original_command: Callable, timeout: float | None):
+    """
+    在执行线程池中运行指令，当前工作线程等待其返回，以保证同一模块的请求串行处理。
+    到达截止时间后回复用户并取消令牌，指令在 transit.cancel_grace 秒内仍未响应取消时 (如阻塞在没有超时的调用中)，
+    放弃等待并释放工作线程，指令继续占用执行线程池中的一个线程直到返回
+    """
+    token = CancelToken(timeout)
+    if timeout is None:
+        _run_command(message, message_id, original_command, token)
+        return
 
-        # 启动对应工作线程
-        threading.Thread(target=queue_up_handler,
-                         args=[worker_id],
-                         name=f"Work Thread ({worker_id})").start()
+    future = _runner_executor.submit(_run_command, message, message_id, original_command, token)
+    try:
+        future.result(timeout=timeout)
+        return
+    except concurrent.futures.TimeoutError:
+        pass
 
-    _count_queue[worker_id].put(1)
-    size = _count_queue[worker_id].qsize()
-    if size > 1:
-        message.reply(f"已加入处理队列，前方还有 {size - 1} 个请求")
-    _query_queue[worker_id].put((message, message_id))
+    _reply_timeout(message, message_id, timeout)
+    token.cancel()
+    grace = Constants.modules_conf.transit.get("cancel_grace", 5)
+    if not concurrent.futures.wait([future], timeout=grace).done:
+        future.cancel()  # 尚在执行线程池中排队时不再执行
+        Constants.log.warning(f"[obot-core] 指令 {message_id.command} 未响应取消，释放工作线程")
 
 
 def handle_message(message: RobotMessage, message_id: MessageID):
@@ -136,54 +398,71 @@ def handle_message(message: RobotMessage, message_id: MessageID):
     处理消息
     """
     try:
-        if Constants.inst_paused and message_id != MessageID("robot", "/resume_inst"):
-            Constants.log.warning(f"[obot-core] 实例被暂停，弃置消息")
+        original_command = _prepare_command(message, message_id)
+        if original_command is None:
             return
 
-        fixed_handlers = {
-            None: (no_reply, {}),
-            MessageID("default.manual", "no_reply"): (no_reply, {}),
-            MessageID("default.manual", "reply_specified"): (
-                reply_specified,
-                {"message": message, "content": message_id.specified_reply}
-            ),
-            MessageID("default.manual", "reply_not_implemented"): (
-                reply_command_not_found,
-                {"message": message, "content": message.tokens[0].lower()}
-            ),
-            MessageID("default.manual", "reply_key_words_empty"): (
-                reply_key_words,
-                {"message": message, "content": ""}
-            ),
-            MessageID("default.manual", "reply_key_words_func"): (
-                reply_key_words,
-                {"message": message, "content": "" if len(message.tokens) == 0 else message.tokens[0].lower()}
-            ),
-        }
-
-        if message_id in fixed_handlers:
-            handler_func, handler_kwargs = fixed_handlers[message_id]
-            handler_func(**handler_kwargs)
-            return
+        _run_command_with_deadline(message, message_id, original_command,
+                                   _get_command_timeout(message_id))
 
-        func = message.tokens[0].lower()
+    except Exception as e:
+        message.report_exception('Core.Transit', e)
+    finally:
+        _finish_flight(message, message_id)
 
-        (original_command, execute_level, _, _, _) = __commands__[message_id.module][message_id.command]
 
-        _check_permission(execute_level, func, message, message_id)
+async def handle_message_async(message: RobotMessage, message_id: MessageID):
+    """
+    在事件循环上处理 async 指令的消息
+    """
+    try:
+        original_command = _prepare_command(message, message_id)
+        if original_command is None:
+            return
 
+        timeout = _get_command_timeout(message_id)
+        token = CancelToken(timeout)
+        reset_token = use_cancel_token(token)  # 由 asyncio.to_thread 启动的线程也会继承
+        start_time = time.monotonic()
         try:
-            starts_with = message_id.command[-1] == '*' and func.startswith(message_id.command[:-1])
-            if starts_with:
-                name = message_id.command[:-1]
-                replaced = func.replace(name, '')
-                message.tokens = [name] + ([replaced] if replaced else []) + message.tokens[1:]
-            original_command(message)
+            await asyncio.wait_for(original_command(message), timeout)
+        except OperationCancelledError:
+            Constants.log.info(f"[obot-core] 指令 {message_id.command} 已响应取消")
+        except asyncio.TimeoutError as e:
+            if not token.cancelled:  # 指令内部自身的超时
+                message.report_exception(f'{message_id.module}.{message_id.command}', e)
+                return
+            token.cancel()
+            _reply_timeout(message, message_id, timeout)
         except Exception as e:
             message.report_exception(f'{message_id.module}.{message_id.command}', e)
+        finally:
+            reset_cancel_token(reset_token)
+            message.discard_progress()
+            _usage.record(message.uuid, time.monotonic() - start_time)
 
     except Exception as e:
         message.report_exception('Core.Transit', e)
+    finally:
+        _finish_flight(message, message_id)
+
+
+def _dispatch_async(message: RobotMessage, message_id: MessageID):
+    """async 指令不进入工作线程池，直接作为任务运行在消息所属的事件循环上"""
+    coro = handle_message_async(message, message_id)
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
+
+    if running_loop is message.loop:
+        task = message.loop.create_task(coro)
+        _async_tasks.add(task)  # 保留引用，避免任务在完成前被回收
+        task.add_done_callback(_async_tasks.discard)
+    else:
+        future = asyncio.run_coroutine_threadsafe(coro, message.loop)
+        _async_futures.add(future)
+        future.add_done_callback(_async_futures.discard)
 
 
 def _check_permission(execute_level, func, message, message_id):
@@ -207,29 +486,124 @@ def _check_permission(execute_level, func, message, message_id):
         raise UnauthorizedError(game_conf['exclude'][message.uuid])
 
 
-def clear_message_queue():
-    Constants.log.info("[obot-core] 正在清空消息队列")
-    global _terminate_signal
-    with _terminate_lock:
-        _terminate_signal = True
-    for module, module_query_queue in _query_queue.items():
-        while not module_query_queue.empty():
-            try:
-                queued_message: tuple[RobotMessage, MessageID] = module_query_queue.get_nowait()
-                message, message_id = queued_message
-                message.reply("O宝被爆了！等待一段时间后再试试")
-            except queue.Empty:
-                break
+def _journal_message(message: RobotMessage):
+    if message.is_active():
+        return
+    with _journal_lock:
+        _journal.append(message.to_journal())
+        if _journal_saved:
+            save_journal(_journal)
+
+
+def _pop_drained_followers(message: RobotMessage, message_id: MessageID) -> list[RobotMessage]:
+    """取出已被弃置的执行者所合并的请求，它们需要一并写入日志"""
+    if message_id.coalesce_key is None:
+        return []
+    with _flights_lock:
+        flight = _flights.get(message_id.coalesce_key)
+        if flight is None or flight.leader is not message:
+            return []
+        del _flights[message_id.coalesce_key]
+    with flight.lock:
+        return list(flight.followers)
+
+
+def drain_for_restart(timeout: float) -> int:
+    """
+    重启前的排空流程：停止接收消息，取出尚未开始处理的消息，
+    在 timeout 秒内等待处理中的指令与已提交的回复完成，最后将未处理的消息写入日志，
+    由新进程在 on_ready 后重放
+
+    :return: 写入日志的消息数量
+    """
+    global _draining, _journal_saved
+    _draining = True
+    deadline = time.monotonic() + timeout
+    Constants.log.info("[obot-core] 正在排空消息队列")
+
+    for message, message_id in _worker_pool.drain() + _light_pool.drain():
+        _journal_message(message)
+        for follower in _pop_drained_followers(message, message_id):
+            _journal_message(follower)
+
+    # 在指令中发起重启时，自身也占用一个工作线程
+    allowance = 1 if get_cancel_token() is not None else 0
+    while time.monotonic() < deadline:
+        busy = _worker_pool.stats().busy_workers + _light_pool.stats().busy_workers
+        if busy <= allowance and not _async_tasks and not _async_futures:
+            break
+        time.sleep(0.05)
+    else:
+        Constants.log.warning("[obot-core] 等待处理中的指令超时")
+
+    unsent = wait_pending_sends(deadline - time.monotonic())
+    if unsent > 0:
+        Constants.log.warning(f"[obot-core] 仍有 {unsent} 条回复未发送完成")
+
+    with _journal_lock:
+        entries = list(_journal)
+        save_journal(entries)
+        _journal_saved = True
+    Constants.log.info(f"[obot-core] 已将 {len(entries)} 条未处理的消息写入日志")
+    return len(entries)
+
+
+def replay_message_journal(api, loop) -> int:
+    """
+    重放上一个进程在重启前写入日志的消息。
+    应在 MyClient.on_ready() 中调用
+
+    :return: 重放的消息数量
+    """
+    try:
+        entries = pop_journal()
+    except Exception as e:
+        Constants.log.warning("[obot-core] 读取消息日志失败")
+        Constants.log.exception(f"[obot-core] {e}")
+        return 0
+
+    for entry in entries:
+        try:
+            dispatch_message(RobotMessage.from_journal(api, loop, entry))
+        except Exception as e:
+            Constants.log.warning("[obot-core] 重放消息失败")
+            Constants.log.exception(f"[obot-core] {e}")
+
+    if entries:
+        Constants.log.info(f"[obot-core] 已重放 {len(entries)} 条重启前未处理的消息")
+    return len(entries)
+
+
+def get_worker_pool_stats(light: bool = False) -> PoolStats:
+    """获取工作线程池的队列状态，light 为真时获取快速通道的线程池"""
+    return (_light_pool if light else _worker_pool).stats()
+
+
+def get_scene_usage() -> list[SceneUsage]:
+    """获取最近一小时内各对话场景消耗的处理时间"""
+    return _usage.summary()
+
+
+def get_admission_counters() -> dict[str, dict[str, int]]:
+    """获取各规则范围被限流与被丢弃的请求数"""
+    return _admission.counters()
 
 
 def _make_scheduled_wrapper(func: Callable, message_type: MessageType | None,
                             target: str | None, api, loop):
     """为定时任务创建闭包，message_type 为 None 时作为纯定时任务（无 message 参数）"""
 
+    def call_job(*args):
+        if inspect.iscoroutinefunction(func):
+            # async 定时任务交给事件循环执行，调度线程等待其完成
+            asyncio.run_coroutine_threadsafe(func(*args), loop).result()
+        else:
+            func(*args)
+
     if message_type is None:
         def wrapper():
             try:
-                func()
+                call_job()
             except Exception as e:
                 Constants.log.warning(f"[obot-sched] 定时任务 {func.__name__} 执行失败")
                 Constants.log.exception(f"[obot-sched] {e}")
@@ -246,7 +620,7 @@ def _make_scheduled_wrapper(func: Callable, message_type: MessageType | None,
         packed_message = RobotMessage(api)
         setup_map[message_type](packed_message)
         try:
-            func(packed_message)
+            call_job(packed_message)
         except Exception as e:
             Constants.log.warning(f"[obot-sched] 定时任务 {func.__name__} 执行失败")
             Constants.log.exception(f"[obot-sched] {e}")
@@ -265,52 +639,62 @@ def activate_scheduled_jobs(api, loop, scheduler) -> int:
         :return: 添加的 job 数量
     """
 
+    global _scheduler_context
+    _scheduler_context = (api, loop, scheduler)
+
     count = 0
     for module_name, jobs in __scheduled_jobs__.items():
-        for job in jobs:
-            wrapper = _make_scheduled_wrapper(
-                job.func, job.message_type, job.target, api, loop)
-            trigger = CronTrigger.from_crontab(job.cron)
-            job_id = f"sched.{module_name}.{job.func.__name__}.{job.target or 'task'}"
-            scheduler.add_job(wrapper, trigger=trigger, id=job_id,
-                              replace_existing=True)
-            count += 1
+        count += _add_scheduled_jobs(module_name, jobs, api, loop, scheduler)
 
     if count > 0:
         Constants.log.info(f"[obot-core] 已激活 {count} 个定时任务")
     return count
 
 
-def queue_up_handler(worker_id: str):
-    Constants.log.info(f"[obot-core] 工作线程 {worker_id} 启动.")
+def _add_scheduled_jobs(module_name: str, jobs: list, api, loop, scheduler) -> int:
+    for job in jobs:
+        wrapper = _make_scheduled_wrapper(
+            job.func, job.message_type, job.target, api, loop)
+        trigger = CronTrigger.from_crontab(job.cron)
+        job_id = f"sched.{module_name}.{job.func.__name__}.{job.target or 'task'}"
+        scheduler.add_job(wrapper, trigger=trigger, id=job_id,
+                          replace_existing=True)
+    return len(jobs)
 
-    life = _work_thread_life[worker_id]
-    terminate_time = time.time() + life if life >= 0 else -1
 
-    global _terminate_signal
+def reactivate_scheduled_jobs(module_name: str) -> int:
+    """
+    热重载模块后，移除该模块原有的定时任务并按新的注册内容重新添加。
+    Bot 尚未就绪时不做处理，由 on_ready 中的 activate_scheduled_jobs 统一激活
 
-    while True:
-        if terminate_time != -1 and time.time() >= terminate_time:
-            # 生命周期时间到的自动退出
-            break
+    :return: 重新添加的 job 数量
+    """
+    if _scheduler_context is None:
+        return 0
 
-        with _terminate_lock:
-            is_terminate = _terminate_signal
-        if is_terminate:
-            # 机器人重启时的强制退出
-            break
+    api, loop, scheduler = _scheduler_context
+    job_prefix = f"sched.{module_name}."
+    for job in scheduler.get_jobs():
+        if job.id.startswith(job_prefix):
+            scheduler.remove_job(job.id)
+    return _add_scheduled_jobs(module_name, __scheduled_jobs__.get(module_name, []), api, loop, scheduler)
 
-        try:
-            queued_message: tuple[RobotMessage, MessageID] = (
-                _query_queue[worker_id].get(timeout=1)  # 这里需要timeout，不然会一直阻塞
-            )
-            message, message_id = queued_message
-
-            handle_message(message, message_id)
-            _count_queue[worker_id].get()
-        except queue.Empty:
-            Constants.log.debug(f"[obot-core] 工作线程 {worker_id} 内无消息.")
-
-    del _count_queue[worker_id]
-    del _query_queue[worker_id]
-    Constants.log.info(f"[obot-core] 工作线程 {worker_id} 退出.")
+
+def _handle_queued_message(queued_message: tuple[RobotMessage, MessageID]):
+    message, message_id = queued_message
+    handle_message(message, message_id)
+
+
+def _get_scene_weight(scene: str) -> float:
+    return Constants.modules_conf.transit.get("scene_weights", {}).get(scene, 1)
+
+
+# 指令实际运行的线程，数量有上限，未响应取消的指令被放弃后仍占用其中一个线程
+_runner_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=Constants.modules_conf.transit.get("runner_workers", 32), thread_name_prefix="Command Runner")
+_worker_pool = KeyedWorkerPool(_handle_queued_message,
+                               max_workers=Constants.modules_conf.transit.get("max_workers", 16),
+                               weight_of=_get_scene_weight)
+_light_pool = KeyedWorkerPool(_handle_queued_message,
+                              max_workers=Constants.modules_conf.transit.get("light_workers", 2),
+                              name="Light Thread", weight_of=_get_scene_weight)
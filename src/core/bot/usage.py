@@ -0,0 +1,58 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class SceneUsage:
+    """对话场景在统计窗口内消耗的处理时间"""
+    scene: str
+    wall_time: float  # 秒
+    cpu_time: float  # 秒，async 指令运行在事件循环上，不计入
+    count: int
+
+
+class UsageLedger:
+    """
+    按对话场景记录指令消耗的时间，以分钟为粒度保留最近一段时间的数据
+    """
+
+    def __init__(self, window: int = 3600):
+        self._window = window
+        self._lock = threading.Lock()
+        self._buckets: dict[str, deque[list]] = {}  # scene -> [[分钟, wall, cpu, count], ...]
+
+    def record(self, scene: str, wall_time: float, cpu_time: float = 0.0):
+        minute = int(time.time() // 60)
+        with self._lock:
+            buckets = self._buckets.setdefault(scene, deque())
+            if buckets and buckets[-1][0] == minute:
+                buckets[-1][1] += wall_time
+                buckets[-1][2] += cpu_time
+                buckets[-1][3] += 1
+            else:
+                buckets.append([minute, wall_time, cpu_time, 1])
+            self._expire(buckets, minute)
+
+    def _expire(self, buckets: deque, minute: int):
+        while buckets and buckets[0][0] <= minute - self._window // 60:
+            buckets.popleft()
+
+    def summary(self) -> list[SceneUsage]:
+        """获取统计窗口内各场景的消耗，按耗时降序排列"""
+        minute = int(time.time() // 60)
+        usages = []
+        with self._lock:
+            for scene in list(self._buckets):
+                buckets = self._buckets[scene]
+                self._expire(buckets, minute)
+                if not buckets:
+                    del self._buckets[scene]
+                    continue
+                usages.append(SceneUsage(scene,
+                                         sum(bucket[1] for bucket in buckets),
+                                         sum(bucket[2] for bucket in buckets),
+                                         sum(bucket[3] for bucket in buckets)))
+        usages.sort(key=lambda usage: -usage.wall_time)
+        return usages
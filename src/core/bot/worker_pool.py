@@ -0,0 +1,273 @@
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from src.core.constants import Constants
+
+
+class QueueFullError(Exception):
+    """key 对应的逻辑队列已达到上限"""
+    pass
+
+
+class PoolClosedError(Exception):
+    """线程池已停止接收请求"""
+    pass
+
+
+@dataclass
+class _KeyState:
+    pending: int = 0
+    running: bool = False
+    running_flow: str | None = None  # 正在处理的请求所属的 flow
+
+
+@dataclass
+class _FlowState:
+    pending: deque = field(default_factory=deque)  # (key, item, 入队时间)
+    deficit: float = 0.0  # 剩余可用的服务时间，秒
+    running: int = 0
+    avg_cost: float = 0.0  # 单个请求耗时的滑动平均，用于在执行前预扣，新的 flow 以全局的平均值起步
+
+
+@dataclass(frozen=True)
+class PoolStats:
+    """工作线程池的运行状态"""
+    workers: int
+    busy_workers: int
+    active_keys: int
+    queued: int
+    key_depths: dict[str, int]  # worker_id -> 排队数 (含正在处理的请求)
+    flow_depths: dict[str, int]  # 公平调度的单位 (对话场景) -> 排队数，不含正在处理的请求
+    avg_wait: float  # 最近若干请求的平均排队耗时，秒
+    max_wait: float
+    processed: int
+
+
+class KeyedWorkerPool:
+    """
+    固定大小的工作线程池，按 key 串行：同一个 key 同时只处理一个请求，空闲时线程阻塞等待而不是轮询。
+    请求另按 flow (如对话场景) 分组，不同 flow 之间按差额轮询 (DRR) 分配工作线程的服务时间，
+    同一 flow 内同一 key 的请求先进先出
+    """
+
+    def __init__(self, handler: Callable[[Any], None], max_workers: int,
+                 name: str = "Work Thread", quantum: float = 0.5,
+                 weight_of: Callable[[str], float] | None = None):
+        """
+        :param quantum: 权重为 1 的 flow 每轮获得的服务时间，秒
+        :param weight_of: 获取 flow 的权重，默认均为 1
+        """
+        self._handler = handler
+        self._max_workers = max(1, max_workers)
+        self._name = name
+        self._quantum = quantum
+        self._weight_of = weight_of
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._keys: dict[str, _KeyState] = {}
+        self._flows: dict[str, _FlowState] = {}
+        self._active: deque[str] = deque()  # 有待处理请求的 flow，按轮询顺序排列
+        self._threads: list[threading.Thread] = []
+        self._busy = 0
+        self._processed = 0
+        self._recent_waits: deque[float] = deque(maxlen=256)
+        self._avg_cost = quantum  # 所有请求耗时的滑动平均，尚无记录时按一个 quantum 估计
+        self._terminated = False
+
+    def submit(self, key: str, item: Any,
+               on_queued: Callable[[int], None] | None = None, limit: int | None = None,
+               flow: str = "") -> int:
+        """
+        向 key 对应的逻辑队列提交一个请求
+
+        :param key: 串行化的单位，如 worker_id
+        :param item: 交给 handler 的请求
+        :param on_queued: 请求入队后在锁外调用，参数为同一 flow 内前方的请求数 (含正在处理的请求)，
+                          抛出的异常只记录日志。不同 flow 的请求按 DRR 交替处理，无法预知确切的位次
+        :param limit: key 对应的逻辑队列中 (不区分 flow) 的请求数达到该值时拒绝入队并抛出 QueueFullError
+        :param flow: 公平调度的单位，如对话场景的 uuid
+        :return: 同一 flow 内前方的请求数
+        """
+        with self._cond:
+            if self._terminated:
+                raise PoolClosedError("Worker pool has been terminated")
+
+            state = self._keys.get(key)
+            depth = 0 if state is None else state.pending + (1 if state.running else 0)
+            if limit is not None and depth >= limit:
+                raise QueueFullError(f"Queue {key} is full")
+            if state is None:
+                state = self._keys[key] = _KeyState()
+
+            flow_state = self._flows.get(flow)
+            if flow_state is None:
+                flow_state = self._flows[flow] = _FlowState(avg_cost=self._avg_cost)
+            ahead = sum(1 for pending_key, _, _ in flow_state.pending if pending_key == key)
+            if state.running and state.running_flow == flow:
+                ahead += 1
+            if not flow_state.pending:
+                self._active.append(flow)
+            flow_state.pending.append((key, item, time.monotonic()))
+            state.pending += 1
+
+            if not state.running:
+                self._cond.notify()
+            self._ensure_workers()
+
+        if on_queued is not None:  # 如回复用户，较慢时不应阻塞其他请求的提交
+            try:
+                on_queued(ahead)
+            except Exception as e:
+                Constants.log.warning(f"[obot-core] 队列 {key} 的入队回调出现异常")
+                Constants.log.exception(f"[obot-core] {e}")
+        return ahead
+
+    def _ensure_workers(self):
+        # 按需扩容到 max_workers，调用方需持有锁
+        idle = len(self._threads) - self._busy
+        runnable = sum(1 for state in self._keys.values() if state.pending and not state.running)
+        if idle < runnable and len(self._threads) < self._max_workers:
+            thread = threading.Thread(target=self._work_loop,
+                                      name=f"{self._name} #{len(self._threads)}",
+                                      daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _weight(self, flow: str) -> float:
+        if self._weight_of is None:
+            return 1.0
+        try:
+            return max(0.01, float(self._weight_of(flow)))
+        except Exception:
+            return 1.0
+
+    def _find_runnable(self, flow_state: _FlowState) -> int | None:
+        for idx, (key, _, _) in enumerate(flow_state.pending):
+            if not self._keys[key].running:
+                return idx
+        return None
+
+    def _pick(self) -> tuple[str, str, Any, float, float] | None:
+        """
+        按 DRR 选出下一个请求，调用方需持有锁。
+        轮到的 flow 有剩余额度时连续服务，否则移到队尾；
+        所有可执行的 flow 都没有额度时，直接补足它们所需的轮数，而不是逐轮空转
+        """
+        for _ in range(2):
+            runnable: list[str] = []
+            for _ in range(len(self._active)):
+                flow = self._active[0]
+                flow_state = self._flows[flow]
+                idx = self._find_runnable(flow_state)
+                if idx is not None:
+                    if flow_state.deficit > 0:
+                        key, item, enqueue_time = flow_state.pending[idx]
+                        del flow_state.pending[idx]
+                        if not flow_state.pending:
+                            self._active.popleft()
+                        charged = flow_state.avg_cost  # 预扣，执行完后按实际耗时修正
+                        flow_state.deficit -= charged
+                        flow_state.running += 1
+                        return flow, key, item, enqueue_time, charged
+                    runnable.append(flow)
+                self._active.rotate(-1)
+
+            if not runnable:
+                return None
+
+            rounds = min(math.ceil((1e-6 - self._flows[flow].deficit) / (self._quantum * self._weight(flow)))
+                         for flow in runnable)
+            for flow in runnable:
+                quantum = self._quantum * self._weight(flow)
+                flow_state = self._flows[flow]
+                flow_state.deficit = min(flow_state.deficit + rounds * quantum, quantum)
+        return None
+
+    def _work_loop(self):
+        Constants.log.info(f"[obot-core] 工作线程 {threading.current_thread().name} 启动.")
+        while True:
+            with self._cond:
+                picked = None
+                while not self._terminated:
+                    picked = self._pick()
+                    if picked is not None:
+                        break
+                    self._cond.wait()
+                if self._terminated:
+                    break
+
+                flow, key, item, enqueue_time, charged = picked
+                state = self._keys[key]
+                state.pending -= 1
+                state.running = True
+                state.running_flow = flow
+                self._busy += 1
+                self._recent_waits.append(time.monotonic() - enqueue_time)
+                if self._active:
+                    self._cond.notify()  # 可能还有其他可执行的请求，唤醒下一个空闲线程
+
+            start_time = time.monotonic()
+            try:
+                self._handler(item)
+            except Exception as e:
+                Constants.log.warning(f"[obot-core] 工作线程处理 {key} 时出现异常")
+                Constants.log.exception(f"[obot-core] {e}")
+            cost = time.monotonic() - start_time
+
+            with self._cond:
+                state.running = False
+                state.running_flow = None
+                self._busy -= 1
+                self._processed += 1
+                if not state.pending:
+                    del self._keys[key]
+
+                flow_state = self._flows[flow]
+                flow_state.running -= 1
+                flow_state.deficit += charged - cost
+                flow_state.avg_cost = 0.8 * flow_state.avg_cost + 0.2 * cost
+                self._avg_cost = 0.8 * self._avg_cost + 0.2 * cost
+                if not flow_state.pending and flow_state.running == 0:
+                    del self._flows[flow]  # 空闲的 flow 不保留额度
+
+                if state.pending:
+                    self._cond.notify()
+
+        Constants.log.info(f"[obot-core] 工作线程 {threading.current_thread().name} 退出.")
+
+    def drain(self) -> list[Any]:
+        """停止接收请求并取出所有尚未开始处理的请求，正在处理的请求不受影响"""
+        with self._cond:
+            self._terminated = True
+            drained = [item for flow_state in self._flows.values() for _, item, _ in flow_state.pending]
+            for flow_state in self._flows.values():
+                flow_state.pending.clear()
+            for state in self._keys.values():
+                state.pending = 0
+            self._active.clear()
+            self._cond.notify_all()
+        return drained
+
+    def stats(self) -> PoolStats:
+        with self._lock:
+            key_depths = {key: state.pending + (1 if state.running else 0)
+                          for key, state in self._keys.items()}
+            flow_depths = {flow: len(flow_state.pending)
+                           for flow, flow_state in self._flows.items() if flow_state.pending}
+            waits = list(self._recent_waits)
+            return PoolStats(
+                workers=len(self._threads),
+                busy_workers=self._busy,
+                active_keys=len(self._keys),
+                queued=sum(state.pending for state in self._keys.values()),
+                key_depths=key_depths,
+                flow_depths=flow_depths,
+                avg_wait=sum(waits) / len(waits) if waits else 0.0,
+                max_wait=max(waits) if waits else 0.0,
+                processed=self._processed
+            )
@@ -1,7 +1,7 @@
 import json
 import os
 import secrets
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 import git
 from botpy import logging
@@ -18,6 +18,7 @@ class ModulesConfig:
     uptime: dict
     game: dict
     peeper: dict
+    transit: dict = field(default_factory=dict)
 
     @classmethod
     def get_lib_path(cls, lib_name: str) -> str:
@@ -247,6 +248,9 @@ class Constants:
         'misc2': [
             Help("/导入比赛", "导入手动配置的比赛，需要管理员权限."),
             Help("/配置重载", "重载配置文件，需要管理员权限."),
+            Help("/重载模块 [module]", "不重启 Bot 热重载指定模块，如 cp.cf，需要管理员权限."),
+            Help("/队列状态", "查看消息处理队列的状态，需要管理员权限."),
+            Help("/场景用量", "查看最近一小时各对话场景消耗的处理时间，需要管理员权限."),
             Help("/重启", "重新启动 Bot，需要管理员权限.")
         ],
         'help': [
@@ -0,0 +1,56 @@
+from collections import deque
+from typing import Hashable, Iterable
+
+
+class AhoCorasick:
+    """
+    多模式串匹配自动机，构建完成后只读，可在多个线程间共享。
+    一次线性扫描即可得到文本中出现过的所有模式串对应的标签
+    """
+
+    def __init__(self, patterns: Iterable[tuple[str, Hashable]]):
+        """
+        :param patterns: (模式串, 标签) 列表，同一标签可对应多个模式串
+        """
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        outputs: list[set] = [set()]
+
+        for pattern, label in patterns:
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    outputs.append(set())
+                state = nxt
+            outputs[state].add(label)
+
+        # 按 bfs 序计算失配指针，并把失配链上的输出合并到当前状态
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                outputs[nxt] |= outputs[self._fail[nxt]]
+                queue.append(nxt)
+
+        self._output: list[frozenset] = [frozenset(output) for output in outputs]
+
+    def search(self, text: str) -> set:
+        """获取 text 中出现过的所有模式串的标签，空模式串视为总是出现"""
+        matched = set(self._output[0])
+        state = 0
+        for ch in text:
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            if self._output[state]:
+                matched |= self._output[state]
+        return matched
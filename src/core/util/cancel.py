@@ -0,0 +1,94 @@
+import contextvars
+import threading
+import time
+from typing import Callable
+
+from src.core.util.exception import OperationCancelledError
+
+
+class CancelToken:
+    """
+    指令的取消令牌，超过截止时间或被主动取消后，网络请求、渲染与子进程等耗时操作应尽快退出
+    """
+
+    def __init__(self, timeout: float | None = None):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: list[Callable[[], None]] = []
+        self.deadline = time.monotonic() + timeout if timeout else None
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass  # 回调只做清理，失败不影响其他回调
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """注册取消时的回调，已取消时立即调用，返回注销回调的方法"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove_callback(callback)
+        callback()
+        return lambda: None
+
+    def _remove_callback(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def remaining(self) -> float | None:
+        """距离截止时间的秒数，无截止时间时为 None"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        if self.cancelled:
+            raise OperationCancelledError("Operation cancelled")
+
+
+_current_token: contextvars.ContextVar[CancelToken | None] = contextvars.ContextVar("cancel_token", default=None)
+
+
+def get_cancel_token() -> CancelToken | None:
+    """获取当前上下文 (线程或协程) 所属指令的取消令牌"""
+    return _current_token.get()
+
+
+def use_cancel_token(token: CancelToken | None) -> contextvars.Token:
+    """将令牌绑定到当前上下文，asyncio.to_thread 等会自动继承"""
+    return _current_token.set(token)
+
+
+def reset_cancel_token(reset_token: contextvars.Token):
+    _current_token.reset(reset_token)
+
+
+def check_cancelled():
+    """当前指令已被取消时抛出 OperationCancelledError"""
+    token = _current_token.get()
+    if token is not None:
+        token.check()
+
+
+def clamp_timeout(timeout: float) -> float:
+    """将耗时操作的超时时间限制在当前指令的剩余时间内"""
+    token = _current_token.get()
+    if token is None:
+        return timeout
+    token.check()
+    remaining = token.remaining()
+    return timeout if remaining is None else max(0.1, min(timeout, remaining))
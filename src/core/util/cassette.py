@@ -0,0 +1,160 @@
+import base64
+import contextlib
+import json
+import os
+import random
+import threading
+from dataclasses import dataclass
+from typing import Iterator
+
+from src.core.constants import Constants
+
+
+class CassetteMissError(LookupError):
+    """ The request was not recorded in the cassette being replayed. """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+
+
+@dataclass(frozen=True)
+class Interaction:
+    """一次录制的请求与响应"""
+    method: str
+    url: str
+    payload: dict | None
+    status: int
+    headers: dict[str, str]
+    body: bytes
+    elapsed: float  # 录制时的耗时，秒
+
+
+class Cassette:
+    """
+    录制与回放上游 HTTP 请求，用于离线、可复现地测试与比较解析和渲染的性能。
+
+    回放时按 (请求方法, 地址, 请求体) 依次返回录制的响应，同一请求被调用的次数多于录制次数时重复最后一次，
+    可以模拟网络延迟与随机失败，随机数种子固定以保证结果可复现
+    """
+
+    RECORD, REPLAY = "record", "replay"
+
+    def __init__(self, path: str, mode: str = REPLAY, latency: float | str | None = None,
+                 failure_rate: float = 0.0, seed: int = 0):
+        """
+        :param mode: record 为实际请求并录制，replay 为只回放，不访问网络
+        :param latency: 回放时模拟的延迟，"recorded" 为录制时的耗时，数字为固定的秒数，为空时不等待
+        :param failure_rate: 回放时以此概率模拟网络异常
+        """
+        if mode not in (self.RECORD, self.REPLAY):
+            raise ValueError("Parameter mode must be either 'record' or 'replay'.")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._interactions: list[Interaction] = []
+        self._index: dict[tuple, list[Interaction]] = {}
+        self._cursors: dict[tuple, int] = {}
+        if mode == self.REPLAY:
+            self._interactions = self._load(path)
+            for item in self._interactions:
+                self._index.setdefault(self._key_of(item.method, item.url, item.payload), []).append(item)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == self.REPLAY
+
+    @staticmethod
+    def _key_of(method: str, url: str, payload: dict | None) -> tuple:
+        return method.upper(), url, json.dumps(payload, sort_keys=True)
+
+    @staticmethod
+    def _load(path: str) -> list[Interaction]:
+        with open(path, "r", encoding="utf-8") as f:
+            items = json.load(f)
+        return [Interaction(method=item["method"], url=item["url"], payload=item["payload"],
+                            status=item["status"], headers=item["headers"],
+                            body=base64.b64decode(item["body"]), elapsed=item["elapsed"])
+                for item in items]
+
+    def record(self, method: str, url: str, payload: dict | None, status: int,
+               headers: dict[str, str], body: bytes, elapsed: float):
+        with self._lock:
+            self._interactions.append(Interaction(method=method.upper(), url=url, payload=payload, status=status,
+                                                  headers=dict(headers), body=body, elapsed=elapsed))
+
+    def replay(self, method: str, url: str, payload: dict | None) -> tuple[Interaction | None, float]:
+        """
+        获取录制的响应与需要模拟的延迟，响应为空时调用方应按网络异常处理
+
+        :raise CassetteMissError: 没有录制过这个请求
+        """
+        key = self._key_of(method, url, payload)
+        with self._lock:
+            matched = self._index.get(key)
+            if matched is None:
+                raise CassetteMissError(f"{method.upper()} {url} is not recorded in {self.path}")
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+            interaction = matched[min(cursor, len(matched) - 1)]
+            failed = self.failure_rate > 0 and self._random.random() < self.failure_rate
+
+        if self.latency == "recorded":
+            delay = interaction.elapsed
+        else:
+            delay = float(self.latency or 0)
+        return (None if failed else interaction), delay
+
+    def save(self):
+        if self.mode != self.RECORD:
+            return
+        with self._lock:
+            items = [{"method": item.method, "url": item.url, "payload": item.payload, "status": item.status,
+                      "headers": item.headers, "body": base64.b64encode(item.body).decode("ascii"),
+                      "elapsed": round(item.elapsed, 4)}
+                     for item in self._interactions]
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False, indent=2)
+        Constants.log.info(f"[network] 已录制 {len(items)} 个请求到 {self.path}")
+
+
+_active_cassette: Cassette | None = None
+
+
+def get_active_cassette() -> Cassette | None:
+    return _active_cassette
+
+
+@contextlib.contextmanager
+def use_cassette(path: str, mode: str = Cassette.REPLAY, latency: float | str | None = None,
+                 failure_rate: float = 0.0, seed: int = 0) -> Iterator[Cassette]:
+    """
+    在此范围内录制或回放所有经过 fetch_url 系列方法的请求，对所有线程生效，录制的内容在退出时写入文件
+
+    参数说明见 Cassette
+    """
+    global _active_cassette
+    cassette = Cassette(path, mode, latency, failure_rate, seed)
+    previous, _active_cassette = _active_cassette, cassette
+    try:
+        yield cassette
+    finally:
+        _active_cassette = previous
+        cassette.save()
+
+
+def cassette_from_env() -> contextlib.AbstractContextManager:
+    """
+    按环境变量 OBOT_CASSETTE (文件路径) 与 OBOT_CASSETTE_MODE (record 或 replay，默认 replay) 启用，
+    OBOT_CASSETTE_LATENCY 与 OBOT_CASSETTE_FAILURE_RATE 对应 Cassette 的同名参数。
+    未设置时不做任何事，供测试在离线环境中运行
+    """
+    path = os.environ.get("OBOT_CASSETTE")
+    if not path:
+        return contextlib.nullcontext()
+    return use_cassette(path, os.environ.get("OBOT_CASSETTE_MODE", Cassette.REPLAY),
+                        latency=os.environ.get("OBOT_CASSETTE_LATENCY"),
+                        failure_rate=float(os.environ.get("OBOT_CASSETTE_FAILURE_RATE") or 0))
@@ -16,7 +16,25 @@ class ModuleRuntimeError(OSError):
         super().__init__(*args)
 
 
+class OperationCancelledError(TimeoutError):
+    """ The operation was cancelled, usually because the command deadline has passed. """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+
+
+class PlatformUnavailableError(ConnectionError):
+    """ The upstream platform kept failing and requests to it are paused for a while. """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+
+
 exception_handle_rules = {
+    PlatformUnavailableError: {
+        'detail': False,
+        'message': '平台暂时不可用，请稍后重试'
+    },
     (TimeoutError, ConnectionError, ClientError, ServerError): {
         'detail': False,
         'message': '网络不稳定，请稍后重试'
@@ -0,0 +1,142 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
+from urllib.parse import urlsplit
+
+from src.core.constants import Constants
+from src.core.util.exception import PlatformUnavailableError
+
+# 未配置 hosts 时使用的默认限制，Codeforces 的 api 限制每个 IP 约两秒一次
+_DEFAULT_HOSTS = {
+    "codeforces.com": {"rate": 0.5, "burst": 1}
+}
+
+
+@dataclass(frozen=True)
+class BreakerState:
+    """单个 host 的熔断状态"""
+    host: str
+    state: str  # closed, open 或 half_open
+    failures: int  # 连续失败次数
+    retry_in: float  # 处于 open 状态时，距离下一次探测的秒数
+    rejected: int  # 熔断期间直接拒绝的请求数
+
+
+class _HostState:
+    __slots__ = ("tokens", "updated", "state", "failures", "opened_at", "probing", "rejected")
+
+    def __init__(self):
+        self.tokens: float | None = None
+        self.updated = time.monotonic()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.rejected = 0
+
+
+class HostGuard:
+    """
+    按 host 限制上游请求的频率，并在连续失败后熔断，所有线程与事件循环共享。
+
+    熔断后在 reset_timeout 秒内直接拒绝请求，之后进入半开状态，只放行一个探测请求，
+    探测成功则恢复，失败则重新熔断
+    """
+
+    def __init__(self, conf_getter: Callable[[], dict]):
+        """
+        :param conf_getter: 获取 general.http 配置中的 hosts 部分，每次读取以支持配置重载
+        """
+        self._conf_getter = conf_getter
+        self._lock = threading.Lock()
+        self._hosts: dict[str, _HostState] = {}
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        return urlsplit(url).hostname or url
+
+    def _conf_of(self, host: str) -> dict:
+        hosts = self._conf_getter()
+        if hosts is None:
+            hosts = _DEFAULT_HOSTS
+        return {**hosts.get("default", {}), **hosts.get(host, {})}
+
+    def _state_of(self, host: str) -> _HostState:
+        """需持有锁"""
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState()
+        return state
+
+    def admit(self, url: str):
+        """
+        请求前检查熔断状态，熔断中时抛出 PlatformUnavailableError，
+        通过检查的请求必须以 record_success、record_failure 或 release 结束
+        """
+        host = self.host_of(url)
+        reset_timeout = self._conf_of(host).get("reset_timeout", 30)
+        with self._lock:
+            state = self._state_of(host)
+            if state.state == "open" and time.monotonic() - state.opened_at >= reset_timeout:
+                state.state = "half_open"
+            if state.state == "open" or (state.state == "half_open" and state.probing):
+                state.rejected += 1
+                raise PlatformUnavailableError(f"{host} is unavailable")
+            if state.state == "half_open":
+                state.probing = True
+
+    def record_success(self, url: str):
+        host = self.host_of(url)
+        with self._lock:
+            state = self._state_of(host)
+            if state.state != "closed":
+                Constants.log.info(f"[network] {host} 已恢复")
+            state.state, state.failures, state.probing = "closed", 0, False
+
+    def record_failure(self, url: str):
+        host = self.host_of(url)
+        threshold = self._conf_of(host).get("failure_threshold", 5)
+        with self._lock:
+            state = self._state_of(host)
+            state.failures += 1
+            state.probing = False
+            if state.state == "half_open" or (state.state == "closed" and state.failures >= threshold):
+                if state.state == "closed":
+                    Constants.log.warning(f"[network] {host} 连续失败 {state.failures} 次，暂停请求")
+                state.state = "open"
+                state.opened_at = time.monotonic()
+
+    def release(self, url: str):
+        """请求被取消，不计入成功或失败"""
+        host = self.host_of(url)
+        with self._lock:
+            self._state_of(host).probing = False
+
+    def reserve(self, url: str) -> float:
+        """预订一次请求的配额，返回需要等待的秒数，配额不足时允许透支以保证先到先得"""
+        host = self.host_of(url)
+        conf = self._conf_of(host)
+        rate = conf.get("rate", 0)
+        if rate <= 0:
+            return 0.0
+        burst = max(1.0, conf.get("burst", 1))
+        with self._lock:
+            state = self._state_of(host)
+            now = time.monotonic()
+            tokens = burst if state.tokens is None else state.tokens
+            state.tokens = min(burst, tokens + (now - state.updated) * rate) - 1
+            state.updated = now
+            return 0.0 if state.tokens >= 0 else -state.tokens / rate
+
+    def states(self) -> list[BreakerState]:
+        now = time.monotonic()
+        with self._lock:
+            items = list(self._hosts.items())
+            result = []
+            for host, state in sorted(items):
+                reset_timeout = self._conf_of(host).get("reset_timeout", 30)
+                retry_in = max(0.0, state.opened_at + reset_timeout - now) if state.state == "open" else 0.0
+                result.append(BreakerState(host=host, state=state.state, failures=state.failures,
+                                           retry_in=retry_in, rejected=state.rejected))
+            return result
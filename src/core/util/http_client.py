@@ -0,0 +1,598 @@
+import asyncio
+import concurrent.futures
+import json
+import os
+import random
+import re
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Any, Coroutine, Mapping
+
+import aiohttp
+import requests
+from requests import Response
+from multidict import CIMultiDict
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from src.core.constants import Constants, ModulesConfig
+from src.core.util.cancel import check_cancelled, clamp_timeout, get_cancel_token, use_cancel_token, \
+    CancelToken
+from src.core.util.cassette import get_active_cassette, Interaction, CassetteMissError
+from src.core.util.exception import OperationCancelledError, PlatformUnavailableError
+from src.core.util.host_guard import HostGuard
+from src.core.util.response_cache import ResponseCache, CacheEntry, CachePolicy
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+               "Chrome/91.0.4472.77 Safari/537.36")
+
+_RETRY_STATUS = frozenset([429, 500, 502, 503, 504])
+
+
+def get_proxies(modules_conf: ModulesConfig) -> dict | None:
+    proxies = {}  # 配置代理
+    general_conf = modules_conf.general
+    if ('http_proxy' in general_conf and
+            general_conf['http_proxy'] is not None and len(general_conf['http_proxy']) > 0):
+        proxies['http'] = general_conf['http_proxy']
+    if ('https_proxy' in general_conf and
+            general_conf['https_proxy'] is not None and len(general_conf['https_proxy']) > 0):
+        proxies['https'] = general_conf['https_proxy']
+    if len(proxies) == 0:
+        proxies = None
+    return proxies
+
+
+@dataclass(frozen=True)
+class FetchResult:
+    """批量请求中单个请求的结果，失败时 error 不为空"""
+    url: str
+    status: int | None
+    body: bytes | None
+    error: Exception | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def unwrap(self) -> bytes:
+        """获取响应体，请求失败时抛出对应的异常"""
+        if self.error is not None:
+            raise self.error
+        return self.body
+
+    def text(self) -> str:
+        return self.unwrap().decode('utf-8', errors='replace')
+
+    def json(self) -> Any:
+        try:
+            return json.loads(self.unwrap())
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON from {self.url}") from e
+
+
+class HttpClient:
+    """
+    共享的 HTTP 客户端，按 host 维护保持连接的连接池，避免每次请求重新握手。
+    幂等的 GET 请求在网络异常或服务端错误时按带抖动的指数退避重试
+    """
+
+    def __init__(self, modules_conf: ModulesConfig, cache: ResponseCache | None = None,
+                 guard: HostGuard | None = None):
+        """
+        :param cache: 响应缓存，为空时不缓存
+        :param guard: 按 host 的限速与熔断，为空时不限制
+        """
+        http_conf = modules_conf.general.get('http', {})
+        self.connect_timeout: float = http_conf.get('connect_timeout', 5)
+        self.read_timeout: float = http_conf.get('read_timeout', 30)
+        self.max_retries: int = http_conf.get('max_retries', 2)
+        self.retry_backoff: float = http_conf.get('retry_backoff', 0.5)
+        self.proxies = get_proxies(modules_conf)
+        self.cache = cache
+        self.guard = guard
+
+        self._session = requests.Session()
+        self._session.headers.update({'User-Agent': USER_AGENT})
+        self._session.proxies = self.proxies or {}
+        adapter = HTTPAdapter(pool_connections=32,
+                              pool_maxsize=http_conf.get('pool_size', 8))
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def _timeout(self) -> tuple[float, float]:
+        # 不超过所属指令的剩余时间
+        return clamp_timeout(self.connect_timeout), clamp_timeout(self.read_timeout)
+
+    def _backoff(self, attempt: int):
+        delay = self.retry_backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+        time.sleep(clamp_timeout(delay))
+        check_cancelled()
+
+    def request(self, method: str, url: str, headers: dict | None = None,
+                payload: dict | None = None, fresh: bool = False) -> Response:
+        """
+        发起请求，GET 请求遇到网络异常或 429/5xx 时自动重试，匹配缓存策略的 GET 请求优先使用缓存
+
+        :param payload: POST 请求的 json 内容
+        :param fresh: 为 True 时总是请求上游，缓存只用于条件请求，失败时不使用过期的缓存
+        """
+        method = method.upper()
+        if method == 'GET' and self.cache is not None and get_active_cassette() is None:
+            policy = self.cache.policy_for(url)
+            if policy is not None:
+                return self._request_cached(policy, url, headers, fresh)
+        return self._send(method, url, headers, payload)
+
+    def _request_cached(self, policy: CachePolicy, url: str, headers: dict | None, fresh: bool = False) -> Response:
+        cache = self.cache
+        key = cache.key_of(url, headers)
+        entry = cache.get(key)
+        if fresh:
+            return self._fetch_and_store(policy, url, headers, key, entry, fresh=True)
+        if entry is not None:
+            state = cache.state_of(entry, policy)
+            if state != cache.EXPIRED:
+                if state == cache.STALE and cache.try_begin_revalidate(key):
+                    _revalidate_executor.submit(self._revalidate, policy, url, headers, key, entry)
+                cache.record(url, 'hits' if state == cache.FRESH else 'stale_hits', len(entry.body))
+                return _response_of(entry)
+        return self._fetch_and_store(policy, url, headers, key, entry)
+
+    def _revalidate(self, policy: CachePolicy, url: str, headers: dict | None, key: str, entry: CacheEntry):
+        try:
+            self._fetch_and_store(policy, url, headers, key, entry, background=True)
+        except Exception as e:
+            Constants.log.warning(f"[network] 后台更新 {url} 的缓存失败: {e}")
+        finally:
+            self.cache.end_revalidate(key)
+
+    def _fetch_and_store(self, policy: CachePolicy, url: str, headers: dict | None, key: str,
+                         entry: CacheEntry | None, background: bool = False, fresh: bool = False) -> Response:
+        cache = self.cache
+        try:
+            response = self._send('GET', url, {**(headers or {}), **cache.conditional_headers(entry)}, None)
+        except OperationCancelledError:
+            raise
+        except Exception as e:
+            if background or fresh or not cache.usable_on_error(entry, policy):
+                raise
+            Constants.log.warning(f"[network] 请求 {url} 失败，使用 {entry.age():.0f}s 前的缓存: {e}")
+            cache.record(url, 'errors_served', len(entry.body))
+            return _response_of(entry)
+
+        code = response.status_code
+        if code == 304 and entry is not None:
+            response.close()
+            entry = cache.refresh(key, entry, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+            cache.record(url, 'revalidated', len(entry.body))
+            return _response_of(entry)
+        if code in _RETRY_STATUS and not background and not fresh and cache.usable_on_error(entry, policy):
+            response.close()
+            Constants.log.warning(f"[network] {code} | {url}，使用 {entry.age():.0f}s 前的缓存")
+            cache.record(url, 'errors_served', len(entry.body))
+            return _response_of(entry)
+
+        if not background:
+            cache.record(url, 'misses')
+        if code == 200:
+            cache.put(key, CacheEntry(url=url, status=code, body=response.content,
+                                      etag=response.headers.get('ETag'),
+                                      last_modified=response.headers.get('Last-Modified'),
+                                      encoding=response.encoding,
+                                      content_type=response.headers.get('Content-Type'),
+                                      stored_at=time.time()))
+        return response
+
+    def _send(self, method: str, url: str, headers: dict | None, payload: dict | None) -> Response:
+        guard = self.guard
+        if guard is None or _replaying():  # 回放的结果与模拟的失败不计入熔断
+            return self._send_attempts(method, url, headers, payload)
+
+        guard.admit(url)
+        try:
+            response = self._send_attempts(method, url, headers, payload)
+        except OperationCancelledError:
+            guard.release(url)  # 指令被取消不代表上游异常
+            raise
+        except Exception:
+            guard.record_failure(url)
+            raise
+        if response.status_code >= 500:
+            guard.record_failure(url)
+        else:
+            guard.record_success(url)
+        return response
+
+    def _wait_quota(self, url: str):
+        if self.guard is None or _replaying():
+            return
+        wait = self.guard.reserve(url)
+        if wait > 0:
+            time.sleep(clamp_timeout(wait))
+            check_cancelled()
+
+    def _perform(self, method: str, url: str, headers: dict | None, payload: dict | None) -> Response:
+        """实际发出一次请求，启用录制时记录响应，回放时直接返回录制的响应"""
+        cassette = get_active_cassette()
+        if cassette is not None and cassette.replaying:
+            interaction, delay = cassette.replay(method, url, payload)
+            if delay > 0:
+                time.sleep(clamp_timeout(delay))
+            if interaction is None:
+                raise requests.ConnectionError(f"Simulated failure for {url}")
+            return _replayed_response_of(interaction)
+
+        start = time.perf_counter()
+        response = self._session.request(method, url, headers=headers,
+                                         json=payload if method == 'POST' else None,
+                                         timeout=self._timeout())
+        if cassette is not None:
+            cassette.record(method, url, payload, response.status_code, dict(response.headers),
+                            response.content, time.perf_counter() - start)
+        return response
+
+    def _send_attempts(self, method: str, url: str, headers: dict | None, payload: dict | None) -> Response:
+        retries = self.max_retries if method == 'GET' else 0
+        attempt = 0
+        while True:
+            check_cancelled()
+            self._wait_quota(url)
+            try:
+                response = self._perform(method, url, headers, payload)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= retries:
+                    raise
+                Constants.log.warning(f"[network] 请求 {url} 失败，准备重试: {e}")
+                self._backoff(attempt)
+                attempt += 1
+                continue
+
+            if response.status_code in _RETRY_STATUS and attempt < retries:
+                Constants.log.warning(f"[network] {response.status_code} | {url}，准备重试")
+                response.close()
+                self._backoff(attempt)
+                attempt += 1
+                continue
+            return response
+
+    def close(self):
+        self._session.close()
+
+
+def _replaying() -> bool:
+    """回放录制的请求时不限速也不经过熔断，以便比较解析与渲染本身的耗时"""
+    cassette = get_active_cassette()
+    return cassette is not None and cassette.replaying
+
+
+def _replayed_response_of(interaction: Interaction) -> Response:
+    response = Response()
+    response.status_code = interaction.status
+    response.url = interaction.url
+    response.headers = CaseInsensitiveDict(interaction.headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = interaction.body
+    response._content_consumed = True
+    return response
+
+
+def _response_of(entry: CacheEntry) -> Response:
+    """由缓存条目构造响应，供同步请求的调用方按原样使用"""
+    response = Response()
+    response.status_code = entry.status
+    response.reason = 'OK'
+    response.url = entry.url
+    response.encoding = entry.encoding
+    response._content = entry.body
+    response._content_consumed = True
+    if entry.content_type:
+        response.headers['Content-Type'] = entry.content_type
+    return response
+
+
+_revalidate_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="HttpRevalidate")
+
+_cache_lock = threading.Lock()
+_response_cache: ResponseCache | None = None
+_host_guard = HostGuard(lambda: Constants.modules_conf.general.get('http', {}).get('hosts'))
+
+
+def get_host_guard() -> HostGuard:
+    """获取共享的限速与熔断状态，配置重载后沿用"""
+    return _host_guard
+
+
+def get_response_cache() -> ResponseCache:
+    """获取共享的响应缓存，存储在缓存目录的 http 文件夹下，配置重载后沿用"""
+    global _response_cache
+    with _cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(
+                os.path.join(Constants.modules_conf.get_cache_path(), 'http'),
+                lambda: Constants.modules_conf.general.get('http', {}).get('cache', {}))
+        return _response_cache
+
+
+_client_lock = threading.Lock()
+_client: HttpClient | None = None
+_client_conf: ModulesConfig | None = None
+
+
+def get_http_client() -> HttpClient:
+    """获取共享的 HTTP 客户端，配置重载后自动重建"""
+    global _client, _client_conf
+    modules_conf = Constants.modules_conf
+    cache = get_response_cache()
+    with _client_lock:
+        if _client is None or _client_conf is not modules_conf:
+            # 旧客户端可能仍有请求在进行，不主动关闭，由垃圾回收释放连接
+            _client = HttpClient(modules_conf, cache, _host_guard)
+            _client_conf = modules_conf
+        return _client
+
+
+class AsyncHttpClient:
+    """
+    HttpClient 的协程版本，绑定在创建它的事件循环上。
+    连接池限制了每个 host 同时进行的请求数，避免批量请求时触发平台的频率限制
+    """
+
+    def __init__(self, modules_conf: ModulesConfig, cache: ResponseCache | None = None,
+                 guard: HostGuard | None = None):
+        """
+        :param cache: 响应缓存，为空时不缓存
+        :param guard: 按 host 的限速与熔断，为空时不限制
+        """
+        http_conf = modules_conf.general.get('http', {})
+        self.connect_timeout: float = http_conf.get('connect_timeout', 5)
+        self.read_timeout: float = http_conf.get('read_timeout', 30)
+        self.max_retries: int = http_conf.get('max_retries', 2)
+        self.retry_backoff: float = http_conf.get('retry_backoff', 0.5)
+        self.per_host_limit: int = http_conf.get('per_host_limit', 4)
+        self.proxies = get_proxies(modules_conf)
+        self.cache = cache
+        self.guard = guard
+        self._session: aiohttp.ClientSession | None = None
+        self._background_tasks: set[asyncio.Task] = set()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=64, limit_per_host=self.per_host_limit)
+            self._session = aiohttp.ClientSession(connector=connector, headers={'User-Agent': USER_AGENT})
+        return self._session
+
+    def _proxy_of(self, url: str) -> str | None:
+        if self.proxies is None:
+            return None
+        return self.proxies.get('https' if url.startswith('https://') else 'http')
+
+    async def request(self, method: str, url: str, headers: dict | None = None,
+                      payload: dict | None = None) -> tuple[int, bytes]:
+        """发起请求并读取完整的响应体，重试与缓存策略与 HttpClient 相同"""
+        method = method.upper()
+        if method == 'GET' and self.cache is not None and get_active_cassette() is None:
+            policy = self.cache.policy_for(url)
+            if policy is not None:
+                return await self._request_cached(policy, url, headers)
+        code, body, _ = await self._send(method, url, headers, payload)
+        return code, body
+
+    async def _request_cached(self, policy: CachePolicy, url: str, headers: dict | None) -> tuple[int, bytes]:
+        cache = self.cache
+        key = cache.key_of(url, headers)
+        entry = await asyncio.to_thread(cache.get, key)  # 可能需要读取磁盘
+        if entry is not None:
+            state = cache.state_of(entry, policy)
+            if state != cache.EXPIRED:
+                if state == cache.STALE and cache.try_begin_revalidate(key):
+                    task = asyncio.get_running_loop().create_task(
+                        self._revalidate(policy, url, headers, key, entry))
+                    self._background_tasks.add(task)
+                    task.add_done_callback(self._background_tasks.discard)
+                cache.record(url, 'hits' if state == cache.FRESH else 'stale_hits', len(entry.body))
+                return entry.status, entry.body
+        return await self._fetch_and_store(policy, url, headers, key, entry)
+
+    async def _revalidate(self, policy: CachePolicy, url: str, headers: dict | None, key: str,
+                          entry: CacheEntry):
+        use_cancel_token(None)  # 不受触发更新的指令的截止时间限制
+        try:
+            await self._fetch_and_store(policy, url, headers, key, entry, background=True)
+        except Exception as e:
+            Constants.log.warning(f"[network] 后台更新 {url} 的缓存失败: {e}")
+        finally:
+            self.cache.end_revalidate(key)
+
+    async def _fetch_and_store(self, policy: CachePolicy, url: str, headers: dict | None, key: str,
+                               entry: CacheEntry | None, background: bool = False) -> tuple[int, bytes]:
+        cache = self.cache
+        try:
+            code, body, response_headers = await self._send(
+                'GET', url, {**(headers or {}), **cache.conditional_headers(entry)}, None)
+        except (OperationCancelledError, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            if background or not cache.usable_on_error(entry, policy):
+                raise
+            Constants.log.warning(f"[network] 请求 {url} 失败，使用 {entry.age():.0f}s 前的缓存: {e}")
+            cache.record(url, 'errors_served', len(entry.body))
+            return entry.status, entry.body
+
+        if code == 304 and entry is not None:
+            entry = await asyncio.to_thread(cache.refresh, key, entry, response_headers.get('ETag'),
+                                            response_headers.get('Last-Modified'))
+            cache.record(url, 'revalidated', len(entry.body))
+            return entry.status, entry.body
+        if code in _RETRY_STATUS and not background and cache.usable_on_error(entry, policy):
+            Constants.log.warning(f"[network] {code} | {url}，使用 {entry.age():.0f}s 前的缓存")
+            cache.record(url, 'errors_served', len(entry.body))
+            return entry.status, entry.body
+
+        if not background:
+            cache.record(url, 'misses')
+        if code == 200:
+            content_type = response_headers.get('Content-Type')
+            charset = re.search(r'charset=([\w-]+)', content_type or '')
+            await asyncio.to_thread(cache.put, key, CacheEntry(
+                url=url, status=code, body=body, etag=response_headers.get('ETag'),
+                last_modified=response_headers.get('Last-Modified'),
+                encoding=charset.group(1) if charset else None,
+                content_type=content_type, stored_at=time.time()))
+        return code, body
+
+    async def _send(self, method: str, url: str, headers: dict | None,
+                    payload: dict | None) -> tuple[int, bytes, Mapping[str, str]]:
+        guard = self.guard
+        if guard is None or _replaying():  # 回放的结果与模拟的失败不计入熔断
+            return await self._send_attempts(method, url, headers, payload)
+
+        guard.admit(url)
+        try:
+            result = await self._send_attempts(method, url, headers, payload)
+        except (OperationCancelledError, asyncio.CancelledError):
+            guard.release(url)  # 指令被取消不代表上游异常
+            raise
+        except Exception:
+            guard.record_failure(url)
+            raise
+        if result[0] >= 500:
+            guard.record_failure(url)
+        else:
+            guard.record_success(url)
+        return result
+
+    async def _wait_quota(self, url: str):
+        if self.guard is None or _replaying():
+            return
+        wait = self.guard.reserve(url)
+        if wait > 0:
+            await asyncio.sleep(clamp_timeout(wait))
+            check_cancelled()
+
+    async def _perform(self, method: str, url: str, headers: dict | None, payload: dict | None,
+                       timeout: aiohttp.ClientTimeout) -> tuple[int, bytes, Mapping[str, str]]:
+        """实际发出一次请求，启用录制时记录响应，回放时直接返回录制的响应"""
+        cassette = get_active_cassette()
+        if cassette is not None and cassette.replaying:
+            interaction, delay = cassette.replay(method, url, payload)
+            if delay > 0:
+                await asyncio.sleep(clamp_timeout(delay))
+            if interaction is None:
+                raise aiohttp.ClientConnectionError(f"Simulated failure for {url}")
+            return interaction.status, interaction.body, CIMultiDict(interaction.headers)
+
+        start = time.perf_counter()
+        async with self._get_session().request(method, url, headers=headers, proxy=self._proxy_of(url),
+                                               json=payload if method == 'POST' else None,
+                                               timeout=timeout) as response:
+            code, body = response.status, await response.read()
+        if cassette is not None:
+            cassette.record(method, url, payload, code, dict(response.headers), body, time.perf_counter() - start)
+        return code, body, response.headers
+
+    async def _send_attempts(self, method: str, url: str, headers: dict | None,
+                             payload: dict | None) -> tuple[int, bytes, Mapping[str, str]]:
+        retries = self.max_retries if method == 'GET' else 0
+        attempt = 0
+        while True:
+            check_cancelled()
+            await self._wait_quota(url)
+            # 排队等待连接的时间不计入超时，只限制建立连接与读取
+            timeout = aiohttp.ClientTimeout(sock_connect=clamp_timeout(self.connect_timeout),
+                                            sock_read=clamp_timeout(self.read_timeout))
+            try:
+                code, body, response_headers = await self._perform(method, url, headers, payload, timeout)
+                if not (code in _RETRY_STATUS and attempt < retries):
+                    return code, body, response_headers
+                Constants.log.warning(f"[network] {code} | {url}，准备重试")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= retries:
+                    raise
+                Constants.log.warning(f"[network] 请求 {url} 失败，准备重试: {e}")
+
+            delay = self.retry_backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+            await asyncio.sleep(clamp_timeout(delay))
+            attempt += 1
+
+    async def fetch_many(self, urls: list[str], concurrency: int = 8, method: str = 'get',
+                         headers: dict | None = None, accept_codes: list[int] | None = None) -> list[FetchResult]:
+        """并发请求多个地址，结果按请求顺序返回，单个请求失败不影响其他请求"""
+        if accept_codes is None:
+            accept_codes = [200]
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def _fetch(url: str) -> FetchResult:
+            async with semaphore:
+                try:
+                    code, body = await self.request(method, url, headers=headers)
+                except (asyncio.CancelledError, CassetteMissError):
+                    raise
+                except PlatformUnavailableError as e:
+                    return FetchResult(url, None, None, e)
+                except Exception as e:
+                    return FetchResult(url, None, None, ConnectionError(f"Failed to connect {url}: {e}"))
+            Constants.log.info(f"[network] {code} | {url}")
+            if code not in accept_codes:
+                return FetchResult(url, code, body, ConnectionError(f"Failed to connect {url}, code {code}."))
+            return FetchResult(url, code, body)
+
+        return list(await asyncio.gather(*(_fetch(url) for url in urls)))
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+_async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()  # 事件循环 -> (客户端, 配置)
+
+
+def get_async_http_client() -> AsyncHttpClient:
+    """获取当前事件循环共享的协程 HTTP 客户端，配置重载后自动重建"""
+    loop = asyncio.get_running_loop()
+    modules_conf = Constants.modules_conf
+    client, client_conf = _async_clients.get(loop, (None, None))
+    if client is None or client_conf is not modules_conf:
+        if client is not None:
+            loop.create_task(client.close())
+        client = AsyncHttpClient(modules_conf, get_response_cache(), _host_guard)
+        _async_clients[loop] = (client, modules_conf)
+    return client
+
+
+_background_loop: asyncio.AbstractEventLoop | None = None
+_background_lock = threading.Lock()
+
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    global _background_loop
+    with _background_lock:
+        if _background_loop is None:
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(target=_background_loop.run_forever, name="HTTP Loop", daemon=True).start()
+        return _background_loop
+
+
+async def _run_with_token(token: CancelToken | None, coro: Coroutine):
+    use_cancel_token(token)  # 只作用于当前任务的上下文
+    return await coro
+
+
+def run_sync(coro: Coroutine) -> Any:
+    """
+    在独立的事件循环线程中运行协程并等待结果，供工作线程中的同步代码使用。
+    沿用调用方指令的截止时间，指令被取消时一并取消协程
+    """
+    token = get_cancel_token()
+    future = asyncio.run_coroutine_threadsafe(_run_with_token(token, coro), _get_background_loop())
+    unregister = token.on_cancel(future.cancel) if token is not None else (lambda: None)
+    try:
+        return future.result()
+    except concurrent.futures.CancelledError:
+        check_cancelled()
+        raise
+    finally:
+        unregister()
@@ -0,0 +1,89 @@
+import json
+import re
+from json.decoder import scanstring
+from typing import Any, Iterator
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+
+def _skip_ws(text: str, pos: int) -> int:
+    return _WHITESPACE.match(text, pos).end()
+
+
+def _expect(text: str, pos: int, char: str):
+    if pos >= len(text) or text[pos] != char:
+        raise ValueError(f"Expecting '{char}' at char {pos}")
+
+
+def _locate(text: str, path: tuple[str, ...]) -> int:
+    """
+    找到 path 指向的值的起始位置，只解析途经的键，
+    位于目标之前的同级值会被逐个解析后丢弃，不会一次性构建整个文档
+    """
+    pos = _skip_ws(text, 0)
+    for key in path:
+        _expect(text, pos, '{')
+        pos = _skip_ws(text, pos + 1)
+        while True:
+            if pos < len(text) and text[pos] == '}':
+                raise KeyError(key)
+            _expect(text, pos, '"')
+            name, pos = scanstring(text, pos + 1)
+            pos = _skip_ws(text, pos)
+            _expect(text, pos, ':')
+            pos = _skip_ws(text, pos + 1)
+            if name == key:
+                break
+            _, pos = _decoder.raw_decode(text, pos)  # 跳过不需要的值
+            pos = _skip_ws(text, pos)
+            if pos < len(text) and text[pos] == ',':
+                pos = _skip_ws(text, pos + 1)
+    return pos
+
+
+def extract(text: str, path: tuple[str, ...]) -> Any:
+    """解析 path 指向的值，例如 extract(text, ('result', 'contest'))"""
+    value, _ = _decoder.raw_decode(text, _locate(text, path))
+    return value
+
+
+def iter_items(text: str, path: tuple[str, ...]) -> Iterator[Any]:
+    """逐个解析 path 指向的数组中的元素，同一时刻只保留一个元素"""
+    pos = _locate(text, path)
+    _expect(text, pos, '[')
+    pos = _skip_ws(text, pos + 1)
+    if pos < len(text) and text[pos] == ']':
+        return
+    while True:
+        item, pos = _decoder.raw_decode(text, pos)
+        yield item
+        pos = _skip_ws(text, pos)
+        if pos < len(text) and text[pos] == ',':
+            pos = _skip_ws(text, pos + 1)
+            continue
+        _expect(text, pos, ']')
+        return
+
+
+def _compile_field(field: str) -> tuple[str | int, ...]:
+    return tuple(int(part) if part.isdigit() else part for part in field.split('.'))
+
+
+def _get_field(item: Any, steps: tuple[str | int, ...]) -> Any:
+    for step in steps:
+        try:
+            item = item[step]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return item
+
+
+def project(text: str, path: tuple[str, ...], fields: tuple[str, ...]) -> list[tuple]:
+    """
+    将 path 指向的数组中的每个元素投影为只包含 fields 的元组，不存在的字段为 None
+
+    :param fields: 以点分隔的字段路径，数字表示数组下标，例如 'party.members.0.handle'
+    """
+    compiled = [_compile_field(field) for field in fields]
+    return [tuple(_get_field(item, steps) for steps in compiled) for item in iter_items(text, path)]
@@ -0,0 +1,288 @@
+import dataclasses
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+from urllib.parse import urlsplit
+
+from src.core.constants import Constants
+
+# 未配置 rules 时使用的默认策略，均为频繁重复请求且内容变化不快的接口
+_DEFAULT_RULES = [
+    {"pattern": r"^https://codeforces\.com/api/contest\.list", "ttl": 300,
+     "stale_while_revalidate": 900, "stale_if_error": 86400},
+    {"pattern": r"^https://codeforces\.com/api/problemset\.problems", "ttl": 3600,
+     "stale_while_revalidate": 21600, "stale_if_error": 604800},
+    {"pattern": r"^https://atcoder\.jp/contests/$", "ttl": 300,
+     "stale_while_revalidate": 900, "stale_if_error": 86400},
+    {"pattern": r"^https://ac\.nowcoder\.com/acm/contest/vip-index\?", "ttl": 300,
+     "stale_while_revalidate": 900, "stale_if_error": 86400},
+    {"pattern": r"^https://stats\.uptimerobot\.com/api/getMonitorList/", "ttl": 60,
+     "stale_while_revalidate": 120, "stale_if_error": 3600},
+]
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """
+    单个地址模式的缓存策略，时间均为秒
+
+    :param ttl: 在此时间内直接使用缓存
+    :param stale_while_revalidate: 过期后在此时间内仍先返回缓存，同时在后台重新验证
+    :param stale_if_error: 过期后在此时间内，上游出错时返回缓存
+    """
+    pattern: re.Pattern
+    ttl: float
+    stale_while_revalidate: float = 0
+    stale_if_error: float = 0
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    url: str
+    status: int
+    body: bytes
+    etag: str | None
+    last_modified: str | None
+    encoding: str | None
+    content_type: str | None
+    stored_at: float  # 时间戳，重启后仍然有效
+
+    def age(self) -> float:
+        return max(0.0, time.time() - self.stored_at)
+
+
+@dataclass
+class HostCacheStats:
+    """单个 host 的缓存命中情况"""
+    host: str
+    hits: int = 0  # 未过期直接命中
+    stale_hits: int = 0  # 过期但在后台重新验证期间命中
+    revalidated: int = 0  # 条件请求返回 304
+    misses: int = 0
+    errors_served: int = 0  # 上游出错时返回的过期缓存
+    bytes_saved: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        served = self.hits + self.stale_hits + self.revalidated + self.errors_served
+        total = served + self.misses
+        return served / total if total > 0 else 0.0
+
+
+class ResponseCache:
+    """
+    GET 请求的响应缓存，只缓存匹配到策略的地址。
+    内存中保留最近使用的条目，完整的条目持久化在磁盘上，两者均按字节数限制大小并淘汰最久未使用的条目
+    """
+
+    FRESH, STALE, EXPIRED = "fresh", "stale", "expired"
+
+    def __init__(self, directory: str, conf_getter: Callable[[], dict]):
+        """
+        :param conf_getter: 获取 general.http 配置中的 cache 部分，每次读取以支持配置重载
+        """
+        self._directory = directory
+        self._conf_getter = conf_getter
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_index: OrderedDict[str, int] | None = None  # key -> 文件大小，按最近使用排序
+        self._disk_bytes = 0
+        self._revalidating: set[str] = set()
+        self._host_stats: dict[str, HostCacheStats] = {}
+        self._rules_source = None
+        self._rules: list[CachePolicy] = []
+
+    def _conf(self) -> dict:
+        return self._conf_getter() or {}
+
+    def policy_for(self, url: str) -> CachePolicy | None:
+        conf = self._conf()
+        if not conf.get("enabled", True):
+            return None
+        rules = conf.get("rules", _DEFAULT_RULES)
+        with self._lock:
+            if rules is not self._rules_source:
+                self._rules = [CachePolicy(pattern=re.compile(rule["pattern"]), ttl=rule.get("ttl", 60),
+                                           stale_while_revalidate=rule.get("stale_while_revalidate", 0),
+                                           stale_if_error=rule.get("stale_if_error", 0))
+                               for rule in rules]
+                self._rules_source = rules
+            policies = self._rules
+        return next((policy for policy in policies if policy.pattern.search(url)), None)
+
+    @staticmethod
+    def key_of(url: str, headers: dict | None = None) -> str:
+        # 鉴权等请求头不同时响应可能不同，一并作为键
+        raw = json.dumps([url, sorted((headers or {}).items())], ensure_ascii=False)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def state_of(self, entry: CacheEntry, policy: CachePolicy) -> str:
+        age = entry.age()
+        if age < policy.ttl:
+            return self.FRESH
+        if age < policy.ttl + policy.stale_while_revalidate:
+            return self.STALE
+        return self.EXPIRED
+
+    @staticmethod
+    def usable_on_error(entry: CacheEntry | None, policy: CachePolicy) -> bool:
+        return entry is not None and entry.age() < policy.ttl + policy.stale_if_error
+
+    @staticmethod
+    def conditional_headers(entry: CacheEntry | None) -> dict:
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def _path_of(self, key: str) -> str:
+        return os.path.join(self._directory, f"{key}.cache")
+
+    def _ensure_disk_index(self):
+        """首次访问时扫描磁盘上的缓存，需持有锁"""
+        if self._disk_index is not None:
+            return
+        os.makedirs(self._directory, exist_ok=True)
+        files = []
+        for item in os.scandir(self._directory):
+            if item.is_file() and item.name.endswith(".cache"):
+                stat = item.stat()
+                files.append((stat.st_mtime, item.name[:-len(".cache")], stat.st_size))
+        files.sort()
+        self._disk_index = OrderedDict((key, size) for _, key, size in files)
+        self._disk_bytes = sum(size for _, _, size in files)
+
+    def _read_disk(self, key: str) -> CacheEntry | None:
+        try:
+            with open(self._path_of(key), "rb") as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError) as e:
+            Constants.log.warning(f"[caching] 读取响应缓存 {key} 失败: {e}")
+            return None
+        return CacheEntry(body=body, **meta)
+
+    def _write_disk(self, key: str, entry: CacheEntry) -> int | None:
+        meta = dataclasses.asdict(entry)
+        del meta["body"]
+        path = self._path_of(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"  # 同一条目可能被多个线程同时写入
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(json.dumps(meta, ensure_ascii=False).encode())
+                f.write(b"\n")
+                f.write(entry.body)
+            os.replace(tmp_path, path)
+            return os.path.getsize(path)
+        except OSError as e:
+            Constants.log.warning(f"[caching] 写入响应缓存 {key} 失败: {e}")
+            return None
+
+    def _remember(self, key: str, entry: CacheEntry):
+        """放入内存，需持有锁"""
+        limit = self._conf().get("memory_bytes", 16 << 20)
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old.body)
+        if len(entry.body) > limit // 4:  # 过大的条目只保存在磁盘上
+            return
+        self._memory[key] = entry
+        self._memory_bytes += len(entry.body)
+        while self._memory_bytes > limit:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted.body)
+
+    def get(self, key: str) -> CacheEntry | None:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+            self._ensure_disk_index()
+            if key not in self._disk_index:
+                return None
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                size = self._disk_index.pop(key, None)
+                if size is not None:
+                    self._disk_bytes -= size
+                return None
+            if key in self._disk_index:
+                self._disk_index.move_to_end(key)
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, entry: CacheEntry):
+        with self._lock:
+            self._ensure_disk_index()
+        size = self._write_disk(key, entry)
+        limit = self._conf().get("disk_bytes", 128 << 20)
+        evicted = []
+        with self._lock:
+            self._remember(key, entry)
+            if size is None:
+                return
+            self._disk_bytes += size - self._disk_index.pop(key, 0)
+            self._disk_index[key] = size
+            while self._disk_bytes > limit and len(self._disk_index) > 1:
+                old_key, old_size = self._disk_index.popitem(last=False)
+                self._disk_bytes -= old_size
+                old = self._memory.pop(old_key, None)
+                if old is not None:
+                    self._memory_bytes -= len(old.body)
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path_of(old_key))
+            except OSError:
+                pass
+
+    def refresh(self, key: str, entry: CacheEntry, etag: str | None = None,
+                last_modified: str | None = None) -> CacheEntry:
+        """条件请求返回 304 后，重置条目的存储时间"""
+        entry = dataclasses.replace(entry, stored_at=time.time(), etag=etag or entry.etag,
+                                    last_modified=last_modified or entry.last_modified)
+        self.put(key, entry)
+        return entry
+
+    def try_begin_revalidate(self, key: str) -> bool:
+        """同一条目同时只进行一次后台重新验证"""
+        with self._lock:
+            if key in self._revalidating:
+                return False
+            self._revalidating.add(key)
+            return True
+
+    def end_revalidate(self, key: str):
+        with self._lock:
+            self._revalidating.discard(key)
+
+    def record(self, url: str, kind: str, saved: int = 0):
+        """
+        记录一次缓存查询的结果
+
+        :param kind: hits, stale_hits, revalidated, misses, errors_served 之一
+        """
+        host = urlsplit(url).hostname or url
+        with self._lock:
+            stats = self._host_stats.get(host)
+            if stats is None:
+                stats = self._host_stats[host] = HostCacheStats(host)
+            setattr(stats, kind, getattr(stats, kind) + 1)
+            stats.bytes_saved += saved
+
+    def stats(self) -> list[HostCacheStats]:
+        with self._lock:
+            return sorted((dataclasses.replace(stats) for stats in self._host_stats.values()),
+                          key=lambda stats: stats.host)
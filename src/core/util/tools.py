@@ -1,5 +1,8 @@
+import concurrent.futures
+import contextvars
 import datetime
 import hashlib
+import json
 import os
 import random
 import re
@@ -8,7 +11,9 @@ import ssl
 import string
 import subprocess
 import sys
+import threading
 import time
+from dataclasses import dataclass
 
 import cv2
 import numpy as np
@@ -23,16 +28,27 @@ from requests import Response
 from requests.adapters import HTTPAdapter
 
 from src.core.constants import Constants
+from src.core.util.cancel import get_cancel_token, check_cancelled, clamp_timeout
+from src.core.util.cassette import CassetteMissError
+from src.core.util.exception import OperationCancelledError, PlatformUnavailableError
+from src.core.util.http_client import USER_AGENT, FetchResult, get_http_client, get_async_http_client, run_sync
+
+_REQUEST_TIMEOUT = 30  # 单次网络请求的超时时间，秒
 
 
 def run_py_file(payload: str, cwd: str, log_ignore_regex: str | None = None) -> str:
+    """运行 python 脚本并返回输出，所属指令被取消时结束子进程并抛出 OperationCancelledError"""
+    check_cancelled()
     Constants.log.info(f'[shell] cd "{cwd}"')
     Constants.log.info(f'[shell] python -X utf8 {payload}')
 
     args = [sys.executable, '-X', 'utf8'] + shlex.split(payload)
+    token = get_cancel_token()
     with subprocess.Popen(args, bufsize=1,
                           stdin=subprocess.PIPE, stderr=subprocess.STDOUT, stdout=subprocess.PIPE,
                           cwd=cwd, universal_newlines=True, encoding='utf-8') as cmd:
+        # 结束子进程后 readline 会读到 EOF，循环随之退出
+        unregister = token.on_cancel(cmd.kill) if token is not None else (lambda: None)
         ignore_re = re.compile(log_ignore_regex) if log_ignore_regex else None
         info_lines: list[str] = []
         while True:  # 实时输出
@@ -58,6 +74,11 @@ def run_py_file(payload: str, cwd: str, log_ignore_regex: str | None = None) ->
                 if line and not (ignore_re and ignore_re.search(line)):
                     Constants.log.info(f"[shell] {line}")
                     info_lines.append(line)
+        unregister()
+
+    if token is not None and token.cancelled:
+        Constants.log.warning(f'[shell] 指令已被取消，子进程已结束')
+        raise OperationCancelledError(f"Process {payload} cancelled")
 
     return '\n'.join(info_lines)
 
@@ -72,40 +93,30 @@ def clean_unsafe_shell_str(origin_str: str) -> str:
     return sanitized
 
 
+def _get_headers(inject_headers: dict = None) -> dict:
+    headers = {
+        'User-Agent': USER_AGENT
+    }
+    if inject_headers is not None:
+        for k, v in inject_headers.items():
+            headers[k] = v
+    return headers
+
+
 def fetch_url(url: str, inject_headers: dict = None, payload: dict = None,
-              method: str = 'post', accept_codes: list[int] | None = None) -> Response:
+              method: str = 'post', accept_codes: list[int] | None = None, fresh: bool = False) -> Response:
+    """:param fresh: 为 True 时不使用响应缓存中未经上游确认的内容"""
     if accept_codes is None:
         accept_codes = [200]
 
-    proxies = {}  # 配置代理
-    general_conf = Constants.modules_conf.general
-    if ('http_proxy' in general_conf and
-            general_conf['http_proxy'] is not None and len(general_conf['http_proxy']) > 0):
-        proxies['http'] = general_conf['http_proxy']
-    if ('https_proxy' in general_conf and
-            general_conf['https_proxy'] is not None and len(general_conf['https_proxy']) > 0):
-        proxies['https'] = general_conf['https_proxy']
-    if len(proxies) == 0:
-        proxies = None
-
     try:
-        headers = {
-            'User-Agent': "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
-                          "Chrome/91.0.4472.77 Safari/537.36",
-            'Connection': 'close'
-        }
-        if inject_headers is not None:
-            for k, v in inject_headers.items():
-                headers[k] = v
-
         method = method.lower()
-        if method == 'post':
-            response = requests.post(url, headers=headers, proxies=proxies, json=payload)
-        elif method == 'get':
-            response = requests.get(url, headers=headers, proxies=proxies)
-        else:
+        if method not in ('post', 'get'):
             raise ValueError("Parameter method must be either 'post' or 'get'.")
+        response = get_http_client().request(method, url, headers=inject_headers, payload=payload, fresh=fresh)
 
+    except (OperationCancelledError, PlatformUnavailableError, CassetteMissError):
+        raise
     except Exception as e:
         # 交给外层异常处理
         raise ConnectionError(f"Failed to connect {url}: {e}") from e
@@ -120,8 +131,8 @@ def fetch_url(url: str, inject_headers: dict = None, payload: dict = None,
 
 
 def fetch_url_text(url: str, inject_headers: dict = None, payload: dict = None,
-                   method: str = 'post', accept_codes: list[int] | None = None) -> str:
-    response = fetch_url(url, inject_headers, payload, method, accept_codes)
+                   method: str = 'post', accept_codes: list[int] | None = None, fresh: bool = False) -> str:
+    response = fetch_url(url, inject_headers, payload, method, accept_codes, fresh)
     return response.text
 
 
@@ -134,6 +145,67 @@ def fetch_url_json(url: str, inject_headers: dict = None, payload: dict = None,
         raise ValueError(f"Invalid JSON from {url}") from e
 
 
+async def fetch_url_async(url: str, inject_headers: dict = None, payload: dict = None,
+                          method: str = 'post', accept_codes: list[int] | None = None) -> tuple[int, bytes]:
+    """fetch_url 的协程版本，供 async 指令在事件循环上直接使用，返回状态码与响应体"""
+    if accept_codes is None:
+        accept_codes = [200]
+
+    try:
+        method = method.lower()
+        if method not in ('post', 'get'):
+            raise ValueError("Parameter method must be either 'post' or 'get'.")
+        code, body = await get_async_http_client().request(method, url, headers=inject_headers, payload=payload)
+
+    except (OperationCancelledError, PlatformUnavailableError, CassetteMissError):
+        raise
+    except Exception as e:
+        # 交给外层异常处理
+        raise ConnectionError(f"Failed to connect {url}: {e}") from e
+
+    Constants.log.info(f"[network] {code} | {url}")
+
+    if code not in accept_codes:
+        raise ConnectionError(f"Failed to connect {url}, code {code}.")
+
+    return code, body
+
+
+async def fetch_url_text_async(url: str, inject_headers: dict = None, payload: dict = None,
+                               method: str = 'post', accept_codes: list[int] | None = None) -> str:
+    _, body = await fetch_url_async(url, inject_headers, payload, method, accept_codes)
+    return body.decode('utf-8', errors='replace')
+
+
+async def fetch_url_json_async(url: str, inject_headers: dict = None, payload: dict = None,
+                               method: str = 'post', accept_codes: list[int] | None = None) -> dict:
+    _, body = await fetch_url_async(url, inject_headers, payload, method, accept_codes)
+    try:
+        return json.loads(body)
+    except ValueError as e:
+        raise ValueError(f"Invalid JSON from {url}") from e
+
+
+async def fetch_many_async(urls: list[str], concurrency: int = 8, inject_headers: dict = None,
+                           method: str = 'get', accept_codes: list[int] | None = None) -> list[FetchResult]:
+    """
+    并发请求多个地址，结果按 urls 的顺序返回。
+    单个请求失败时对应结果的 error 不为空，调用方自行决定是否忽略
+    """
+    method = method.lower()
+    if method not in ('post', 'get'):
+        raise ValueError("Parameter method must be either 'post' or 'get'.")
+    return await get_async_http_client().fetch_many(urls, concurrency, method, inject_headers, accept_codes)
+
+
+def fetch_many(urls: list[str], concurrency: int = 8, inject_headers: dict = None,
+               method: str = 'get', accept_codes: list[int] | None = None) -> list[FetchResult]:
+    """fetch_many_async 的同步版本，供工作线程中的指令使用，不可在事件循环中调用"""
+    if len(urls) == 0:
+        return []
+    return run_sync(fetch_many_async(urls, concurrency, inject_headers, method, accept_codes))
+
+
 def fetch_url_element(url: str, accept_codes: list[int] | None = None) -> Element:
     response = fetch_url(url, method='get', accept_codes=accept_codes)
     return etree.HTML(response.text)
@@ -210,32 +282,107 @@ def check_is_float(value: str) -> bool:
         return False
 
 
-def download_img(url: str, file_path: str) -> bool:
-    headers = {
-        'User-Agent': "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
-                      "Chrome/91.0.4472.77 Safari/537.36"
-    }
-    url = patch_https_url(url)
+@dataclass(frozen=True)
+class DownloadResult:
+    """下载完成的文件，哈希在写入时同步计算，无需再次读取文件"""
+    path: str
+    size: int
+    md5: str
+    sha256: str
 
-    sess = requests.session()
-    sess.mount("https://", SSLAdapter())  # 将上面定义的SSLAdapter 应用起来
 
-    response = sess.get(url, headers=headers, verify=False)  # 阻止ssl验证
+_DOWNLOAD_CHUNK = 64 * 1024
+_img_session: requests.Session | None = None
+_img_session_lock = threading.Lock()
+_download_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="ImgDownload")
 
-    if response.status_code == 200:
-        parent_path = os.path.dirname(file_path)
-        os.makedirs(parent_path, exist_ok=True)
 
-        with open(file_path, "wb") as f:
-            f.write(response.content)
-            f.close()
+def _get_img_session() -> requests.Session:
+    """下载图片共用的会话，保持与图床的连接"""
+    global _img_session
+    with _img_session_lock:
+        if _img_session is None:
+            _img_session = requests.Session()
+            _img_session.headers.update({'User-Agent': USER_AGENT})
+            _img_session.mount("https://", SSLAdapter(pool_maxsize=8))  # 将下面定义的SSLAdapter 应用起来
+        return _img_session
 
-        return True
 
-    return False
+def download_img(url: str, file_path: str, max_size: int | None = None) -> DownloadResult | None:
+    """
+    以流的形式下载图片到 file_path，边写入边计算哈希，内存占用与文件大小无关
+
+    :param max_size: 文件大小上限 (字节)，为空时使用 general.http.max_download_bytes
+    :return: 下载失败或超过大小上限时为 None
+    """
+    if max_size is None:
+        max_size = Constants.modules_conf.general.get('http', {}).get('max_download_bytes', 20 << 20)
+    url = patch_https_url(url)
+
+    check_cancelled()
+    response = _get_img_session().get(url, verify=False, stream=True,  # 阻止ssl验证
+                                      timeout=clamp_timeout(_REQUEST_TIMEOUT))
+    with response:
+        if response.status_code != 200:
+            return None
+        if int(response.headers.get('Content-Length') or 0) > max_size:
+            Constants.log.warning(f"[network] 图片 {url} 超过大小上限，已跳过")
+            return None
+
+        parent_path = os.path.dirname(file_path)
+        os.makedirs(parent_path, exist_ok=True)
+
+        md5, sha256, size = hashlib.md5(), hashlib.sha256(), 0
+        part_path = f"{file_path}.part"
+        try:
+            with open(part_path, "wb") as f:
+                for chunk in response.iter_content(_DOWNLOAD_CHUNK):
+                    check_cancelled()
+                    size += len(chunk)
+                    if size > max_size:  # 未提供 Content-Length 或与实际不符
+                        Constants.log.warning(f"[network] 图片 {url} 超过大小上限，已跳过")
+                        return None
+                    f.write(chunk)
+                    md5.update(chunk)
+                    sha256.update(chunk)
+            os.replace(part_path, file_path)
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    return DownloadResult(path=file_path, size=size, md5=md5.hexdigest(), sha256=sha256.hexdigest())
+
+
+def download_imgs(targets: list[tuple[str, str]], max_size: int | None = None) -> list[DownloadResult | None]:
+    """
+    并发下载多张图片，结果按 targets 的顺序返回，下载失败的图片对应 None。
+    指令被取消时删除已下载完成的图片后抛出
+
+    :param targets: (url, file_path) 列表
+    """
+    futures = [_download_executor.submit(contextvars.copy_context().run, download_img, url, file_path, max_size)
+               for url, file_path in targets]
+    results, cancelled = [], None
+    for future, (url, _) in zip(futures, targets):
+        try:
+            results.append(future.result())
+        except OperationCancelledError as e:
+            cancelled = cancelled or e
+            results.append(None)
+        except Exception as e:
+            Constants.log.warning(f"[network] 下载图片 {url} 失败: {e}")
+            results.append(None)
+
+    if cancelled is not None:
+        for result in results:
+            if result is not None and os.path.exists(result.path):
+                os.remove(result.path)
+        raise cancelled
+    return results
 
 
 def png2jpg(path: str, remove_origin: bool = True) -> str:
+    check_cancelled()
     img = Image.open(path)
     new_path = os.path.splitext(path)[0] + '.jpg'
     img.convert('RGB').save(new_path)
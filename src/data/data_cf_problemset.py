@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from src.core.constants import Constants
+
+_lib_path = Constants.modules_conf.get_lib_path("Codeforces")
+_data_path = os.path.join(_lib_path, "problemset.npz")
+
+_NEWER_CONTEST_ID = 1000  # 非远古题的起始比赛
+
+
+class ProblemIndex:
+    """
+    Codeforces 题库的本地索引，每道题占用数组中的一个位置，按 (contestId, index) 排序。
+
+    标签以位图保存，每 64 个标签占用一列 uint64，难度未评定时为 -1，
+    筛选均为数组上的位运算与比较，非远古题为 contestId 有序数组上的一段连续区间
+    """
+
+    def __init__(self, contest_ids: np.ndarray, indices: np.ndarray, names: np.ndarray,
+                 ratings: np.ndarray, tag_bits: np.ndarray, tag_names: np.ndarray, refreshed_at: float):
+        self.contest_ids = contest_ids
+        self.indices = indices
+        self.names = names
+        self.ratings = ratings
+        self.tag_bits = tag_bits
+        self.tag_names = tag_names
+        self.refreshed_at = refreshed_at
+        self._tag_ids = {}
+        for tag_id, tag in enumerate(tag_names.tolist()):  # 指令中的标签以 - 代替空格
+            self._tag_ids[tag] = self._tag_ids[tag.replace(' ', '-')] = tag_id
+        self._positions = {f'{contest_id}{index}': pos
+                           for pos, (contest_id, index) in enumerate(zip(contest_ids.tolist(), indices.tolist()))}
+        self._newer_start = int(np.searchsorted(contest_ids, _NEWER_CONTEST_ID, side='left'))
+
+    @classmethod
+    def build(cls, problems: list[tuple]) -> "ProblemIndex":
+        """
+        由题目列表构建索引
+
+        :param problems: (contestId, index, name, rating, tags) 元组的列表，与 Codeforces._PROBLEM_FIELDS 一致
+        """
+        problems = sorted(problems, key=lambda prob: (prob[0] or 0, prob[1] or ''))
+        tag_names = sorted({tag for prob in problems for tag in (prob[4] or [])})
+        tag_ids = {tag: tag_id for tag_id, tag in enumerate(tag_names)}
+
+        tag_bits = np.zeros((len(problems), max(1, (len(tag_names) + 63) // 64)), dtype=np.uint64)
+        for pos, prob in enumerate(problems):
+            for tag in prob[4] or []:
+                tag_id = tag_ids[tag]
+                tag_bits[pos, tag_id >> 6] |= np.uint64(1 << (tag_id & 63))
+
+        return cls(contest_ids=np.array([prob[0] or 0 for prob in problems], dtype=np.int32),
+                   indices=np.array([prob[1] or '' for prob in problems], dtype=np.str_),
+                   names=np.array([prob[2] or '' for prob in problems], dtype=np.str_),
+                   ratings=np.array([-1 if prob[3] is None else prob[3] for prob in problems], dtype=np.int16),
+                   tag_bits=tag_bits, tag_names=np.array(tag_names, dtype=np.str_),
+                   refreshed_at=time.time())
+
+    def __len__(self) -> int:
+        return len(self.contest_ids)
+
+    @property
+    def tags(self) -> list[str]:
+        return [str(tag) for tag in self.tag_names]
+
+    def select(self, tag: str | None = None, rating_range: tuple[int, int] | None = None,
+               newer: bool = False, excludes: set[str] | None = None) -> np.ndarray:
+        """
+        返回满足所有条件的题目位置
+
+        :param tag: 题目需包含的标签，空格可以替换为 -，为 None 时不限制
+        :param rating_range: 闭区间，未评定难度的题目不会被选中
+        :param excludes: 排除的题目，格式为 contestId + index
+        """
+        begin = self._newer_start if newer else 0
+        mask = np.ones(len(self) - begin, dtype=bool)
+
+        if tag is not None:
+            tag_id = self._tag_ids.get(tag)
+            if tag_id is None:
+                return np.empty(0, dtype=np.intp)
+            mask &= (self.tag_bits[begin:, tag_id >> 6] & np.uint64(1 << (tag_id & 63))) != 0
+
+        if rating_range is not None:
+            ratings = self.ratings[begin:]
+            mask &= (ratings >= max(0, rating_range[0])) & (ratings <= rating_range[1])
+
+        for key in excludes or ():
+            pos = self._positions.get(key)
+            if pos is not None and pos >= begin:
+                mask[pos - begin] = False
+
+        return np.flatnonzero(mask) + begin
+
+    def problem_at(self, pos: int) -> dict:
+        """与 problemset.problems 中的题目格式一致，不存在的字段不包含在内"""
+        problem = {'contestId': int(self.contest_ids[pos]), 'index': str(self.indices[pos]),
+                   'name': str(self.names[pos])}
+        if self.ratings[pos] >= 0:
+            problem['rating'] = int(self.ratings[pos])
+        problem['tags'] = [str(tag) for tag_id, tag in enumerate(self.tag_names)
+                           if int(self.tag_bits[pos, tag_id >> 6]) >> (tag_id & 63) & 1]
+        return problem
+
+
+_index: ProblemIndex | None = None
+_index_lock = threading.Lock()
+
+
+def save_problem_index(index: ProblemIndex):
+    os.makedirs(os.path.dirname(_data_path), exist_ok=True)
+    tmp_path = f"{_data_path}.tmp.npz"  # savez 会为没有 .npz 后缀的路径补上后缀
+    np.savez(tmp_path, contest_ids=index.contest_ids, indices=index.indices, names=index.names,
+             ratings=index.ratings, tag_bits=index.tag_bits, tag_names=index.tag_names,
+             refreshed_at=np.array(index.refreshed_at))
+    os.replace(tmp_path, _data_path)
+
+
+def _load_problem_index() -> ProblemIndex | None:
+    if not os.path.exists(_data_path):
+        return None
+    try:
+        with np.load(_data_path, allow_pickle=False) as data:
+            return ProblemIndex(contest_ids=data['contest_ids'], indices=data['indices'], names=data['names'],
+                                ratings=data['ratings'], tag_bits=data['tag_bits'], tag_names=data['tag_names'],
+                                refreshed_at=float(data['refreshed_at']))
+    except (OSError, KeyError, ValueError) as e:
+        Constants.log.warning(f"[caching] 读取 Codeforces 题库索引失败: {e}")
+        return None
+
+
+def get_problem_index() -> ProblemIndex | None:
+    """获取当前的题库索引，首次调用时从磁盘读取，尚未建立过索引时返回 None"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = _load_problem_index()
+        return _index
+
+
+def set_problem_index(index: ProblemIndex, no_save: bool = False):
+    """替换当前的题库索引并持久化，正在进行的查询仍使用旧的索引"""
+    global _index
+    with _index_lock:
+        _index = index
+    if not no_save:
+        save_problem_index(index)
@@ -0,0 +1,165 @@
+import datetime
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+
+from src.core.constants import Constants
+from src.data.model.json_storage import JsonSerializer, load_data, save_data
+
+_lib_path = Constants.modules_conf.get_lib_path("Codeforces")
+_data_dir = os.path.join(_lib_path, "submissions")
+
+_PENDING_VERDICTS = {None, "TESTING"}
+_HANDLE_PATTERN = re.compile(r'[A-Za-z0-9_.-]+')
+_MAX_CACHED_HANDLES = 256
+
+
+def _day_start_of(timestamp: int) -> int:
+    """时间戳所在自然日的零点，与 get_today_start_timestamp 一致"""
+    day = datetime.date.fromtimestamp(timestamp)
+    return int(datetime.datetime.combine(day, datetime.time.min).timestamp())
+
+
+@dataclass
+class SubmissionStore:
+    """
+    单个用户的提交摘要，只保存统计需要的信息
+
+    :param last_id: 此编号及之前的提交均已评测完成并计入，之后只需要获取更新的提交
+    :param submitted: 提交过的题目，格式为 contestId + index
+    :param solved: 通过的题目，格式为 contestId-index，值为最后一次通过的时间
+    :param solved_per_day: 每天零点的时间戳 -> 最后一次通过在当天的题数
+    """
+    handle: str
+    last_id: int = 0
+    submitted: set[str] = field(default_factory=set)
+    solved: dict[str, int] = field(default_factory=dict)
+    solved_per_day: dict[int, int] = field(default_factory=dict)
+    synced_at: float = 0
+
+    def merge(self, submissions: list[tuple]) -> bool:
+        """
+        计入新的提交，重复计入同一提交不影响结果，返回是否有新的提交
+
+        :param submissions: (id, creationTimeSeconds, verdict, contestId, index) 元组的列表
+        """
+        pending_id = None
+        newest_id = self.last_id
+        for submit_id, created, verdict, contest_id, index in submissions:
+            if submit_id <= self.last_id:
+                continue
+            newest_id = max(newest_id, submit_id)
+            if contest_id is not None:  # 特判 problemsets/acmsguru
+                self.submitted.add(f'{contest_id}{index}')
+            if verdict in _PENDING_VERDICTS:  # 评测中的提交在之后重新获取
+                pending_id = submit_id if pending_id is None else min(pending_id, submit_id)
+                continue
+            if verdict != "OK":
+                continue
+            prob_key = f'{contest_id}-{index}'
+            solved_at = self.solved.get(prob_key)
+            if solved_at is not None and solved_at >= created:
+                continue
+            if solved_at is not None:
+                self._add_day(solved_at, -1)
+            self.solved[prob_key] = created
+            self._add_day(created, 1)
+
+        changed = newest_id > self.last_id
+        self.last_id = newest_id if pending_id is None else max(self.last_id, pending_id - 1)
+        return changed
+
+    def _add_day(self, timestamp: int, delta: int):
+        day = _day_start_of(timestamp)
+        count = self.solved_per_day.get(day, 0) + delta
+        if count > 0:
+            self.solved_per_day[day] = count
+        else:
+            self.solved_per_day.pop(day, None)
+
+    def count_solved(self, week_start: int, today_start: int) -> tuple[int, int, int]:
+        """总过题数，本周过题数，今日过题数"""
+        weekly = sum(count for day, count in self.solved_per_day.items() if day >= week_start)
+        return len(self.solved), weekly, self.solved_per_day.get(today_start, 0)
+
+
+class SubmissionStoreJson(JsonSerializer):
+
+    @classmethod
+    def serialize(cls, target: SubmissionStore) -> dict:
+        raw = asdict(target)
+        raw['submitted'] = sorted(target.submitted)
+        return raw
+
+    @classmethod
+    def deserialize(cls, target: dict) -> SubmissionStore:
+        if not target:
+            return SubmissionStore(handle="")
+        target['submitted'] = set(target['submitted'])
+        target['solved_per_day'] = {int(day): count for day, count in target['solved_per_day'].items()}
+        return SubmissionStore(**target)
+
+
+# 均按最近使用排序，只保留最近使用的若干个用户
+_stores: OrderedDict[str, SubmissionStore] = OrderedDict()
+_locks: OrderedDict[str, threading.Lock] = OrderedDict()
+_stores_lock = threading.Lock()
+
+
+def _key_of(handle: str) -> str:
+    """校验用户名仅含 Codeforces 允许的字符，避免拼接出数据目录以外的路径"""
+    if not _HANDLE_PATTERN.fullmatch(handle) or '..' in handle:
+        raise ValueError(f"Invalid codeforces handle: {handle!r}")
+    return handle.lower()
+
+
+def _data_path_of(handle: str) -> str:
+    return os.path.join(_data_dir, f"{_key_of(handle)}.json")
+
+
+def _evict(cache: OrderedDict, keep: str):
+    """
+    淘汰最久未使用的记录，需持有 _stores_lock
+    有更新的摘要已经持久化，淘汰后下次从磁盘读取；正在更新的用户不淘汰
+    """
+    for key in list(cache):
+        if len(cache) <= _MAX_CACHED_HANDLES:
+            break
+        lock = _locks.get(key)
+        if key == keep or (lock is not None and lock.locked()):
+            continue
+        del cache[key]
+
+
+def lock_of(handle: str) -> threading.Lock:
+    """同一用户的提交同时只进行一次更新"""
+    key = _key_of(handle)
+    with _stores_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+        _locks.move_to_end(key)
+        _evict(_locks, key)
+        return lock
+
+
+def get_submission_store(handle: str) -> SubmissionStore:
+    """获取用户的提交摘要，首次调用时从磁盘读取，尚未记录过的用户返回空的摘要"""
+    key = _key_of(handle)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is not None:
+            _stores.move_to_end(key)
+            return store
+
+    path = _data_path_of(handle)
+    store = load_data({}, path, SubmissionStoreJson) if os.path.exists(path) else SubmissionStore(handle)
+    store.handle = handle
+    with _stores_lock:
+        store = _stores.setdefault(key, store)
+        _evict(_stores, key)
+        return store
+
+
+def save_submission_store(store: SubmissionStore):
+    save_data(store, _data_path_of(store.handle), SubmissionStoreJson)
@@ -0,0 +1,31 @@
+import os
+import time
+
+from src.core.constants import Constants
+from src.data.model.json_storage import NoSerialize, load_data, save_data
+
+_lib_path = Constants.modules_conf.get_lib_path("Transit")
+_data_path = os.path.join(_lib_path, "message_journal.json")
+
+_JOURNAL_TTL = 5 * 60  # 被动回复的有效期，超过后重放也无法回复
+
+
+def save_journal(entries: list[dict]):
+    """将重启前尚未处理的消息写入日志，覆盖旧的日志"""
+    save_data({"saved_at": time.time(), "entries": entries}, _data_path, NoSerialize)
+
+
+def pop_journal() -> list[dict]:
+    """读取并清空日志，过期的消息会被丢弃"""
+    if not os.path.exists(_data_path):
+        return []
+
+    journal = load_data({}, _data_path, NoSerialize)
+    os.remove(_data_path)
+
+    now = time.time()
+    entries = [entry for entry in journal.get("entries", [])
+               if now - entry.get("received_at", 0) <= _JOURNAL_TTL]
+    if len(entries) < len(journal.get("entries", [])):
+        Constants.log.warning(f"[obot-core] 丢弃了 {len(journal['entries']) - len(entries)} 条过期的排队消息")
+    return entries
@@ -2,7 +2,7 @@ import os
 from dataclasses import dataclass, asdict
 
 from src.core.constants import Constants
-from src.core.util.tools import rand_str_len32, download_img, get_md5
+from src.core.util.tools import rand_str_len32, download_imgs
 from src.data.model.json_storage import JsonSerializer, load_data, NoSerialize, save_data
 
 _lib_path = Constants.modules_conf.get_lib_path("Pick-One")
@@ -109,24 +109,22 @@ def accept_attachment(img_key: str, need_audit: bool, attachments: list[str]) ->
     real_dir_path = _get_img_dir_path(img_key, audit=False)
     cnt, ok, duplicate = len(attachments), 0, 0
 
-    for attach in attachments:
-        if not getattr(attach, 'content_type', '').startswith('image'):
-            continue  # 不是图片
+    # 全都保存为 *.gif，客户端会自动解析，且这样便于判重
+    images = [attach for attach in attachments if getattr(attach, 'content_type', '').startswith('image')]
+    results = download_imgs([(getattr(attach, 'url'), os.path.join(dir_path, f"{rand_str_len32()}.gif"))
+                             for attach in images])  # 并发下载，下载时已计算 md5
 
-        # 全都保存为 *.gif，客户端会自动解析，且这样便于判重
-        file_path = os.path.join(dir_path, f"{rand_str_len32()}.gif")
-        response = download_img(getattr(attach, 'url'), file_path)
+    for result in results:
+        if result is None:
+            continue
 
-        if response:
-            md5 = get_md5(file_path)
+        if (os.path.exists(os.path.join(real_dir_path, f"{result.md5}.gif")) or
+                os.path.exists(os.path.join(dir_path, f"{result.md5}.gif"))):
+            os.remove(result.path)
+            duplicate += 1  # 图片重复
+            continue
 
-            if (os.path.exists(os.path.join(real_dir_path, f"{md5}.gif")) or
-                    os.path.exists(os.path.join(dir_path, f"{md5}.gif"))):
-                os.remove(file_path)
-                duplicate += 1  # 图片重复
-                continue
-
-            os.rename(file_path, os.path.join(dir_path, f"{md5}.gif"))
-            ok += 1
+        os.rename(result.path, os.path.join(dir_path, f"{result.md5}.gif"))
+        ok += 1
 
     return cnt, ok, duplicate
@@ -10,7 +10,7 @@ _ATC_HELP = '\n'.join(HelpStrList(Constants.help_contents["atcoder"]))
 
 
 def send_user_id_card(message: RobotMessage, handle: str):
-    message.reply(f"正在查询 {handle} 的 AtCoder 基础信息，请稍等")
+    message.progress(f"正在查询 {handle} 的 AtCoder 基础信息，请稍等")
 
     id_card = AtCoder.get_user_id_card(handle)
 
@@ -25,7 +25,7 @@ def send_user_id_card(message: RobotMessage, handle: str):
 
 
 def send_user_info(message: RobotMessage, handle: str):
-    message.reply(f"正在查询 {handle} 的 AtCoder 平台信息，请稍等")
+    message.progress(f"正在查询 {handle} 的 AtCoder 平台信息，请稍等")
 
     user = AtCoder.get_user_info(handle)
     if user is None:
@@ -43,7 +43,7 @@ def send_user_info(message: RobotMessage, handle: str):
 
 
 def send_prob_filter_tag(message: RobotMessage, contest_type: str, limit: str = None) -> bool:
-    message.reply("正在随机选题，请稍等")
+    message.progress("正在随机选题，请稍等")
 
     chosen_prob = AtCoder.get_prob_filtered(contest_type, limit)
 
@@ -73,7 +73,7 @@ def send_prob_filter_tag(message: RobotMessage, contest_type: str, limit: str =
 
 
 def send_contest(message: RobotMessage):
-    message.reply("正在查询近期 AtCoder 比赛，请稍等")
+    message.progress("正在查询近期 AtCoder 比赛，请稍等")
 
     running, upcoming, finished = AtCoder.get_contest_list()
 
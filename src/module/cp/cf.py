@@ -1,11 +1,13 @@
+import asyncio
 import copy
 import random
 import string
 import threading
 import time
 from dataclasses import dataclass
+from typing import Callable
 
-from src.core.bot.decorator import command, module
+from src.core.bot.decorator import command, module, scheduled
 from src.core.bot.message import RobotMessage
 from src.core.constants import Constants, HelpStrList
 from src.core.util.tools import check_is_int, get_simple_qrcode, png2jpg, format_int_delta
@@ -66,7 +68,7 @@ def send_binding(message: RobotMessage):
 
 
 def send_user_id_card(message: RobotMessage, handle: str):
-    message.reply(f"正在查询 {handle} 的 Codeforces 基础信息，请稍等")
+    message.progress(f"正在查询 {handle} 的 Codeforces 基础信息，请稍等")
 
     id_card = Codeforces.get_user_id_card(handle)
     if not id_card:
@@ -80,7 +82,7 @@ def send_user_id_card(message: RobotMessage, handle: str):
 
 
 def send_user_info(message: RobotMessage, handle: str):
-    message.reply(f"正在查询 {handle} 的 Codeforces 平台信息，请稍等")
+    message.progress(f"正在查询 {handle} 的 Codeforces 平台信息，请稍等")
 
     user = Codeforces.get_user_info(handle)
     if not user:
@@ -104,8 +106,35 @@ def send_user_info(message: RobotMessage, handle: str):
     message.reply(content, img_url=avatar, modal_words=False)
 
 
+async def send_user_info_async(message: RobotMessage, handle: str):
+    message.progress(f"正在查询 {handle} 的 Codeforces 平台信息，请稍等")
+
+    user = await Codeforces.get_user_info_async(handle)
+    if not user:
+        content = (f"[Codeforces] {handle}\n\n"
+                   "用户不存在")
+        avatar = None
+    else:
+        info, avatar = user
+        last_contest, last_submit, (total_sums, weekly_sums, daily_sums) = await asyncio.gather(
+            Codeforces.get_user_last_contest_async(handle),
+            Codeforces.get_user_last_submit_async(handle),
+            Codeforces.get_user_submit_counts_async(handle)
+        )  # 互不依赖的请求并发进行
+        daily = "今日暂无过题" if daily_sums == 0 else f"今日通过 {daily_sums} 题"
+        weekly = "" if weekly_sums == 0 else f"，本周共通过 {weekly_sums} 题"
+        content = (f"[Codeforces] {handle}\n\n"
+                   f"{info}\n"
+                   f"通过题数: {total_sums}\n\n"
+                   f"{last_contest}\n\n"
+                   f"{daily}{weekly}\n"
+                   f"{last_submit}")
+
+    await message.reply_async(content, img_url=avatar, modal_words=False)
+
+
 def send_user_last_submit(message: RobotMessage, handle: str, count: int):
-    message.reply(f"正在查询 {handle} 的 Codeforces 提交记录，请稍等")
+    message.progress(f"正在查询 {handle} 的 Codeforces 提交记录，请稍等")
 
     user = Codeforces.get_user_info(handle)
     if not user:
@@ -122,7 +151,7 @@ def send_user_last_submit(message: RobotMessage, handle: str, count: int):
 
 
 def send_prob_tags(message: RobotMessage):
-    message.reply("正在查询 Codeforces 平台的所有问题标签，请稍等")
+    message.progress("正在查询 Codeforces 平台的所有问题标签，请稍等")
 
     prob_tags = Codeforces.get_prob_tags_all()
     content = "[Codeforces] 问题标签:\n" + "\n".join(prob_tags)
@@ -131,7 +160,7 @@ def send_prob_tags(message: RobotMessage):
 
 
 def send_prob_filter_tag(message: RobotMessage, prob_info: ProbInfo) -> bool:
-    message.reply("正在随机选题，请稍等")
+    message.progress("正在随机选题，请稍等")
 
     validation_status = Codeforces.validate_prob_filtered(prob_info,
                                                           on_tag_chosen=lambda x: message.reply(x))
@@ -167,7 +196,7 @@ def send_prob_link(message: RobotMessage, chosen_prob: dict, hide_tag: bool = Fa
 
 
 def send_contest(message: RobotMessage):
-    message.reply("正在查询近期 Codeforces 比赛，请稍等")
+    message.progress("正在查询近期 Codeforces 比赛，请稍等")
 
     running, upcoming, finished = Codeforces.get_contest_list()
 
@@ -179,8 +208,8 @@ def send_contest(message: RobotMessage):
 
 
 def send_user_contest_standings(message: RobotMessage, handle: str, contest_id: str):
-    message.reply(f"正在查询编号为 {contest_id} 的比赛中 {handle} 的榜单信息，请稍等。\n"
-                  f"查询对象为参赛者时将会给出 Rating 变化预估，但可能需要更久的时间")
+    message.progress(f"正在查询编号为 {contest_id} 的比赛中 {handle} 的榜单信息，请稍等。\n"
+                     f"查询对象为参赛者时将会给出 Rating 变化预估，但可能需要更久的时间")
     content = f"[Codeforces] {handle} 比赛榜单查询\n\n"
 
     user = Codeforces.get_user_info(handle)
@@ -424,7 +453,44 @@ def finish_duel(message: RobotMessage):
                   modal_words=False)
 
 
-@command(tokens=['cf', 'codeforces'])
+_CF_COALESCE_FUNCS = {"identity", "id", "card", "info", "user", "recent", "contest", "contests",
+                      "status", "stand", "standing", "standings", "tag", "tags", "logo", "icon"}
+
+
+def _cf_coalesce_key(message: RobotMessage) -> tuple | None:
+    """只合并结果与发起人无关的查询类子指令"""
+    tokens = message.tokens
+    if len(tokens) < 2 or tokens[1] not in _CF_COALESCE_FUNCS:
+        return None
+    return tuple(tokens[1:])  # 回复中会原样带上 handle，大小写不同的请求不合并
+
+
+@scheduled(cron="20 */6 * * *", targets=[], no_target=True)
+def refresh_prob_index():
+    """定时更新本地题库索引，失败时继续使用旧的索引"""
+    try:
+        Codeforces.refresh_problem_index()
+    except Exception as e:
+        Constants.log.warning("[caching] 更新 Codeforces 题库索引失败，继续使用旧的索引")
+        Constants.log.exception(f"[caching] {e}")
+
+
+async def reply_cf_info_async(message: RobotMessage):
+    try:
+        await send_user_info_async(message, message.tokens[2])
+    except Exception as e:
+        message.report_exception('Codeforces', e)
+
+
+def _cf_fast_path(message: RobotMessage) -> Callable | None:
+    """纯网络请求的子指令直接在事件循环上执行，其余子指令仍在工作线程中排队"""
+    content = message.tokens
+    if len(content) == 3 and content[1] in ("info", "user"):
+        return reply_cf_info_async
+    return None
+
+
+@command(tokens=['cf', 'codeforces'], coalesce=_cf_coalesce_key, fast_path=_cf_fast_path)
 def reply_cf_request(message: RobotMessage):
     try:
         content = message.tokens
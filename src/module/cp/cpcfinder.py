@@ -22,7 +22,7 @@ def reply_cpcfinder(message: RobotMessage):
 
         stu_name, stu_school = content[1], content[2]
 
-        message.reply('正在查询 XCPC 选手信息，请稍等')
+        message.progress('正在查询 XCPC 选手信息，请稍等')
         stu_id = CPCFinder.find_student_id(stu_name, stu_school)
 
         if isinstance(stu_id, int):
@@ -10,7 +10,7 @@ _NK_HELP = '\n'.join(HelpStrList(Constants.help_contents["nowcoder"]))
 
 
 def send_user_id_card(message: RobotMessage, handle: str):
-    message.reply(f"正在查询 {handle} 的 NowCoder 基础信息，请稍等")
+    message.progress(f"正在查询 {handle} 的 NowCoder 基础信息，请稍等")
 
     id_card = NowCoder.get_user_id_card(handle)
     if not id_card:
@@ -24,7 +24,7 @@ def send_user_id_card(message: RobotMessage, handle: str):
 
 
 def send_user_info(message: RobotMessage, handle: str):
-    message.reply(f"正在查询 {handle} 的 NowCoder 平台信息，请稍等")
+    message.progress(f"正在查询 {handle} 的 NowCoder 平台信息，请稍等")
 
     user = NowCoder.get_user_info(handle)
     if not user:
@@ -42,7 +42,7 @@ def send_user_info(message: RobotMessage, handle: str):
 
 
 def send_contest(message: RobotMessage):
-    message.reply("正在查询近期 NowCoder 比赛，请稍等")
+    message.progress("正在查询近期 NowCoder 比赛，请稍等")
 
     running, upcoming, finished = NowCoder.get_contest_list()
 
@@ -54,7 +54,7 @@ def send_contest(message: RobotMessage):
 
 
 def send_user_contest_standings(message: RobotMessage, search_name: str, contest_name: str):
-    message.reply(f"正在查询匹配 {contest_name} 的比赛中 {search_name} 的榜单信息，请稍等")
+    message.progress(f"正在查询匹配 {contest_name} 的比赛中 {search_name} 的榜单信息，请稍等")
     content = f"[NowCoder] {search_name} 比赛榜单查询\n\n"
 
     standings = NowCoder.get_user_contest_standings(search_name, contest_name)
@@ -32,7 +32,7 @@ def reply_oierdb(message: RobotMessage):
             return
 
         # 执行查询
-        message.reply('正在查询 OI 选手信息，请稍等')
+        message.progress('正在查询 OI 选手信息，请稍等')
         if len(names) == 1:
             # 单个选手详细查询
             response = _query_single_player(names[0])
@@ -248,7 +248,7 @@ def push_yesterday_board(message: RobotMessage):
 def _send_user_info(message: RobotMessage, content: str, by_name: bool = False):
     type_name = "用户名" if by_name else " uid "
     type_id = "name" if by_name else "uid"
-    message.reply(f"正在查询{type_name}为 {content} 的用户数据，请稍等")
+    message.progress(f"正在查询{type_name}为 {content} 的用户数据，请稍等")
 
     cached_prefix = get_cached_prefix('Peeper-Board-Generator')
     run = _call_lib_method(message,
@@ -261,7 +261,7 @@ def _send_user_info(message: RobotMessage, content: str, by_name: bool = False):
         message.reply(f"[{type_id.capitalize()} {content}]\n\n{result}", modal_words=False)
 
 
-@command(tokens=['评测榜单', 'verdict'])
+@command(tokens=['评测榜单', 'verdict'], timeout=300)
 def send_now_board_with_verdict(message: RobotMessage):
     content = message.tokens[1] if len(message.tokens) >= 2 else ""
     conf_id = message.tokens[2] if len(message.tokens) >= 3 else None
@@ -270,7 +270,7 @@ def send_now_board_with_verdict(message: RobotMessage):
         message.reply("请在 /评测榜单 后面添加正确的参数，如 ac, Accepted, TimeExceeded, WrongAnswer")
         return
 
-    message.reply(f"正在查询今日 {verdict} 榜单，请稍等")
+    message.progress(f"正在查询今日 {verdict} 榜单，请稍等")
 
     cached_prefix = get_cached_prefix('Peeper-Board-Generator')
     run = _call_lib_method(message,
@@ -282,10 +282,10 @@ def send_now_board_with_verdict(message: RobotMessage):
     message.reply(f"今日 {verdict} 榜单", png2jpg(f"{cached_prefix}.png"))
 
 
-@command(tokens=['今日题数', 'today'])
+@command(tokens=['今日题数', 'today'], timeout=300)
 def send_today_board(message: RobotMessage):
     conf_id = message.tokens[1] if len(message.tokens) >= 2 else None
-    message.reply("正在查询今日题数，请稍等")
+    message.progress("正在查询今日题数，请稍等")
 
     cached_prefix = get_cached_prefix('Peeper-Board-Generator')
     run = _call_lib_method(message,
@@ -297,12 +297,12 @@ def send_today_board(message: RobotMessage):
     message.reply("今日题数", png2jpg(f"{cached_prefix}.png"))
 
 
-@command(tokens=['昨日总榜', 'yesterday', 'full'])
+@command(tokens=['昨日总榜', 'yesterday', 'full'], timeout=300)
 def send_yesterday_board(message: RobotMessage):
     conf_id = message.tokens[1] if len(message.tokens) >= 2 else None
 
     if not message.is_active():
-        message.reply("正在查询昨日总榜，请稍等")
+        message.progress("正在查询昨日总榜，请稍等")
 
     cached_prefix = get_cached_prefix('Peeper-Board-Generator')
     run = _call_lib_method(message,
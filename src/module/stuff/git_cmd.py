@@ -1,13 +1,12 @@
 import os
 import sys
-import time
 
 import git
 
 from src.core.bot.decorator import module, command
 from src.core.bot.message import RobotMessage
 from src.core.bot.perm import PermissionLevel
-from src.core.bot.transit import clear_message_queue
+from src.core.bot.transit import drain_for_restart
 from src.core.constants import Constants, InvalidGitCommit, HelpStrList
 from src.core.util.output_cache import get_cached_prefix
 
@@ -85,8 +84,7 @@ def reply_git_pull(message: RobotMessage):
 
     checkout_tip = f"，切换到分支 {checkout}" if checkout else ""
     message.reply(f"[Git-Commands] 正在拉取并应用更新{checkout_tip}")
-    clear_message_queue()
-    time.sleep(2)  # 等待 message 通知消息线程发送回复
+    drain_for_restart(Constants.modules_conf.transit.get("drain_timeout", 10))  # 未处理的消息由新进程重放
     Constants.log.info(f"[git] 拉取并应用更新{checkout_tip}")
 
     lib_path = Constants.modules_conf.get_lib_path("Git-Pull-Indep")
@@ -11,7 +11,7 @@ _version = "1.5.0"
 
 @command(tokens=['来道菜', '做菜', '菜', '饿了', '我饿了'])
 def reply_how_to_cook(message: RobotMessage):
-    message.reply("正在翻菜谱，请稍等")
+    message.progress("正在翻菜谱，请稍等")
     dishes = load_dishes()
 
     if len(dishes) == 0:
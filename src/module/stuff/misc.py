@@ -1,7 +1,9 @@
+import contextvars
 import os
 import random
 import re
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 from src.core.bot.decorator import command, get_all_modules_info, module
 from src.core.bot.interact import reply_fuzzy_matching
@@ -10,7 +12,7 @@ from src.core.constants import Constants
 from src.core.lib.huo_zi_yin_shua import HuoZiYinShua
 from src.core.util.img_transform import ImgSymmetric, apply_transform
 from src.core.util.tools import png2jpg, get_simple_qrcode, check_intersect, get_today_timestamp_range, fetch_url_json, \
-    check_is_int
+    check_is_int, fetch_url_json_async
 from src.core.util.output_cache import get_cached_prefix
 from src.data.data_dazs import get_dazs_resource
 from src.module.stuff.mc import reply_mc_sleep
@@ -34,21 +36,27 @@ _project_dir = os.path.abspath(
 )
 
 
-@command(tokens=list(_FIXED_REPLY.keys()))
+@command(tokens=list(_FIXED_REPLY.keys()), cost="light")
 def reply_fixed(message: RobotMessage):
     message.reply(_FIXED_REPLY.get(message.tokens[0][1:], ""), modal_words=False)
 
 
 @command(tokens=['contest', 'contests', '比赛', '近日比赛', '最近的比赛', '今天比赛', '今天的比赛', '今日比赛',
-                 '今日的比赛'])
+                 '今日的比赛'], coalesce=True)
 def reply_recent_contests(message: RobotMessage):
     query_today = message.tokens[0] in ['/今天比赛', '/今天的比赛', '/今日比赛', '/今日的比赛']
     tip_time_range = '今日' if query_today else '近期'
-    message.reply(f"正在查询{tip_time_range}比赛，请稍等")
+    message.progress(f"正在查询{tip_time_range}比赛，请稍等")
+
+    # 各平台互不依赖，并发获取，沿用当前指令的截止时间
+    platforms = [AtCoder, Codeforces, NowCoder, ManualPlatform]
+    with ThreadPoolExecutor(max_workers=len(platforms), thread_name_prefix="ContestFetch") as executor:
+        futures = [executor.submit(contextvars.copy_context().run, platform.get_contest_list)
+                   for platform in platforms]
+        contest_lists = [future.result() for future in futures]  # 按平台顺序，抛出首个平台的异常
 
     running_contests, upcoming_contests, finished_contests = [], [], []
-    for platform in [AtCoder, Codeforces, NowCoder, ManualPlatform]:
-        running, upcoming, finished = platform.get_contest_list()
+    for running, upcoming, finished in contest_lists:
         running_contests.extend(running)
         upcoming_contests.extend(upcoming)
         finished_contests.extend(finished)
@@ -106,7 +114,7 @@ def reply_qrcode(message: RobotMessage):
     message.reply("生成了一个二维码", png2jpg(f"{cached_prefix}.png"))
 
 
-@command(tokens=["晚安", "睡觉", "睡觉去了"], is_command=False)
+@command(tokens=["晚安", "睡觉", "睡觉去了"], is_command=False, cost="light")
 def reply_sleep(message: RobotMessage):
     reply_mc_sleep(message)
 
@@ -116,7 +124,7 @@ def reply_help(message: RobotMessage):
     cached_prefix = get_cached_prefix('Help-Renderer')
 
     if len(message.tokens) > 1 and message.tokens[1] in ['r', 'render', 'd', 'draw']:
-        message.reply("O宝正在画画，稍等一下")
+        message.progress("O宝正在画画，稍等一下")
         contest_list_img = HelpRenderer().render()
         contest_list_img.write_file(f"{cached_prefix}.png")
 
@@ -132,7 +140,7 @@ def reply_help(message: RobotMessage):
 
 @command(tokens=['api', 'about', '版本', '关于'])
 def reply_about(message: RobotMessage):
-    message.reply("O宝正在画画，稍等一下")
+    message.progress("O宝正在画画，稍等一下")
 
     cached_prefix = get_cached_prefix('About-Renderer')
     about_img = AboutRenderer(
@@ -159,12 +167,12 @@ def reply_hzys(message: RobotMessage):
 
 
 @command(tokens=["hitokoto", "来句", "来一句", "来句话", "来一句话"])
-def reply_hitokoto(message: RobotMessage):
-    data = fetch_url_json("https://v1.hitokoto.cn/", method='GET', accept_codes=[200])
+async def reply_hitokoto(message: RobotMessage):
+    data = await fetch_url_json_async("https://v1.hitokoto.cn/", method='GET', accept_codes=[200])
     content = data['hitokoto']
     where = data['from']
     author = data['from_who'] if data['from_who'] else ""
-    message.reply(f"[Hitokoto]\n{content}\nBy {author}「{where}」", modal_words=False)
+    await message.reply_async(f"[Hitokoto]\n{content}\nBy {author}「{where}」", modal_words=False)
 
 
 @command(tokens=["arcapk", "616sb", "guymygo"])
@@ -189,7 +197,7 @@ def reply_arcapk(message: RobotMessage):
                   f"{url_sendable}", png2jpg(f"{cached_prefix}.png"), modal_words=False)
 
 
-@command(tokens=["trans", "transform", "img_transform"])
+@command(tokens=["trans", "transform", "img_transform"], cost="light")
 def reply_img_transform(message: RobotMessage):
     if (len(message.tokens) != 3 or
             len(message.tokens[1]) != 1 or
@@ -209,7 +217,7 @@ def reply_img_transform(message: RobotMessage):
     message.reply(f"设置成功，在后续由你触发的指令中，{cnt} 张图片会 {way_desc}", modal_words=False)
 
 
-@command(tokens=["dazs", "答案之书"])
+@command(tokens=["dazs", "答案之书"], cost="light")
 def reply_dazs(message: RobotMessage):
     if len(message.tokens) == 1:
         message.reply("[答案之书] <empty>", modal_words=False)
@@ -1,4 +1,5 @@
 import re
+from typing import Callable
 
 from src.core.bot.decorator import command, module
 from src.core.bot.message import RobotMessage
@@ -65,7 +66,18 @@ def reply_rand_shuffle(message: RobotMessage):
         message.report_exception('Random.Shuffle', e)
 
 
-@command(tokens=["rand"])
+_HITOKOTO_FUNCS = ("word", "hitokoto", "sentence")
+
+
+def _rand_fast_path(message: RobotMessage) -> Callable | None:
+    """一言只有网络请求，直接在事件循环上执行，其余子指令仍在工作线程中排队"""
+    content = message.tokens
+    if len(content) >= 2 and content[1] in _HITOKOTO_FUNCS:
+        return reply_hitokoto
+    return None
+
+
+@command(tokens=["rand"], fast_path=_rand_fast_path)
 def reply_rand_request(message: RobotMessage):
     try:
         content = message.tokens
@@ -107,9 +119,6 @@ def reply_rand_request(message: RobotMessage):
 
             message.reply("参数错误，请输入 [1, 500] 内的数字")
 
-        elif func == "word" or func == "hitokoto" or func == "sentence":
-            reply_hitokoto(message)
-
         elif func == "color":
             reply_color_rand(message)
 
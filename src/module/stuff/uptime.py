@@ -1,23 +1,51 @@
+import asyncio
+
 from src.core.bot.decorator import command, module
 from src.core.bot.message import RobotMessage
 from src.core.constants import Constants
-from src.core.util.tools import fetch_url_json, png2jpg
+from src.core.util.exception import PlatformUnavailableError
+from src.core.util.http_client import get_host_guard
+from src.core.util.tools import fetch_url_json_async, png2jpg
 from src.core.util.output_cache import get_cached_prefix
 from src.render.pixie.render_uptime import UptimeRenderer
 
 _page_id = Constants.modules_conf.uptime["page_id"]
 
 
-@command(tokens=['alive', 'uptime'])
-def reply_alive(message: RobotMessage):
-    message.reply("正在查询服务状态，请稍等")
-    status = fetch_url_json(f"https://stats.uptimerobot.com/api/getMonitorList/{_page_id}",
-                            method='get')
-
+def _render_uptime(status: dict) -> str:
     cached_prefix = get_cached_prefix('Uptime')
     uptime_img = UptimeRenderer(status, cached_prefix).render()
     uptime_img.write_file(f"{cached_prefix}.png")
-    message.reply("当前服务状态", png2jpg(f"{cached_prefix}.png"))
+    return png2jpg(f"{cached_prefix}.png")
+
+
+def _format_breaker_states() -> str:
+    state_names = {"closed": "正常", "open": "暂停请求", "half_open": "正在探测"}
+    infos = []
+    for state in get_host_guard().states():
+        info = f"{state.host}: {state_names[state.state]}"
+        if state.state == "open":
+            info += f"，{state.retry_in:.0f}s 后重试"
+        elif state.failures > 0:
+            info += f"，连续失败 {state.failures} 次"
+        infos.append(info)
+    return '\n'.join(infos)
+
+
+@command(tokens=['alive', 'uptime'])
+async def reply_alive(message: RobotMessage):
+    message.progress("正在查询服务状态，请稍等")
+    breaker_info = _format_breaker_states()
+    breaker_info = f"\n\n上游平台状态\n{breaker_info}" if breaker_info else ""
+    try:
+        status = await fetch_url_json_async(f"https://stats.uptimerobot.com/api/getMonitorList/{_page_id}",
+                                            method='get')
+    except PlatformUnavailableError:
+        await message.reply_async(f"服务状态暂时无法获取{breaker_info}")
+        return
+
+    img_path = await asyncio.to_thread(_render_uptime, status)  # 绘图不阻塞事件循环
+    await message.reply_async(f"当前服务状态{breaker_info}", img_path)
 
 
 @module(
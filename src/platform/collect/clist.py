@@ -1,27 +1,42 @@
 from urllib.parse import urljoin, urlencode
 
 from src.core.constants import Constants
-from src.core.util.tools import fetch_url_json
+from src.core.util.tools import fetch_url_json, fetch_many
 
 
 class Clist:
     _api_key = Constants.modules_conf.clist["apikey"]
 
+    @classmethod
+    def _build_url(cls, route: str, params: dict) -> str:
+        payload = urlencode({k.strip("_"): v for k, v in params.items()}, doseq=True)
+        return urljoin("https://clist.by", f"{route}?{payload}")
+
     @classmethod
     def api(cls, api: str, **kwargs) -> list[dict]:
         """传递参数构造payload，添加首尾下划线可避免与关键词冲突"""
         route = f"/api/v4/{api}"
-        objects = []
+        headers = {"Authorization": f"{cls._api_key}"}
         kwargs.setdefault('limit', 1000)  # 单页最大值，减少请求次数
-        while route is not None:
-            if kwargs:
-                payload = urlencode({k.strip("_"): v for k, v in kwargs.items()}, doseq=True)
-                route = f"{route}?{payload}"
-            url = urljoin("https://clist.by", route)
-            json_data = fetch_url_json(url, method='get',
-                                       inject_headers={"Authorization": f"{cls._api_key}"})
+        kwargs.setdefault('total_count', 'true')  # 获取总数，以便一次性并发请求剩余页
+
+        json_data = fetch_url_json(cls._build_url(route, kwargs), method='get', inject_headers=headers)
+        objects = list(json_data['objects'])
+        meta = json_data['meta']
+
+        total_count = meta.get('total_count')
+        if total_count is not None and meta['next'] is not None:
+            limit, offset = int(meta['limit']), int(meta.get('offset') or 0)
+            urls = [cls._build_url(route, {**kwargs, 'offset': page_offset, 'total_count': 'false'})
+                    for page_offset in range(offset + limit, total_count, limit)]
+            for result in fetch_many(urls, inject_headers=headers):
+                objects.extend(result.json()['objects'])
+            return objects
+
+        route = meta['next']
+        while route is not None:  # 未返回总数时沿 next 地址逐页获取，next地址里会自带原参数
+            json_data = fetch_url_json(urljoin("https://clist.by", route), method='get', inject_headers=headers)
             objects.extend(json_data['objects'])
             route = json_data['meta']['next']
-            kwargs.clear()  # next地址里会自带原参数
 
         return objects
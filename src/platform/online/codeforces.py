@@ -1,3 +1,4 @@
+import asyncio
 import random
 import re
 import time
@@ -7,9 +8,15 @@ from urllib.parse import urlencode
 import pixie
 from thefuzz import process
 
+from src.core.constants import Constants
 from src.core.lib.cf_rating_calc import PredictResult, Contestant, predict
+from src.core.util import json_stream
 from src.core.util.tools import fetch_url_json, format_timestamp, get_week_start_timestamp, get_today_start_timestamp, \
-    format_timestamp_diff, format_seconds, format_int_delta, decode_range, check_intersect, get_today_timestamp_range
+    format_timestamp_diff, format_seconds, format_int_delta, decode_range, check_intersect, get_today_timestamp_range, \
+    fetch_url_json_async, fetch_url_text
+from src.data.data_cf_problemset import ProblemIndex, get_problem_index, set_problem_index
+from src.data.data_cf_submissions import SubmissionStore, get_submission_store, save_submission_store, \
+    lock_of as submission_lock_of
 from src.platform.model import CompetitivePlatform, Contest
 from src.render.pixie.render_user_card import UserCardRenderer
 
@@ -51,6 +58,14 @@ class Codeforces(CompetitivePlatform):
         'T': '#ff0000'
     }
 
+    # 按需解析大体积响应时保留的字段，见 _project_result
+    _PROBLEM_FIELDS = ('contestId', 'index', 'name', 'rating', 'tags')
+    _STANDING_ROW_FIELDS = ('party.members.0.handle', 'points', 'penalty', 'teamId')
+    _SUBMISSION_FIELDS = ('id', 'creationTimeSeconds', 'verdict', 'problem.contestId', 'problem.index')
+
+    _SUBMISSION_PAGE_SIZE = 100
+    _SUBMISSION_SYNC_INTERVAL = 30  # 秒，在此时间内的重复查询不再请求新的提交
+
     @classmethod
     def _decode_api_url(cls, api: str, **kwargs) -> str:
         url = f"https://codeforces.com/api/{api}"
@@ -60,20 +75,64 @@ class Codeforces(CompetitivePlatform):
         return url
 
     @classmethod
-    def _api(cls, api: str, **kwargs) -> dict:
-        """传递参数构造 payload，添加首尾下划线可避免与关键词冲突"""
+    def _project_result(cls, text: str, projection: dict[str, tuple[str, ...] | None]) -> dict:
+        """
+        按需解析响应中 result 下的部分内容，不构建完整的响应
+
+        :param projection: {以点分隔的路径 (空串为 result 本身): 字段}，字段为 None 时解析完整的值，
+                           否则返回只包含这些字段的元组列表
+        """
+        projected = {}
+        for path, fields in projection.items():
+            full_path = ('result',) + (tuple(path.split('.')) if path else ())
+            projected[path] = (json_stream.extract(text, full_path) if fields is None else
+                               json_stream.project(text, full_path, fields))
+        return projected
+
+    @classmethod
+    def _api(cls, api: str, projection: dict[str, tuple[str, ...] | None] | None = None,
+             fresh: bool = False, **kwargs) -> dict:
+        """
+        传递参数构造 payload，添加首尾下划线可避免与关键词冲突
+        响应较大时可以指定 projection 只解析需要的字段，格式见 _project_result
+        fresh 为 True 时不使用响应缓存中未经上游确认的内容
+        """
         url = cls._decode_api_url(api, **kwargs)
-        json_data = fetch_url_json(url)
+        if projection is not None:
+            return cls._project_result(fetch_url_text(url, method='get', fresh=fresh), projection)
+        json_data = fetch_url_json(url, method='get')
         return json_data['result']
 
     @classmethod
-    def _api_with_check(cls, api: str, **kwargs) -> dict | None:
+    def _api_with_check(cls, api: str, projection: dict[str, tuple[str, ...] | None] | None = None,
+                        **kwargs) -> dict | None:
         """
         调用 api，并检查请求是否 OK
         传递参数构造 payload，添加首尾下划线可避免与关键词冲突
         """
         url = cls._decode_api_url(api, **kwargs)
-        json_data = fetch_url_json(url, accept_codes=[200, 400])  # Failed 的时候 code 为 400
+        if projection is not None:
+            text = fetch_url_text(url, method='get', accept_codes=[200, 400])  # Failed 的时候 code 为 400
+            if json_stream.extract(text, ('status',)) != "OK":
+                return None
+            return cls._project_result(text, projection)
+        json_data = fetch_url_json(url, method='get', accept_codes=[200, 400])  # Failed 的时候 code 为 400
+        if json_data['status'] == "OK":
+            return json_data['result']
+        return None
+
+    @classmethod
+    async def _api_async(cls, api: str, **kwargs) -> dict:
+        """_api 的协程版本"""
+        url = cls._decode_api_url(api, **kwargs)
+        json_data = await fetch_url_json_async(url, method='get')
+        return json_data['result']
+
+    @classmethod
+    async def _api_with_check_async(cls, api: str, **kwargs) -> dict | None:
+        """_api_with_check 的协程版本"""
+        url = cls._decode_api_url(api, **kwargs)
+        json_data = await fetch_url_json_async(url, method='get', accept_codes=[200, 400])
         if json_data['status'] == "OK":
             return json_data['result']
         return None
@@ -182,7 +241,7 @@ class Codeforces(CompetitivePlatform):
                 f"持续 {format_seconds(contest['durationSeconds'])}, {contest['type']} 赛制")
 
     @classmethod
-    def _adjust_old_ratings(cls, contest_id: int, rating_changes: list) -> dict:
+    def _adjust_old_ratings(cls, contest_id: int, rating_changes: list[tuple[str, int, int]]) -> dict:
         """
         Adapted from carrot at
         https://github.com/meooow25/carrot/blob/master/carrot/src/background/cache/contests-complete.js
@@ -194,16 +253,14 @@ class Codeforces(CompetitivePlatform):
         users.
         """
         if contest_id < 1360:  # FAKE_RATINGS_SINCE_CONTEST
-            return {change['handle']: {'oldRating': change['oldRating'],
-                                       'realChange': (change['oldRating'], change['newRating'])}
-                    for change in rating_changes}
+            return {handle: {'oldRating': old_rating, 'realChange': (old_rating, new_rating)}
+                    for handle, old_rating, new_rating in rating_changes}
         else:
             def _adjust(old: int) -> int:
                 return 1400 if old == 0 else old  # NEW_DEFAULT_RATING
 
-            return {change['handle']: {'oldRating': _adjust(change['oldRating']),
-                                       'realChange': (change['oldRating'], change['newRating'])}
-                    for change in rating_changes}
+            return {handle: {'oldRating': _adjust(old_rating), 'realChange': (old_rating, new_rating)}
+                    for handle, old_rating, new_rating in rating_changes}
 
     @classmethod
     def _is_old_contest(cls, contest: dict) -> bool:
@@ -216,48 +273,47 @@ class Codeforces(CompetitivePlatform):
         return days_since_contest_end > 3  # RATING_PENDING_MAX_DAYS
 
     @classmethod
-    def _get_predicted_prefs(cls, standings: dict) -> dict[str, PredictResult] | None:
+    def _get_predicted_prefs(cls, contest: dict, rows: list[tuple]) -> dict[str, PredictResult] | None:
         """
         Adapted from carrot at
         https://github.com/meooow25/carrot/blob/master/carrot/src/background/cache/contests-complete.js
+
+        rows 的格式见 _STANDING_ROW_FIELDS
         """
-        ratings = cls._api('user.ratedList', activeOnly=False, contestId=standings['contest']['id'])
-        ratings = {user['handle']: user['rating'] for user in ratings}
+        ratings = cls._api('user.ratedList', projection={'': ('handle', 'rating')},
+                           activeOnly=False, contestId=contest['id'])
+        ratings = dict(ratings[''])
 
-        is_edu_round = 'educational' in standings['contest']['name'].lower()
-        rows = standings['rows']
+        is_edu_round = 'educational' in contest['name'].lower()
         if is_edu_round:
             # For educational rounds, standings include contestants for whom the contest is not rated.
-            rows = [row for row in standings['rows'] if
-                    row['party']['members'][0]['handle'] in ratings and
-                    row['party']['members'][0]['handle'] < 2100]  # EDU_ROUND_RATED_THRESHOLD
+            rows = [row for row in rows if
+                    row[0] in ratings and ratings[row[0]] < 2100]  # EDU_ROUND_RATED_THRESHOLD
 
         contestants = [Contestant(
-            handle=row['party']['members'][0]['handle'],
-            points=row['points'],
-            penalty=row['penalty'],
-            rating=(1400 if row['party']['members'][0]['handle'] not in ratings
-                    else ratings[row['party']['members'][0]['handle']])
-        ) for row in rows]
+            handle=handle,
+            points=points,
+            penalty=penalty,
+            rating=1400 if handle not in ratings else ratings[handle]
+        ) for handle, points, penalty, _ in rows]
 
         return predict(contestants, True)
 
     @classmethod
-    def _get_final_prefs(cls, standings: dict, old_ratings: dict) -> dict[str, PredictResult] | None:
+    def _get_final_prefs(cls, rows: list[tuple], old_ratings: dict) -> dict[str, PredictResult] | None:
         """
         Adapted from carrot at
         https://github.com/meooow25/carrot/blob/master/carrot/src/background/cache/contests-complete.js
-        """
-        rows = [row for row in standings['rows'] if
-                row['party']['members'][0]['handle'] in old_ratings]
 
+        rows 的格式见 _STANDING_ROW_FIELDS
+        """
         contestants = [Contestant(
-            handle=row['party']['members'][0]['handle'],
-            points=row['points'],
-            penalty=row['penalty'],
-            rating=old_ratings[row['party']['members'][0]['handle']]['oldRating'],
-            real_change=old_ratings[row['party']['members'][0]['handle']]['realChange']
-        ) for row in rows]
+            handle=handle,
+            points=points,
+            penalty=penalty,
+            rating=old_ratings[handle]['oldRating'],
+            real_change=old_ratings[handle]['realChange']
+        ) for handle, points, penalty, _ in rows if handle in old_ratings]
 
         return predict(contestants, True)
 
@@ -278,20 +334,24 @@ class Codeforces(CompetitivePlatform):
         and
         https://github.com/meooow25/carrot/blob/master/carrot/src/background/background.js
         """
-        standings = cls._api('contest.standings', contestId=contest_id)
+        standings = cls._api('contest.standings', projection={'contest': None, 'rows': cls._STANDING_ROW_FIELDS},
+                             contestId=contest_id)
+        contest, rows = standings['contest'], standings['rows']
         rated, old_ratings = None, None
 
-        if standings['contest']['phase'] == 'FINISHED':
-            rating_changes = cls._api_with_check('contest.ratingChanges', contestId=contest_id)
+        if contest['phase'] == 'FINISHED':
+            rating_changes = cls._api_with_check('contest.ratingChanges',
+                                                 projection={'': ('handle', 'oldRating', 'newRating')},
+                                                 contestId=contest_id)
             if rating_changes is None:
                 rated = False
             else:
-                rating_changes = list(rating_changes)
+                rating_changes = rating_changes['']
                 if len(rating_changes) > 0:
                     rated = True
                     old_ratings = cls._adjust_old_ratings(int(contest_id), rating_changes)
 
-        if rated is None and cls._is_old_contest(standings['contest']):
+        if rated is None and cls._is_old_contest(contest):
             rated = False
 
         contest_finished = rated is not None
@@ -301,17 +361,17 @@ class Codeforces(CompetitivePlatform):
                 return 1
 
             # We can ensure that old_ratings is not None
-            result = cls._get_final_prefs(standings, old_ratings)
+            result = cls._get_final_prefs(rows, old_ratings)
             return result
 
-        if (standings['contest']['name'].lower()
+        if (contest['name'].lower()
                 in ['unrated', 'fools', 'q#', 'kotlin', 'marathon', 'teams']):  # UNRATED_HINTS
             return 1
 
-        if any('teamId' in standing for standing in standings['rows']):
+        if any(team_id is not None for _, _, _, team_id in rows):
             return 1
 
-        result = cls._get_predicted_prefs(standings)
+        result = cls._get_predicted_prefs(contest, rows)
         return result
 
     @classmethod
@@ -368,15 +428,26 @@ class Codeforces(CompetitivePlatform):
 
         return running_contests, upcoming_contests, finished_contests
 
+    @classmethod
+    def refresh_problem_index(cls) -> ProblemIndex:
+        """重新下载题库并替换本地索引，失败时保留原有的索引，不使用响应缓存中可能过期的题库"""
+        problems = cls._api('problemset.problems', projection={'problems': cls._PROBLEM_FIELDS}, fresh=True)
+        index = ProblemIndex.build(problems['problems'])
+        set_problem_index(index)
+        Constants.log.info(f"[caching] Codeforces 题库索引已更新，共 {len(index)} 题")
+        return index
+
+    @classmethod
+    def _get_problem_index(cls) -> ProblemIndex:
+        """优先使用本地索引，尚未建立过索引时立即下载"""
+        index = get_problem_index()
+        if index is None:
+            index = cls.refresh_problem_index()
+        return index
+
     @classmethod
     def get_prob_tags_all(cls) -> list[str]:
-        problems = cls._api('problemset.problems')
-        tags = []
-        for problem in problems['problems']:
-            for tag in problem['tags']:
-                tags.append(tag.replace(" ", "-"))
-        tags = sorted(set(tags))
-        return tags
+        return sorted({tag.replace(" ", "-") for tag in cls._get_problem_index().tags})
 
     @classmethod
     def get_prob_filtered(cls, prob_info: ProbInfo, excludes: set[str] | None = None) -> dict | None:
@@ -384,24 +455,16 @@ class Codeforces(CompetitivePlatform):
         根据tag、是否非远古题、难度范围和排除题目进行随机选题
         excludes 列表项格式为 contestId + index
         """
-        if prob_info.tag == "all":
-            problems = cls._api('problemset.problems')
-        else:
-            problems = cls._api('problemset.problems', tags=prob_info.tag.replace("-", " "))
-
-        filtered_data = problems['problems']
+        index = cls._get_problem_index()
+        rating_range = None
         if prob_info.limit is not None:
-            min_point, max_point = decode_range(prob_info.limit, length=(3, 4))
-            filtered_data = [prob for prob in problems['problems']
-                             if 'rating' in prob and min_point <= prob['rating'] <= max_point]
-        if prob_info.newer:
-            filtered_data = [prob for prob in filtered_data if prob['contestId'] >= 1000]
+            rating_range = decode_range(prob_info.limit, length=(3, 4))
 
-        if excludes is not None:
-            filtered_data = [prob for prob in filtered_data
-                             if f'{prob["contestId"]}{prob["index"]}' not in excludes]
-
-        return random.choice(filtered_data) if len(filtered_data) > 0 else None
+        candidates = index.select(tag=None if prob_info.tag == "all" else prob_info.tag,
+                                  rating_range=rating_range, newer=prob_info.newer, excludes=excludes)
+        if len(candidates) == 0:
+            return None
+        return index.problem_at(int(random.choice(candidates)))
 
     @classmethod
     def get_prob_status(cls, handle: str, establish_time: int,
@@ -477,8 +540,7 @@ class Codeforces(CompetitivePlatform):
                                 rank=rank, rank_alias=rank_alias, rating=rating, platform=cls).render()
 
     @classmethod
-    def get_user_info(cls, handle: str) -> tuple[str, str] | None:
-        info = cls._api_with_check('user.info', handles=handle)
+    def _format_user_info(cls, info: list | None) -> tuple[str, str] | None:
         if not info or len(info) == 0:
             return None
 
@@ -503,8 +565,15 @@ class Codeforces(CompetitivePlatform):
         return '\n\n'.join(sections), info.get('titlePhoto')
 
     @classmethod
-    def get_user_last_contest(cls, handle: str) -> str:
-        rating = cls._api('user.rating', handle=handle)
+    def get_user_info(cls, handle: str) -> tuple[str, str] | None:
+        return cls._format_user_info(cls._api_with_check('user.info', handles=handle))
+
+    @classmethod
+    async def get_user_info_async(cls, handle: str) -> tuple[str, str] | None:
+        return cls._format_user_info(await cls._api_with_check_async('user.info', handles=handle))
+
+    @classmethod
+    def _format_last_contest(cls, rating: list) -> str:
         rated_contests = list(rating)
         contest_count = len(rated_contests)
         if contest_count == 0:
@@ -520,8 +589,15 @@ class Codeforces(CompetitivePlatform):
         return info
 
     @classmethod
-    def get_user_last_submit(cls, handle: str, count: int = 5) -> str:
-        status = cls._api('user.status', handle=handle, _from_=1, count=count)
+    def get_user_last_contest(cls, handle: str) -> str:
+        return cls._format_last_contest(cls._api('user.rating', handle=handle))
+
+    @classmethod
+    async def get_user_last_contest_async(cls, handle: str) -> str:
+        return cls._format_last_contest(await cls._api_async('user.rating', handle=handle))
+
+    @classmethod
+    def _format_last_submit(cls, status: list, count: int) -> str:
         status = list(status)
         if len(status) == 0:
             return "还未提交过题目"
@@ -541,35 +617,64 @@ class Codeforces(CompetitivePlatform):
         return info
 
     @classmethod
-    def get_user_submit_counts(cls, handle: str) -> tuple[int, int, int]:
-        status = cls._api('user.status', handle=handle)
-        status = list(status)
-        submit_len = len(status)
-        if submit_len == 0:
-            return 0, 0, 0
+    def get_user_last_submit(cls, handle: str, count: int = 5) -> str:
+        return cls._format_last_submit(cls._api('user.status', handle=handle, _from_=1, count=count), count)
 
-        total_set, weekly_set, daily_set = set(), set(), set()
-        week_start_time, today_start_time = get_week_start_timestamp(), get_today_start_timestamp()
-        for submit in status:
-            if submit['verdict'] != "OK":
-                continue
-            current_prob = f"{submit['problem'].get('contestId')}-{submit['problem'].get('index')}"
-            total_set.add(current_prob)
-            if submit['creationTimeSeconds'] >= week_start_time:
-                weekly_set.add(current_prob)
-            if submit['creationTimeSeconds'] >= today_start_time:
-                daily_set.add(current_prob)
+    @classmethod
+    async def get_user_last_submit_async(cls, handle: str, count: int = 5) -> str:
+        return cls._format_last_submit(
+            await cls._api_async('user.status', handle=handle, _from_=1, count=count), count)
+
+    @classmethod
+    def _fetch_new_submissions(cls, handle: str, last_id: int) -> list[tuple]:
+        """
+        获取编号大于 last_id 的提交，元组的格式见 _SUBMISSION_FIELDS
+        提交按编号从新到旧返回，逐页获取直到遇到已记录的提交，首次获取时一次性下载全部提交
+        """
+        projection = {'': cls._SUBMISSION_FIELDS}
+        if last_id == 0:
+            return cls._api('user.status', projection=projection, handle=handle)['']
+
+        submissions, start = [], 1
+        while True:
+            page = cls._api('user.status', projection=projection,
+                            handle=handle, _from_=start, count=cls._SUBMISSION_PAGE_SIZE)['']
+            submissions.extend(page)
+            if len(page) < cls._SUBMISSION_PAGE_SIZE or page[-1][0] <= last_id:
+                return submissions
+            start += cls._SUBMISSION_PAGE_SIZE  # 翻页期间的新提交会使后一页与前一页重复，不会遗漏
 
-        return len(total_set), len(weekly_set), len(daily_set)
+    @classmethod
+    def _sync_submissions(cls, handle: str) -> SubmissionStore:
+        """
+        增量更新用户的提交摘要，短时间内的重复查询直接使用本地记录
+        需持有 submission_lock_of(handle)，读取摘要时同样需要持有
+        """
+        store = get_submission_store(handle)
+        if time.time() - store.synced_at < cls._SUBMISSION_SYNC_INTERVAL:
+            return store
+        changed = store.merge(cls._fetch_new_submissions(handle, store.last_id))
+        store.synced_at = time.time()
+        if changed:
+            save_submission_store(store)
+        return store
+
+    @classmethod
+    def get_user_submit_counts(cls, handle: str) -> tuple[int, int, int]:
+        with submission_lock_of(handle):
+            store = cls._sync_submissions(handle)
+            return store.count_solved(get_week_start_timestamp(), get_today_start_timestamp())
+
+    @classmethod
+    async def get_user_submit_counts_async(cls, handle: str) -> tuple[int, int, int]:
+        # 同一用户的更新需要互斥，放入线程中执行
+        return await asyncio.to_thread(cls.get_user_submit_counts, handle)
 
     @classmethod
     def get_user_submit_prob_id(cls, handle: str) -> set[str]:
         """获取用户提交过的所有题目，列表项格式为 contestId + index"""
-        status = cls._api('user.status', handle=handle)
-        prob_id = [(f'{submission["problem"]["contestId"]}'
-                    f'{submission["problem"]["index"]}') for submission in status
-                   if 'contestId' in submission['problem']]  # 特判 problemsets/acmsguru
-        return set(prob_id)
+        with submission_lock_of(handle):
+            return set(cls._sync_submissions(handle).submitted)
 
     @classmethod
     def get_user_contest_standings(cls, handle: str, contest_id: str) -> tuple[str, list[str]] | None:
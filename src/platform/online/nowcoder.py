@@ -6,10 +6,11 @@ from html import unescape
 from urllib.parse import quote_plus
 
 import pixie
+from lxml import etree
 from lxml.etree import Element
 
 from src.core.util.tools import fetch_url_element, fetch_url_json, format_int_delta, check_intersect, \
-    get_today_timestamp_range, format_timestamp, format_seconds, check_is_int
+    get_today_timestamp_range, format_timestamp, format_seconds, check_is_int, fetch_many
 from src.platform.model import CompetitivePlatform, Contest
 from src.render.pixie.render_user_card import UserCardRenderer
 
@@ -39,6 +40,18 @@ class NowCoder(CompetitivePlatform):
         (14, -1): '高校比赛',
     }
 
+    @classmethod
+    def _fetch_rest_pages(cls, url: str, page_count: int) -> list[dict]:
+        """并发爬取第 2 页到第 page_count 页，按页码顺序返回，任意一页失败则整体失败"""
+        results = fetch_many([f"{url}&page={page}" for page in range(2, page_count + 1)])
+        pages = []
+        for result in results:
+            json_data = result.json()
+            if json_data['msg'] != "OK":
+                raise ValueError("Invalid response for nowcoder api")
+            pages.append(json_data)
+        return pages
+
     @classmethod
     def _api(cls, url: str) -> list[dict]:
         json_data = fetch_url_json(url, method='get')
@@ -51,10 +64,7 @@ class NowCoder(CompetitivePlatform):
 
         # 爬取所有页
         page_count = json_data['data']['pageInfo']['pageCount']
-        for page in range(2, page_count + 1):
-            json_data = fetch_url_json(f"{url}&page={page}", method='get')
-            if json_data['msg'] != "OK":
-                raise ValueError("Invalid response for nowcoder api")
+        for json_data in cls._fetch_rest_pages(url, page_count):
             all_data.extend(list(json_data['data']['dataList']))
 
         return all_data
@@ -76,10 +86,7 @@ class NowCoder(CompetitivePlatform):
 
         # 爬取所有页
         page_count = json_data['data']['basicInfo']['pageCount']
-        for page in range(2, page_count + 1):
-            json_data = fetch_url_json(f"{url}&page={page}", method='get')
-            if json_data['msg'] != "OK":
-                raise ValueError("Invalid response for nowcoder api")
+        for json_data in cls._fetch_rest_pages(url, page_count):
             all_data.extend(list(json_data['data']['rankData']))
 
         return rank_type, all_data
@@ -132,12 +139,20 @@ class NowCoder(CompetitivePlatform):
         return f"{rating} {rk}"
 
     @classmethod
-    def _fetch_user_rating(cls, handle: str) -> str:
+    def _get_profile_url(cls, handle: str) -> str:
         handle = quote_plus(str(handle).strip())
-        html = fetch_url_element(f"https://ac.nowcoder.com/acm/contest/profile/{handle}")
+        return f"https://ac.nowcoder.com/acm/contest/profile/{handle}"
+
+    @classmethod
+    def _parse_user_rating(cls, html: Element) -> str:
         rating = int(html.xpath("//div[contains(@class, 'state-num rate-score')]/text()")[0])
         return cls._format_rating(rating)
 
+    @classmethod
+    def _fetch_user_rating(cls, handle: str) -> str:
+        html = fetch_url_element(cls._get_profile_url(handle))
+        return cls._parse_user_rating(html)
+
     @classmethod
     def _fetch_team_members_info(cls, handle: str, inline: bool = False) -> str:
         handle = quote_plus(str(handle).strip())
@@ -145,12 +160,15 @@ class NowCoder(CompetitivePlatform):
         members = cls._api(url)
         member_infos = []
 
-        for member in members:
+        # 并发获取所有队员的 rating
+        profiles = [] if inline else fetch_many([cls._get_profile_url(member['uid']) for member in members])
+
+        for idx, member in enumerate(members):
             member_info = [member['name']]
             if not inline:
                 if member['isTeamAdmin']:
                     member_info.append("队长")
-                member_info.append(cls._fetch_user_rating(member['uid']))
+                member_info.append(cls._parse_user_rating(etree.HTML(profiles[idx].text())))
             member_infos.append(' '.join(member_info))
 
         return (', ' if inline else '\n').join(member_infos)
@@ -210,11 +228,15 @@ class NowCoder(CompetitivePlatform):
                 supplement=cls._decode_rated(contest)
             )
 
-        for category, category_name in cls.contest_category.items():
-            top_category_id, category_id = category
-            html = fetch_url_element("https://ac.nowcoder.com/acm/contest/vip-index?"
-                                     f"topCategoryFilter={top_category_id}&"
-                                     f"categoryFilter={category_id}")
+        # 各分类的比赛列表互不依赖，并发获取
+        categories = list(cls.contest_category.items())
+        pages = fetch_many(["https://ac.nowcoder.com/acm/contest/vip-index?"
+                            f"topCategoryFilter={top_category_id}&"
+                            f"categoryFilter={category_id}"
+                            for (top_category_id, category_id), _ in categories])
+
+        for (_, category_name), page in zip(categories, pages):
+            html = etree.HTML(page.text())
             js_current = html.xpath("//div[@class='platform-mod js-current']//div[@class='platform-item-cont']")
             js_end = html.xpath("//div[@class='platform-mod js-end']//div[@class='platform-item-cont']")
             running_contests.extend([
@@ -7,6 +7,7 @@ from easy_pixie import load_img, apply_tint, change_img_alpha, draw_img, Loc, tu
     GradientDirection, draw_gradient_rect, draw_mask_rect
 
 from src.core.constants import Constants
+from src.core.util.cancel import check_cancelled
 
 _lib_path = Constants.modules_conf.get_lib_path("Render-Images")
 _img_load_cache: dict[str, tuple[float, pixie.Image]] = {}
@@ -34,6 +35,7 @@ class Renderer(abc.ABC):
     def load_img_resource(cls, img_name: str, tint_color: pixie.Color | tuple[int, ...] = None,
                           tint_ratio: int = 1, alpha_ratio: float = -1,
                           size: tuple[int, int] = None) -> pixie.Image:
+        check_cancelled()  # 渲染过程中频繁加载资源，借此响应指令取消
         img_path = os.path.join(_lib_path, f"{img_name}.png")
         if not os.path.exists(img_path):
             img_path = os.path.join(_lib_path, "Dot.png")
@@ -0,0 +1,76 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LocalHandler(BaseHTTPRequestHandler):
+    """本地测试用的 HTTP 服务，按路径返回不同的响应"""
+    protocol_version = "HTTP/1.1"  # 保持连接
+    peers: list = []
+    hits: dict = {}
+    active = 0
+    max_active = 0
+    down = False
+    lock = threading.Lock()
+
+    def _respond(self, code: int, body: bytes, headers: dict | None = None):
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        LocalHandler.peers.append(self.client_address)
+        count = LocalHandler.hits[self.path] = LocalHandler.hits.get(self.path, 0) + 1
+        if self.path.startswith("/flaky") and count < 3:
+            self._respond(503, b"busy")
+        elif self.path.startswith("/slow"):
+            time.sleep(1)
+            self._respond(200, b"late")
+        elif self.path.startswith("/etag") and LocalHandler.down:
+            self._respond(503, b"down")
+        elif self.path.startswith("/etag"):
+            if self.headers.get("If-None-Match") == '"v1"':
+                LocalHandler.hits["304"] = LocalHandler.hits.get("304", 0) + 1
+                self._respond(304, b"", {"ETag": '"v1"'})
+            else:
+                self._respond(200, b"cached body", {"ETag": '"v1"', "Content-Type": "text/plain; charset=utf-8"})
+        elif self.path.startswith("/blob/"):
+            time.sleep(0.2)
+            size = int(self.path.rsplit("/", 1)[1])
+            self._respond(200, bytes(i % 251 for i in range(size)))
+        elif self.path.startswith("/wait"):
+            with LocalHandler.lock:
+                LocalHandler.active += 1
+                LocalHandler.max_active = max(LocalHandler.max_active, LocalHandler.active)
+            time.sleep(0.2)
+            with LocalHandler.lock:
+                LocalHandler.active -= 1
+            self._respond(200, self.path.encode())
+        else:
+            self._respond(200, self.path.encode())
+
+    def do_POST(self):
+        LocalHandler.hits[self.path] = LocalHandler.hits.get(self.path, 0) + 1
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._respond(503, b"busy")
+
+    def log_message(self, *args):
+        pass
+
+
+def start_local_server() -> tuple[ThreadingHTTPServer, str]:
+    """启动本地 HTTP 服务并重置统计，返回服务与地址，使用后需调用 stop_local_server"""
+    LocalHandler.peers, LocalHandler.hits = [], {}
+    LocalHandler.active = LocalHandler.max_active = 0
+    LocalHandler.down = False
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LocalHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def stop_local_server(server: ThreadingHTTPServer):
+    server.shutdown()
+    server.server_close()
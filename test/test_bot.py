@@ -0,0 +1,915 @@
+import asyncio
+import base64
+import importlib
+import os
+import random
+import shutil
+import string
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from botpy.errors import SequenceNumberError, ServerError
+from thefuzz import process
+
+from src.core.bot import message as message_module
+from src.core.bot import transit as transit_module
+from src.core.bot.admission import AdmissionController, Verdict
+from src.core.bot.decorator import CommandScope, __commands__, __modules__, get_registry_revision, \
+    unregister_module, command
+from src.core.bot.interact import _get_key_words_matcher, _to_pinyin
+from src.core.bot.loop_monitor import LoopLagMonitor
+from src.core.bot.message import MessageType, RobotMessage
+from src.core.bot.outbound import OutboundJob, OutboundScheduler
+from src.core.bot.perm import PermissionLevel
+from src.core.bot.reload import reload_module, resolve_module_path
+from src.core.bot.router import CommandRouter
+from src.core.bot.suggest import SuggestionIndex
+from src.core.bot.transit import _Flight, _make_coalesce_key, MessageID, _run_command_with_deadline, \
+    get_message_id, _prepare_command
+from src.core.bot.usage import UsageLedger
+from src.core.bot.worker_pool import KeyedWorkerPool, QueueFullError, PoolClosedError
+from src.core.constants import Constants
+from src.core.util.aho_corasick import AhoCorasick
+from src.core.util.cancel import CancelToken, use_cancel_token, reset_cancel_token, check_cancelled, \
+    get_cancel_token
+from src.core.util.exception import OperationCancelledError
+from src.core.util.tools import run_py_file
+from src.data import data_message_journal
+
+
+def _dummy_handler(message):
+    pass
+
+
+def _make_commands(module_count: int, command_count: int, wildcard_ratio: float = 0.1,
+                   seed: int = 0) -> dict[str, dict[str, tuple]]:
+    """构造一个与 __commands__ 结构相同的注册表"""
+    rnd = random.Random(seed)
+    commands = {}
+    for i in range(module_count):
+        module_commands = {}
+        for _ in range(command_count):
+            name = ''.join(rnd.choices(string.ascii_lowercase, k=rnd.randint(2, 8)))
+            is_command = rnd.random() > 0.05
+            token = f"/{name}" if is_command else name
+            if rnd.random() < wildcard_ratio:
+                token += '*'
+            scope = CommandScope(MessageType.C2C) if rnd.random() < 0.05 else None
+            module_commands[token] = (_dummy_handler, PermissionLevel.USER, is_command,
+                                      rnd.random() < 0.2, scope, False, "heavy", None, None)
+        commands[f"src.module.bench.m{i}"] = module_commands
+    return commands
+
+
+def _legacy_match(commands: dict[str, dict[str, tuple]], func: str) -> list[tuple[str, str]]:
+    """原先 get_message_id 中的逐条遍历写法，作为对照"""
+    matched = []
+    for module in commands:
+        for cmd in commands[module]:
+            starts_with = cmd[-1] == '*' and func.startswith(cmd[:-1])
+            if starts_with or cmd == func:
+                matched.append((module, cmd))
+    return matched
+
+
+def _sample_queries(commands: dict[str, dict[str, tuple]], count: int, seed: int = 1) -> list[str]:
+    rnd = random.Random(seed)
+    all_tokens = [cmd for module_commands in commands.values() for cmd in module_commands]
+    queries = []
+    for _ in range(count):
+        token = rnd.choice(all_tokens)
+        dice = rnd.random()
+        if dice < 0.4:
+            queries.append(token)
+        elif dice < 0.7:
+            queries.append(token.rstrip('*') + ''.join(rnd.choices(string.ascii_lowercase, k=3)))
+        else:
+            queries.append('/' + ''.join(rnd.choices(string.ascii_lowercase, k=rnd.randint(1, 6))))
+    return queries
+
+
+def _legacy_suggest(commands: dict[str, dict[str, tuple]], input_cmd: str, limit: int,
+                    permission_level: PermissionLevel) -> list[str]:
+    """原先 find_similar_commands 中的全量计算写法，作为对照"""
+    command_levels = {}
+    for module_commands in commands.values():
+        for cmd, (_, execute_level, *_) in module_commands.items():
+            if not cmd.startswith('/'):
+                continue
+            name = cmd[:-1] if cmd.endswith('*') else cmd
+            if name not in command_levels:
+                command_levels[name] = execute_level
+
+    accessible_commands = [name for name, level in command_levels.items() if level <= permission_level]
+    suggestions = []
+    for candidate, ratio in process.extract(input_cmd, accessible_commands, limit=limit):
+        if ratio >= 50 and candidate not in suggestions:
+            suggestions.append(candidate)
+        if len(suggestions) >= limit:
+            break
+    return suggestions
+
+
+def _make_suggest_commands(module_count: int, command_count: int, seed: int = 0) -> dict[str, dict[str, tuple]]:
+    """构造包含不同权限、中文与多单词指令的注册表"""
+    rnd = random.Random(seed)
+    commands = _make_commands(module_count, command_count, seed=seed)
+    extra = ["/来只", "/添加来只", "/cf_info", "/chat_scene_id", "/rand-num", "/atc", "/今日题目", "/peeper_board",
+             "/重载模块", "/hitokoto", "/contests", "/uptime"]
+    for module_commands in commands.values():
+        for token, value in list(module_commands.items()):
+            module_commands[token] = (value[0], rnd.choice(list(PermissionLevel)), *value[2:])
+    commands["src.module.bench.extra"] = {
+        token: (_dummy_handler, rnd.choice(list(PermissionLevel)), True, False, None, False, "heavy", None, None)
+        for token in extra
+    }
+    return commands
+
+
+def _sample_typos(commands: dict[str, dict[str, tuple]], count: int, seed: int = 1) -> list[str]:
+    rnd = random.Random(seed)
+    names = [cmd.rstrip('*') for module_commands in commands.values() for cmd in module_commands
+             if cmd.startswith('/')]
+    queries = []
+    for _ in range(count):
+        name = rnd.choice(names)
+        dice = rnd.random()
+        if dice < 0.3 and len(name) > 2:
+            idx = rnd.randrange(1, len(name))
+            queries.append(name[:idx] + name[idx + 1:])
+        elif dice < 0.6:
+            idx = rnd.randrange(1, len(name) + 1)
+            queries.append(name[:idx] + rnd.choice(string.ascii_lowercase + "_-来只") + name[idx:])
+        elif dice < 0.8:
+            queries.append(name + ''.join(rnd.choices(string.ascii_lowercase, k=rnd.randint(1, 4))))
+        else:
+            queries.append('/' + ''.join(rnd.choices(string.ascii_lowercase + ' _', k=rnd.randint(1, 10))))
+    return queries
+
+
+class _FakeMessage:
+    """只记录回复内容的消息，用于不经过 botpy 的调度测试"""
+
+    def __init__(self, tokens: list[str], uuid: str = "group_test"):
+        self.tokens = tokens
+        self.uuid = uuid
+        self.replies = []
+
+    def reply(self, content, img_path=None, img_url=None, modal_words=True, forward=True):
+        self.replies.append((content, img_path))
+
+    def discard_progress(self):
+        pass
+
+    def is_guild_public(self):
+        return False
+
+    def is_group_public(self):
+        return False
+
+    message_type = MessageType.C2C
+    user_permission_level = PermissionLevel.USER
+    author_id = "test_author"
+
+
+class Bot(unittest.TestCase):
+
+    def test_router_same_as_legacy(self):
+        commands = _make_commands(20, 30, wildcard_ratio=0.2)
+        commands["src.module.stuff.pick_one"] = {
+            "/来只*": (_dummy_handler, PermissionLevel.USER, True, False, None, False, "heavy", None, None),
+            "/添加来只*": (_dummy_handler, PermissionLevel.USER, True, False, None, False, "heavy", None, None),
+            "/添加*": (_dummy_handler, PermissionLevel.USER, True, False, None, False, "heavy", None, None),
+        }
+        router = CommandRouter(commands)
+
+        queries = _sample_queries(commands, 2000)
+        queries.extend(["/来只", "/来只猫猫", "/添加来只猫猫", "/添加", "/添加*", "/来只*", "/", ""])
+        for func in queries:
+            self.assertEqual(_legacy_match(commands, func),
+                             [(entry.module, entry.command) for entry in router.match(func)], func)
+
+    def test_router_entry_metadata(self):
+        scope = CommandScope([MessageType.C2C, MessageType.DIRECT], denied_reply="仅限私聊")
+        commands = {"src.module.test": {
+            "/user": (_dummy_handler, PermissionLevel.MOD, True, True, scope, False, "heavy", None, None),
+            "晚安": (_dummy_handler, PermissionLevel.USER, False, False, None, False, "heavy", None, None),
+        }}
+        router = CommandRouter(commands)
+
+        user_entry = router.match("/user")[0]
+        self.assertEqual(user_entry.permission_level, PermissionLevel.MOD)
+        self.assertTrue(user_entry.multi_thread)
+        self.assertTrue(user_entry.public_allowed)
+        self.assertEqual(user_entry.scope_types, frozenset([MessageType.C2C, MessageType.DIRECT]))
+        self.assertEqual(user_entry.denied_reply, "仅限私聊")
+
+        sleep_entry = router.match("晚安")[0]
+        self.assertFalse(sleep_entry.public_allowed)
+        self.assertIsNone(sleep_entry.scope_types)
+        self.assertFalse(sleep_entry.light)
+
+        router = CommandRouter({"src.module.test": {
+            "/ping": (_dummy_handler, PermissionLevel.USER, True, False, None, False, "light", None, None),
+        }})
+        self.assertTrue(router.match("/ping")[0].light)
+
+    def test_router_benchmark(self):
+        """比较逐条遍历与路由表的分发耗时随指令数量的变化"""
+        for module_count, command_count in [(5, 10), (20, 20), (20, 50), (50, 100)]:
+            commands = _make_commands(module_count, command_count)
+            router = CommandRouter(commands)
+            queries = _sample_queries(commands, 2000)
+
+            start = time.perf_counter()
+            for func in queries:
+                _legacy_match(commands, func)
+            legacy_cost = (time.perf_counter() - start) / len(queries)
+
+            start = time.perf_counter()
+            for func in queries:
+                router.match(func)
+            router_cost = (time.perf_counter() - start) / len(queries)
+
+            self.assertLess(router_cost, legacy_cost)
+
+    def test_suggestion_same_as_legacy(self):
+        commands = _make_suggest_commands(20, 30)
+        index = SuggestionIndex(commands)
+
+        queries = _sample_typos(commands, 1500)
+        queries.extend(["/", "/来只", "/来", "/cf", "/cf info", "/chat scene", "/_", "/a", "/atcc", "/重载"])
+        for query in queries:
+            for level in PermissionLevel:
+                for limit in (1, 3):
+                    self.assertEqual(_legacy_suggest(commands, query, limit, level),
+                                     index.find(query, limit, level), (query, level, limit))
+
+    def test_suggestion_benchmark(self):
+        """比较全量计算与预计算索引的模糊匹配耗时随指令数量的变化"""
+        for module_count, command_count in [(5, 10), (20, 20), (50, 20)]:
+            commands = _make_suggest_commands(module_count, command_count)
+            index = SuggestionIndex(commands)
+            queries = _sample_typos(commands, 300)
+
+            start = time.perf_counter()
+            for query in queries:
+                _legacy_suggest(commands, query, 3, PermissionLevel.USER)
+            legacy_cost = (time.perf_counter() - start) / len(queries)
+
+            start = time.perf_counter()
+            for query in queries:
+                index.find(query, 3, PermissionLevel.USER)
+            index_cost = (time.perf_counter() - start) / len(queries)
+
+            self.assertLess(index_cost, legacy_cost)
+
+    def test_aho_corasick_search(self):
+        matcher = AhoCorasick([("he", 1), ("she", 2), ("his", 3), ("hers", 4), ("", 5)])
+        self.assertEqual(matcher.search("ushers"), {1, 2, 4, 5})
+        self.assertEqual(matcher.search("ahishe"), {1, 2, 3, 5})
+        self.assertEqual(AhoCorasick([("abc", 1)]).search("ababcab"), {1})
+        self.assertEqual(AhoCorasick([("abc", 1)]).search("abab"), set())
+
+        rnd = random.Random(0)
+        patterns = [(''.join(rnd.choices("abc", k=rnd.randint(1, 5))), idx) for idx in range(40)]
+        matcher = AhoCorasick(patterns)
+        for _ in range(300):
+            text = ''.join(rnd.choices("abcd", k=rnd.randint(0, 30)))
+            self.assertEqual(matcher.search(text), {idx for pattern, idx in patterns if pattern in text}, text)
+
+    def test_key_words_same_as_legacy(self):
+        matcher, key_words = _get_key_words_matcher()
+        messages = ["你是谁啊", "谢谢你", "THANK you", "你干嘛哎呦", "春日影真好听", "今天天气不错", "ciallo～",
+                    "creeper?", "我准备好了", "你在哪里", "何意味", "沙比", "go go go", ""]
+        for content in messages:
+            ctx_pinyin = _to_pinyin(content.lower())
+            legacy = {idx for idx, (asks, _) in enumerate(key_words)
+                      if any(_to_pinyin(ask) in ctx_pinyin for ask in asks)}
+            self.assertEqual(matcher.search(ctx_pinyin), legacy, content)
+        self.assertIs(_get_key_words_matcher()[0], matcher)
+
+    def test_worker_pool_keyed_order(self):
+        results: dict[str, list[int]] = {}
+        results_lock = threading.Lock()
+        done = threading.Semaphore(0)
+
+        def _handler(item: tuple[str, int]):
+            key, idx = item
+            time.sleep(random.random() / 500)
+            with results_lock:
+                results.setdefault(key, []).append(idx)
+            done.release()
+
+        pool = KeyedWorkerPool(_handler, max_workers=4)
+        keys = [f"group_{i}" for i in range(10)]
+        for idx in range(20):
+            for key in keys:
+                pool.submit(key, (key, idx))
+        for _ in range(20 * len(keys)):
+            self.assertTrue(done.acquire(timeout=10))
+
+        for key in keys:
+            self.assertEqual(results[key], list(range(20)))  # 同一 key 内先进先出
+        stats = pool.stats()
+        self.assertLessEqual(stats.workers, 4)
+        self.assertEqual(stats.processed, 20 * len(keys))
+        pool.drain()
+
+    def test_worker_pool_queued_ahead(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def _handler(_):
+            started.set()
+            release.wait(timeout=10)
+
+        pool = KeyedWorkerPool(_handler, max_workers=2)
+        self.assertEqual(pool.submit("a", 0), 0)
+        self.assertTrue(started.wait(timeout=10))
+        self.assertEqual(pool.submit("a", 1), 1)  # 前方有一个正在处理的请求
+        self.assertEqual(pool.submit("a", 2), 2)
+        self.assertEqual(pool.submit("b", 0), 0)  # 不同 key 互不影响
+        self.assertEqual(pool.stats().key_depths["a"], 3)
+        self.assertEqual(pool.submit("a", 10, flow="other"), 0)  # 只计算同一 flow 内的请求
+        self.assertEqual(pool.submit("a", 11, flow="other"), 1)
+
+        notices = []
+
+        def _slow_notice(ahead: int):
+            notices.append(ahead)
+            self.assertEqual(pool.submit("c", 0), 0)  # 回调在锁外执行，其他提交不被阻塞
+            raise RuntimeError("reply failed")
+
+        self.assertEqual(pool.submit("a", 3, on_queued=_slow_notice), 3)  # 回调的异常不影响入队
+        self.assertEqual(notices, [3])
+
+        drained = pool.drain()
+        self.assertIn(1, drained)
+        self.assertIn(3, drained)
+        with self.assertRaises(PoolClosedError):
+            pool.submit("a", 4)
+        release.set()
+
+    def test_worker_pool_queue_limit(self):
+        release = threading.Event()
+        pool = KeyedWorkerPool(lambda _: release.wait(timeout=10), max_workers=1)
+        pool.submit("a", 0, limit=2)
+        pool.submit("a", 1, limit=2)
+        with self.assertRaises(QueueFullError):
+            pool.submit("a", 2, limit=2)
+        self.assertEqual(pool.submit("b", 0, limit=2), 0)  # 上限按 key 计算
+        release.set()
+        pool.drain()
+
+    def test_worker_pool_fair_across_flows(self):
+        order: list[str] = []
+        done = threading.Semaphore(0)
+        gate = threading.Event()
+
+        def _handler(flow: str):
+            gate.wait(timeout=10)
+            time.sleep(0.01)
+            order.append(flow)
+            done.release()
+
+        weights = {"big": 1, "vip": 3}
+        pool = KeyedWorkerPool(_handler, max_workers=1, quantum=0.02, weight_of=lambda f: weights.get(f, 1))
+        for _ in range(30):
+            pool.submit("src.module.cp.peeper", "big", flow="big")
+        for _ in range(2):
+            pool.submit("src.module.cp.peeper", "small", flow="small")
+        for _ in range(30):
+            pool.submit("src.module.cp.peeper", "vip", flow="vip")
+        gate.set()
+        for _ in range(62):
+            self.assertTrue(done.acquire(timeout=10))
+
+        self.assertLess(order.index("small"), 5)  # 小场景不必等大场景的请求全部处理完
+        self.assertEqual(order.count("small"), 2)
+        first_half = order[:30]
+        self.assertGreater(first_half.count("vip"), first_half.count("big") * 1.5)  # 按权重分配
+        pool.drain()
+
+    def test_worker_pool_new_flow_precharged(self):
+        gate = threading.Event()
+        started = threading.Event()
+
+        def _handler(_):
+            started.set()
+            gate.wait(timeout=10)
+
+        pool = KeyedWorkerPool(_handler, max_workers=1, quantum=0.5)
+        self.addCleanup(gate.set)
+        self.addCleanup(pool.drain)
+        pool.submit("blocker", "blocker", flow="other")
+        self.assertTrue(started.wait(timeout=5))  # 唯一的工作线程被占用，之后的请求只入队
+        for i in range(3):
+            pool.submit(f"burst_{i}", "burst", flow="burst")
+        pool.submit("late", "late", flow="late")
+
+        with pool._cond:
+            picked = [pool._pick()[0] for _ in range(2)]
+        self.assertEqual(picked, ["burst", "late"])  # 新 flow 的首批请求同样预扣，不能占满所有工作线程
+
+    def test_fast_path_routes_only_selected_messages(self):
+        async def _probe_info(_):
+            pass
+
+        def _probe_command(_):
+            pass
+
+        _probe_command.__module__ = "obot_fast_path_probe"
+        command(tokens=["probe_fast"],
+                fast_path=lambda message: _probe_info if message.tokens[1:] == ["info"] else None)(_probe_command)
+        self.addCleanup(unregister_module, "obot_fast_path_probe")
+
+        info_message = _FakeMessage(["/probe_fast", "info"])
+        info_id = get_message_id(info_message)
+        self.assertTrue(info_id.is_async)
+        self.assertIs(_prepare_command(info_message, info_id), _probe_info)
+
+        other_message = _FakeMessage(["/probe_fast", "pick"])
+        other_id = get_message_id(other_message)
+        self.assertFalse(other_id.is_async)  # 其余子指令仍经过工作线程池
+        self.assertIs(_prepare_command(other_message, other_id), _probe_command)
+
+    def test_coalesce_flight_replay(self):
+        leader = _FakeMessage(["/近日比赛"])
+        flight = _Flight(leader)
+        early, late = _FakeMessage(["/近日比赛"]), _FakeMessage(["/近日比赛"])
+
+        flight.join(early)
+        flight.record("reply", {"content": "正在查询", "img_path": None})
+        flight.join(late)  # 后加入的请求会补发之前的回复
+        flight.record("reply", {"content": "近日比赛", "img_path": "contest.jpg"})
+
+        expected = [("正在查询", None), ("近日比赛", "contest.jpg")]
+        self.assertEqual(early.replies, expected)
+        self.assertEqual(late.replies, expected)
+
+        self.assertEqual(_make_coalesce_key(_FakeMessage(["/CF", "info", "jiangly"]), "m", "/cf", True),
+                         _make_coalesce_key(_FakeMessage(["/cf", "info", "jiangly"]), "m", "/cf", True))
+        self.assertIsNone(_make_coalesce_key(_FakeMessage(["/cf"]), "m", "/cf", lambda message: None))
+        self.assertNotEqual(_make_coalesce_key(_FakeMessage(["/cf", "info"], uuid="group_a"), "m", "/cf", True),
+                            _make_coalesce_key(_FakeMessage(["/cf", "info"], uuid="group_b"), "m", "/cf", True))
+        admin_message = _FakeMessage(["/cf", "info"])
+        admin_message.user_permission_level = PermissionLevel.ADMIN
+        self.assertNotEqual(_make_coalesce_key(admin_message, "m", "/cf", lambda message: "info"),
+                            _make_coalesce_key(_FakeMessage(["/cf", "info"]), "m", "/cf", lambda message: "info"))
+        self.assertIsNone(_make_coalesce_key(_FakeMessage(["/cf"]), "m", "/cf", False))
+
+    def test_coalesce_followers_notified_on_shed(self):
+        class _ListenedMessage(_FakeMessage):
+            def __init__(self, tokens: list[str]):
+                super().__init__(tokens)
+                self.listeners = []
+
+            def add_reply_listener(self, listener):
+                self.listeners.append(listener)
+
+            def reply(self, content, img_path=None, img_url=None, modal_words=True, forward=True):
+                super().reply(content, img_path)
+                for listener in self.listeners if forward else []:
+                    listener("reply", {"content": content, "img_path": img_path})
+
+        def _probe_command(_):
+            pass
+
+        _probe_command.__module__ = "obot_coalesce_probe"
+        command(tokens=["probe_coalesce"], coalesce=True)(_probe_command)
+        self.addCleanup(unregister_module, "obot_coalesce_probe")
+
+        leader, follower = _ListenedMessage(["/probe_coalesce"]), _ListenedMessage(["/probe_coalesce"])
+
+        def _shed(*args, **kwargs):
+            transit_module.dispatch_message(follower)  # 执行者入队前加入的请求
+            raise QueueFullError("full")
+
+        with mock.patch.object(transit_module, "_get_admission_rule", lambda *args: None), \
+                mock.patch.object(transit_module._worker_pool, "submit", _shed), \
+                mock.patch.object(transit_module._admission, "record_shed"):
+            transit_module.dispatch_message(leader)
+
+        self.assertEqual(leader.replies, [("O宝正忙不过来，请稍后再试", None)])
+        self.assertEqual(follower.replies, leader.replies)
+        self.assertNotIn(get_message_id(leader).coalesce_key, transit_module._flights)
+
+        # 排队位次只属于执行者，合并的请求只收到指令的输出
+        leader, follower = _ListenedMessage(["/probe_coalesce"]), _ListenedMessage(["/probe_coalesce"])
+
+        def _queued(key, item, on_queued=None, **kwargs):
+            on_queued(2)
+            transit_module.dispatch_message(follower)
+            leader.reply("结果")
+            return 2
+
+        with mock.patch.object(transit_module, "_get_admission_rule", lambda *args: None), \
+                mock.patch.object(transit_module._worker_pool, "submit", _queued):
+            transit_module.dispatch_message(leader)
+        transit_module._finish_flight(leader, get_message_id(leader))
+
+        self.assertEqual(leader.replies, [("已加入处理队列，当前对话前方还有 2 个请求", None), ("结果", None)])
+        self.assertEqual(follower.replies, [("结果", None)])
+
+    def test_admission_rules_and_buckets(self):
+        conf = {
+            "default": {"user_rate": 0.001, "user_burst": 3},
+            "rules": {
+                "src.module.cp.peeper": {"queue_cap": 5},
+                "/today": {"user_burst": 1}
+            }
+        }
+        controller = AdmissionController()
+        default_rule = controller.resolve(conf, "src.module.stuff.misc", "/hitokoto")
+        self.assertEqual(default_rule.name, "default")
+        self.assertIsNone(default_rule.queue_cap)
+
+        today_rule = controller.resolve(conf, "src.module.cp.peeper", "/today")
+        self.assertEqual(today_rule.name, "/today")
+        self.assertEqual(today_rule.queue_cap, 5)  # 继承模块规则
+        self.assertEqual(today_rule.user_burst, 1)
+
+        self.assertEqual(controller.acquire(today_rule, "group_1", "u1"), (Verdict.ACCEPT, False))
+        self.assertEqual(controller.acquire(today_rule, "group_1", "u1"), (Verdict.REJECTED, True))
+        self.assertEqual(controller.acquire(today_rule, "group_1", "u1"), (Verdict.REJECTED, False))
+        self.assertEqual(controller.acquire(today_rule, "group_1", "u2")[0], Verdict.ACCEPT)
+        self.assertEqual(controller.acquire(default_rule, "group_1", "u1")[0], Verdict.ACCEPT)
+
+        controller.record_shed(today_rule)
+        self.assertEqual(controller.counters(), {"rejected": {"/today": 2}, "shed": {"/today": 1}})
+
+        # 被用户令牌桶拒绝的请求不消耗场景的令牌
+        shared_rule = controller.resolve({"default": {"scene_rate": 0.001, "scene_burst": 2,
+                                                      "user_rate": 0.001, "user_burst": 1}}, "m", "/cmd")
+        self.assertEqual(controller.acquire(shared_rule, "group_2", "u1")[0], Verdict.ACCEPT)
+        for _ in range(5):
+            self.assertEqual(controller.acquire(shared_rule, "group_2", "u1")[0], Verdict.REJECTED)
+        self.assertEqual(controller.acquire(shared_rule, "group_2", "u2")[0], Verdict.ACCEPT)
+        self.assertEqual(controller.acquire(shared_rule, "group_2", "u3")[0], Verdict.REJECTED)
+
+        reloaded = {"default": {}, "rules": {}}  # 配置重载后按新配置解析
+        self.assertIsNone(controller.resolve(reloaded, "src.module.cp.peeper", "/today").queue_cap)
+
+    def test_command_deadline_cancels_in_worker(self):
+        cancelled = threading.Event()
+        record = {}
+
+        def _hanging_command(message):
+            get_cancel_token().on_cancel(cancelled.set)  # 截止时间到达时令牌被主动取消
+            self.assertTrue(cancelled.wait(timeout=5))
+            record['replies_at_cancel'] = len(message.replies)
+            time.sleep(0.1)  # 收尾期间工作线程仍被占用
+            record['finished'] = time.perf_counter()
+            check_cancelled()
+
+        message = _FakeMessage(["/hang"])
+        start = time.perf_counter()
+        _run_command_with_deadline(message, MessageID("src.module.test", "/hang"), _hanging_command, 0.2)
+        self.assertGreaterEqual(time.perf_counter(), record['finished'])  # 响应取消的指令返回后才释放工作线程
+        self.assertLess(record['finished'] - start, 2)
+        self.assertEqual(record['replies_at_cancel'], 1)  # 到达截止时间即回复用户，不等待指令返回
+        self.assertEqual(len(message.replies), 1)
+
+    def test_command_deadline_releases_unresponsive_worker(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def _blocking_command(_):
+            release.wait(timeout=10)  # 不检查取消令牌，如阻塞在没有超时的调用中
+
+        message = _FakeMessage(["/block"])
+        start = time.perf_counter()
+        with mock.patch.dict(Constants.modules_conf.transit, {"cancel_grace": 0.1}):
+            _run_command_with_deadline(message, MessageID("src.module.test", "/block"), _blocking_command, 0.2)
+        self.assertLess(time.perf_counter() - start, 2)  # 工作线程在截止时间后被释放
+        self.assertFalse(release.is_set())
+        self.assertEqual(len(message.replies), 1)
+
+    def test_command_before_deadline_not_timed_out(self):
+        message = _FakeMessage(["/quick"])
+        _run_command_with_deadline(message, MessageID("src.module.test", "/quick"), lambda _: None, 0.1)
+        time.sleep(0.3)
+        self.assertEqual(message.replies, [])
+
+    def test_run_py_file_killed_on_cancel(self):
+        token = CancelToken()
+        reset_token = use_cancel_token(token)
+        timer = threading.Timer(0.5, token.cancel)
+        timer.start()
+        start = time.perf_counter()
+        try:
+            with self.assertRaises(OperationCancelledError):
+                run_py_file('-c "import time; print(1, flush=True); time.sleep(30)"',
+                            os.path.dirname(sys.executable))
+        finally:
+            reset_cancel_token(reset_token)
+            timer.cancel()
+        self.assertLess(time.perf_counter() - start, 10)
+
+    def test_usage_ledger(self):
+        ledger = UsageLedger()
+        ledger.record("group_1", 2.0, 1.0)
+        ledger.record("group_1", 1.0, 0.5)
+        ledger.record("c2c_2", 5.0)
+        usages = ledger.summary()
+        self.assertEqual([usage.scene for usage in usages], ["c2c_2", "group_1"])
+        self.assertEqual((usages[1].wall_time, usages[1].cpu_time, usages[1].count), (3.0, 1.5, 2))
+
+    def test_reload_module(self):
+        module_dir = tempfile.mkdtemp()
+        module_file = os.path.join(module_dir, "obot_reload_probe.py")
+
+        def _write_probe(reply: str, extra_token: str):
+            with open(module_file, "w", encoding="utf-8") as f:
+                f.write("import threading\n\n"
+                        "from src.core.bot.decorator import command, module, registry_lock\n\n"
+                        "lock_free = []  # 导入期间其他线程可以获取 registry_lock\n"
+                        "_probe = threading.Thread(target=lambda: lock_free.append("
+                        "registry_lock.acquire(timeout=1) and (registry_lock.release() or True)))\n"
+                        "_probe.start()\n"
+                        "_probe.join()\n\n\n"
+                        f"@command(tokens=['probe', '{extra_token}'])\n"
+                        "def reply_probe(message):\n"
+                        f"    return '{reply}'\n\n\n"
+                        "@module(name='Reload-Probe', version='v1.0.0')\n"
+                        "def register_module():\n"
+                        "    pass\n")
+
+        sys.path.insert(0, module_dir)
+        try:
+            _write_probe("v1", "probe_old")
+            importlib.import_module("obot_reload_probe")
+            revision = get_registry_revision()
+            self.assertEqual(resolve_module_path("Reload-Probe"), "obot_reload_probe")
+
+            _write_probe("v2", "probe_renamed")
+            importlib.invalidate_caches()
+            result = reload_module("obot_reload_probe")
+            commands = __commands__["obot_reload_probe"]
+            self.assertEqual(result.command_count, 2)
+            self.assertEqual(set(commands), {"/probe", "/probe_renamed"})  # 旧指令被移除
+            self.assertEqual(commands["/probe"][0](None), "v2")
+            self.assertGreater(get_registry_revision(), revision)  # 路由表会随之重建
+            self.assertIn("Reload-Probe", __modules__)
+            self.assertEqual(sys.modules["obot_reload_probe"].lock_free, [True])
+
+            with open(module_file, "w", encoding="utf-8") as f:
+                f.write("raise RuntimeError('broken')\n")
+            with self.assertRaises(RuntimeError):
+                reload_module("obot_reload_probe")
+            self.assertEqual(set(__commands__["obot_reload_probe"]), {"/probe", "/probe_renamed"})  # 回滚
+        finally:
+            sys.path.remove(module_dir)
+            sys.modules.pop("obot_reload_probe", None)
+            unregister_module("obot_reload_probe")
+            shutil.rmtree(module_dir, ignore_errors=True)
+
+    def test_message_journal_round_trip(self):
+        raw = SimpleNamespace(id="msg-1", content=" /cf info jiangly", group_openid="g1",
+                              author=SimpleNamespace(member_openid="u1"),
+                              attachments=[SimpleNamespace(url="https://img", filename="a.png")])
+        message = RobotMessage(None)
+        message.setup_group_message(None, raw)
+        message.msg_seq = 3
+
+        journal_dir = tempfile.mkdtemp()
+        origin_path = data_message_journal._data_path
+        data_message_journal._data_path = os.path.join(journal_dir, "message_journal.json")
+        try:
+            expired = dict(message.to_journal(), received_at=time.time() - 3600)
+            data_message_journal.save_journal([message.to_journal(), expired])
+            entries = data_message_journal.pop_journal()
+            self.assertEqual(len(entries), 1)  # 过期的消息不再重放
+            self.assertEqual(data_message_journal.pop_journal(), [])  # 读取后清空
+        finally:
+            data_message_journal._data_path = origin_path
+            shutil.rmtree(journal_dir, ignore_errors=True)
+
+        restored = RobotMessage.from_journal(None, None, entries[0])
+        self.assertEqual(restored.message_type, MessageType.GROUP)
+        self.assertEqual(restored.tokens, ["/cf", "info", "jiangly"])
+        self.assertEqual((restored.uuid, restored.author_id), ("group_g1", "u1"))
+        self.assertEqual((restored.message.id, restored.msg_seq), ("msg-1", 3))
+        self.assertEqual(restored.attachments[0].url, "https://img")
+
+    def test_media_upload_cache(self):
+        uploads, sends = [], []
+        stale_files = set()
+        network_errors = []
+
+        class _FakeApi:
+            async def post_group_file(self, **kwargs):
+                uploads.append(kwargs["group_openid"])
+                return {"file_uuid": str(len(uploads)), "file_info": f"info-{len(uploads)}", "ttl": 3600}
+
+            post_c2c_file = post_group_file
+
+            async def post_group_message(self, **kwargs):
+                if network_errors:
+                    raise network_errors.pop(0)
+                if kwargs["media"]["file_info"] in stale_files:
+                    raise ServerError("file_info expired")
+                sends.append(kwargs["media"]["file_info"])
+
+        media_dir = tempfile.mkdtemp()
+        img_path = os.path.join(media_dir, "card.png")
+        with open(img_path, "wb") as f:
+            f.write(os.urandom(256))
+
+        origin_cache = message_module._media_cache
+        message_module._media_cache = message_module.MediaCache()
+        try:
+            def _send(group_openid: str, msg_seq: int):
+                message = RobotMessage(_FakeApi())
+                message.setup_active_group_message(None, group_openid)
+                asyncio.run(message._send_media_message("", msg_seq, img_path, None, media_type="Image"))
+
+            _send("g1", 1)
+            _send("g1", 2)  # 同一场景复用 file_info，不再编码上传
+            _send("g2", 3)  # file_info 只在上传时的场景内有效
+            self.assertEqual(uploads, ["g1", "g2"])
+            self.assertEqual(sends, ["info-1", "info-1", "info-2"])
+
+            network_errors.append(ConnectionResetError())
+            _send("g1", 4)  # 网络异常重试后成功，缓存不受影响
+            self.assertEqual(uploads, ["g1", "g2"])
+            self.assertEqual(sends[-1], "info-1")
+
+            stale_files.add("info-1")
+            _send("g1", 5)  # 被平台拒绝后作废并重新上传
+            self.assertEqual(uploads, ["g1", "g2", "g1"])
+            self.assertEqual(sends[-1], "info-3")
+
+            stats = message_module.get_media_cache_stats()
+            self.assertEqual((stats.hits, stats.misses, stats.invalidated, stats.entries), (3, 3, 1, 2))
+        finally:
+            message_module._media_cache = origin_cache
+            shutil.rmtree(media_dir, ignore_errors=True)
+
+        cache = message_module.MediaCache()
+        cache.put(("a",), {"file_info": "short", "ttl": 30})  # 剩余有效期过短时不缓存
+        self.assertIsNone(cache.get(("a",)))
+
+    def test_encode_file_base64_chunked(self):
+        media_dir = tempfile.mkdtemp()
+        origin_chunk = message_module._B64_CHUNK
+        message_module._B64_CHUNK = 12
+        try:
+            for size in (0, 1, 2, 3, 11, 12, 13, 24, 100, 4097):
+                path = os.path.join(media_dir, f"{size}.bin")
+                with open(path, "wb") as f:
+                    f.write(os.urandom(size))
+                with open(path, "rb") as f:
+                    expected = base64.b64encode(f.read()).decode()
+                self.assertEqual(message_module._encode_file_base64(path), expected, size)
+        finally:
+            message_module._B64_CHUNK = origin_chunk
+            shutil.rmtree(media_dir, ignore_errors=True)
+
+    def test_media_prep_keeps_loop_responsive(self):
+        async def _measure(blocking: bool) -> float:
+            monitor = LoopLagMonitor(interval=0.01)
+            monitor.start(asyncio.get_running_loop())
+            await asyncio.sleep(0.05)
+            if blocking:
+                time.sleep(0.3)  # 原先在事件循环中直接处理图片与编码
+            else:
+                await message_module._run_media_prep(time.sleep, 0.3)
+            await asyncio.sleep(0.05)
+            return monitor.stats().max_lag
+
+        self.assertGreater(asyncio.run(_measure(blocking=True)), 0.2)
+        self.assertLess(asyncio.run(_measure(blocking=False)), 0.1)
+
+    def test_outbound_order_merge_and_retry(self):
+        conf = {"target_rate": 0, "global_rate": 0, "merge_window": 0}
+        scheduler = OutboundScheduler(lambda: conf)
+        sent: list[tuple[str, int]] = []
+
+        def _job(content: str, msg_seq: int, delay: float = 0.0, owner=None, mergeable=True) -> OutboundJob:
+            async def _sender(merged_content: str, seq: int):
+                await asyncio.sleep(delay)
+                sent.append((merged_content, seq))
+            return OutboundJob(_sender, content, msg_seq, mergeable=mergeable, owner=owner)
+
+        async def _send_all(jobs: list[tuple[str, OutboundJob]]):
+            await asyncio.gather(*(scheduler.send(target, job) for target, job in jobs))
+
+        # 同一场景按提交顺序发送，即使前一条发送较慢
+        asyncio.run(_send_all([("g1", _job("正在查询", 1, delay=0.05)), ("g1", _job("结果", 2))]))
+        self.assertEqual(sent, [("正在查询", 1), ("结果", 2)])
+
+        # 开启合并后，同一消息在窗口内的纯文本回复合并为一次调用
+        sent.clear()
+        conf["merge_window"] = 0.05
+        owner, other = object(), object()
+        asyncio.run(_send_all([("g1", _job("a", 1, owner=owner)), ("g1", _job("b", 2, owner=owner)),
+                               ("g1", _job("img", 3, owner=owner, mergeable=False)),
+                               ("g1", _job("c", 1, owner=other))]))
+        self.assertEqual(sent, [("a\nb", 1), ("img", 3), ("c", 1)])
+        self.assertEqual(scheduler.stats().merged, 1)
+
+        # 令牌桶限速
+        sent.clear()
+        conf.update({"merge_window": 0, "target_rate": 20, "target_burst": 1})
+        start = time.monotonic()
+        asyncio.run(_send_all([("g2", _job(str(i), i, mergeable=False)) for i in range(4)]))
+        self.assertGreaterEqual(time.monotonic() - start, 0.12)
+        self.assertEqual([seq for _, seq in sent], [0, 1, 2, 3])
+
+        # 频率超限与网络异常时退避重试
+        conf.update({"retry_backoff": 0.01, "max_retries": 2})
+        failures = [SequenceNumberError("429"), ConnectionResetError()]
+
+        async def _api(**kwargs):
+            if failures:
+                raise failures.pop(0)
+            return kwargs["msg_seq"]
+
+        self.assertEqual(asyncio.run(scheduler.call_with_retry(_api, {"msg_seq": 7})), 7)
+        self.assertEqual(scheduler.stats().retried, 2)
+        failures.extend([SequenceNumberError("429")] * 3)
+        with self.assertRaises(SequenceNumberError):
+            asyncio.run(scheduler.call_with_retry(_api, {"msg_seq": 8}))
+        failures.clear()
+
+        # botpy 的 ServerError 可能来自 400 等永久性拒绝，不重试
+        retried = scheduler.stats().retried
+        failures.append(ServerError("msg_id expired"))
+        with self.assertRaises(ServerError):
+            asyncio.run(scheduler.call_with_retry(_api, {"msg_seq": 9}))
+        self.assertEqual(scheduler.stats().retried, retried)
+
+    def test_send_failure_counted(self):
+        attempts = []
+
+        class _RejectingApi:
+            async def post_group_message(self, **kwargs):
+                attempts.append(kwargs["content"])
+                raise ServerError("msg_id expired")  # 永久性拒绝
+
+        scheduler = OutboundScheduler(lambda: {"target_rate": 0, "global_rate": 0, "merge_window": 0})
+
+        async def _send():
+            message = RobotMessage(_RejectingApi())
+            message.setup_active_group_message(asyncio.get_running_loop(), "g_reject")
+            await message._enqueue_message("结果", 1)
+            await message._enqueue_audio(2)  # 缺少语音路径
+
+        with mock.patch.object(message_module, "_outbound", scheduler):
+            asyncio.run(_send())
+        stats = scheduler.stats()
+        self.assertEqual(attempts, ["结果"])  # 不重试
+        self.assertEqual((stats.sent, stats.failed, stats.retried), (0, 2, 0))
+
+    def test_progress_only_sent_when_slow(self):
+        sent = []
+
+        class _FakeApi:
+            async def post_group_message(self, **kwargs):
+                sent.append(kwargs["content"])
+
+        loop = asyncio.new_event_loop()
+        loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+        loop_thread.start()
+        transit_conf = Constants.modules_conf.transit
+        origin_delay = transit_conf.get("progress_delay")
+        transit_conf["progress_delay"] = 0.1
+        try:
+            message = RobotMessage(_FakeApi())
+            message.setup_active_group_message(loop, "g_progress")
+
+            message.progress("正在查询", modal_words=False)
+            message.reply("很快就查到了", modal_words=False)  # 结果先于阈值得出时不再提示
+            time.sleep(0.3)
+            self.assertEqual(message_module.wait_pending_sends(5), 0)
+            self.assertEqual(sent, ["很快就查到了"])
+
+            message.progress("正在查询", modal_words=False)
+            time.sleep(0.3)
+            message.reply("查了很久", modal_words=False)
+            self.assertEqual(message_module.wait_pending_sends(5), 0)
+            self.assertEqual(sent[1:], ["正在查询", "查了很久"])
+
+            message.progress("正在查询", modal_words=False)
+            message.discard_progress()  # 指令结束时弃置
+            time.sleep(0.3)
+            self.assertEqual(len(sent), 3)
+        finally:
+            if origin_delay is None:
+                transit_conf.pop("progress_delay", None)
+            else:
+                transit_conf["progress_delay"] = origin_delay
+            loop.call_soon_threadsafe(loop.stop)
+            loop_thread.join(timeout=5)
+            loop.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,231 @@
+import hashlib
+import os
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import requests
+
+from src.core.util import tools as tools_module
+from src.core.util.cassette import CassetteMissError, use_cassette
+from src.core.util.exception import PlatformUnavailableError
+from src.core.util.host_guard import HostGuard
+from src.core.util.http_client import HttpClient, AsyncHttpClient, run_sync
+from src.core.util.response_cache import ResponseCache
+from test.local_server import LocalHandler, start_local_server, stop_local_server
+
+
+class Network(unittest.TestCase):
+
+    def setUp(self):
+        self.server, self.base_url = start_local_server()
+        self.addCleanup(stop_local_server, self.server)
+
+    def test_http_client_keep_alive_and_retry(self):
+        conf = SimpleNamespace(general={"http": {"read_timeout": 0.3, "max_retries": 2, "retry_backoff": 0.01}})
+        client = HttpClient(conf)
+        try:
+            for i in range(5):
+                self.assertEqual(client.request("get", f"{self.base_url}/ok/{i}").text, f"/ok/{i}")
+            self.assertEqual(len(set(LocalHandler.peers)), 1)  # 复用同一个连接
+
+            response = client.request("get", f"{self.base_url}/flaky")  # 503 两次后成功
+            self.assertEqual((response.status_code, LocalHandler.hits["/flaky"]), (200, 3))
+
+            self.assertEqual(client.request("post", f"{self.base_url}/submit", payload={}).status_code, 503)
+            self.assertEqual(LocalHandler.hits["/submit"], 1)  # 非幂等请求不重试
+
+            start = time.perf_counter()
+            with self.assertRaises(Exception):
+                client.request("get", f"{self.base_url}/slow")
+            self.assertLess(time.perf_counter() - start, 3)  # 读取超时而不是一直等待
+        finally:
+            client.close()
+
+    def test_fetch_many_order_and_host_limit(self):
+        conf = SimpleNamespace(general={"http": {"max_retries": 0, "per_host_limit": 2}})
+
+        async def _fetch_all():
+            client = AsyncHttpClient(conf)
+            try:
+                urls = [f"{self.base_url}/wait/{i}" for i in range(6)]
+                urls.insert(3, f"{self.base_url}/flaky")
+                return await client.fetch_many(urls, concurrency=8)
+            finally:
+                await client.close()
+
+        start = time.perf_counter()
+        results = run_sync(_fetch_all())
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual([result.ok for result in results], [True] * 3 + [False] + [True] * 3)
+        self.assertEqual([result.text() for result in results if result.ok],
+                         [f"/wait/{i}" for i in range(6)])  # 按请求顺序返回
+        self.assertEqual(results[3].status, 503)
+        with self.assertRaises(ConnectionError):
+            results[3].text()
+
+        self.assertEqual(LocalHandler.max_active, 2)  # 同一 host 最多同时进行 2 个请求
+        self.assertLess(elapsed, 1.2)  # 仍比逐个请求快
+
+    def test_response_cache_revalidate_and_stale(self):
+        conf = SimpleNamespace(general={"http": {"max_retries": 0, "connect_timeout": 0.5}})
+        cache_conf = {"rules": [
+            {"pattern": "/etag/swr", "ttl": 0, "stale_while_revalidate": 60},
+            {"pattern": "/etag", "ttl": 0.2, "stale_if_error": 60}
+        ]}
+        with tempfile.TemporaryDirectory() as directory:
+            client = HttpClient(conf, ResponseCache(directory, lambda: cache_conf))
+            try:
+                url = f"{self.base_url}/etag/list"
+                self.assertEqual(client.request("get", url).text, "cached body")
+                self.assertEqual(client.request("get", url).text, "cached body")  # 未过期，不请求上游
+                self.assertEqual(LocalHandler.hits["/etag/list"], 1)
+
+                time.sleep(0.25)
+                self.assertEqual(client.request("get", url).text, "cached body")  # 条件请求返回 304
+                self.assertEqual((LocalHandler.hits["/etag/list"], LocalHandler.hits["304"]), (2, 1))
+
+                # 重启后从磁盘读取
+                client.close()
+                client = HttpClient(conf, ResponseCache(directory, lambda: cache_conf))
+                self.assertEqual(client.request("get", url).text, "cached body")
+                self.assertEqual(LocalHandler.hits["/etag/list"], 2)
+
+                swr_url = f"{self.base_url}/etag/swr"
+                client.request("get", swr_url)
+                self.assertEqual(client.request("get", swr_url).text, "cached body")  # 先返回旧的内容
+                for _ in range(50):
+                    if LocalHandler.hits["/etag/swr"] == 2:
+                        break
+                    time.sleep(0.02)
+                self.assertEqual(LocalHandler.hits["/etag/swr"], 2)  # 后台重新验证
+
+                self.assertEqual(client.request("get", swr_url, fresh=True).text, "cached body")
+                self.assertEqual(LocalHandler.hits["/etag/swr"], 3)  # 跳过缓存，经条件请求确认
+
+                LocalHandler.down = True
+                time.sleep(0.25)
+                self.assertEqual(client.request("get", url).text, "cached body")  # 上游不可用时使用过期缓存
+                self.assertEqual(client.request("get", url, fresh=True).status_code, 503)  # 不使用过期缓存
+                self.assertEqual(client.request("get", f"{self.base_url}/etag/other").status_code, 503)
+
+                stats = client.cache.stats()[0]  # 重启后的统计
+                self.assertEqual((stats.hits, stats.stale_hits, stats.revalidated, stats.errors_served),
+                                 (1, 1, 2, 1))
+                self.assertEqual(stats.misses, 3)
+                self.assertGreater(stats.bytes_saved, 0)
+            finally:
+                client.close()
+
+    def test_host_rate_limit_and_breaker(self):
+        conf = SimpleNamespace(general={"http": {"max_retries": 0}})
+        guard = HostGuard(lambda: {"127.0.0.1": {"rate": 10, "burst": 1, "failure_threshold": 2,
+                                                 "reset_timeout": 0.2}})
+        client = HttpClient(conf, guard=guard)
+        try:
+            start = time.perf_counter()
+            for i in range(4):
+                client.request("get", f"{self.base_url}/ok/{i}")
+            self.assertGreaterEqual(time.perf_counter() - start, 0.28)  # 每秒最多 10 次
+
+            LocalHandler.down = True
+            for _ in range(2):
+                self.assertEqual(client.request("get", f"{self.base_url}/etag/down").status_code, 503)
+            self.assertEqual(guard.states()[0].state, "open")
+            with self.assertRaises(PlatformUnavailableError):  # 熔断期间不再请求上游
+                client.request("get", f"{self.base_url}/etag/down")
+            self.assertEqual(LocalHandler.hits["/etag/down"], 2)
+
+            time.sleep(0.25)
+            LocalHandler.down = False
+            self.assertEqual(client.request("get", f"{self.base_url}/etag/down").status_code, 200)  # 探测成功后恢复
+            state = guard.states()[0]
+            self.assertEqual((state.state, state.failures, state.rejected), ("closed", 0, 1))
+        finally:
+            client.close()
+
+    def test_download_imgs_streaming_hash(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(tools_module, "patch_https_url", lambda url: url):
+            sizes = [100, 300000, 5000]
+            targets = [(f"{self.base_url}/blob/{size}", os.path.join(directory, f"{i}.gif"))
+                       for i, size in enumerate(sizes)]
+            targets.append((f"{self.base_url}/blob/200000", os.path.join(directory, "large.gif")))
+
+            start = time.perf_counter()
+            results = tools_module.download_imgs(targets, max_size=150000)
+            self.assertLess(time.perf_counter() - start, 0.6)  # 并发下载
+
+            self.assertIsNone(results[1])  # 超过大小上限
+            self.assertIsNone(results[3])
+            for size, result in zip(sizes, results):
+                if result is None:
+                    continue
+                with open(result.path, "rb") as f:
+                    content = f.read()
+                self.assertEqual(result.size, size)
+                self.assertEqual(result.md5, hashlib.md5(content).hexdigest())
+                self.assertEqual(result.sha256, hashlib.sha256(content).hexdigest())
+            self.assertEqual(sorted(os.listdir(directory)), ["0.gif", "2.gif"])  # 不残留未完成的文件
+
+    def test_download_imgs_partial_failure(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(tools_module, "patch_https_url", lambda url: url):
+            targets = [(f"{self.base_url}/blob/100", os.path.join(directory, "0.gif")),
+                       ("http://127.0.0.1:1/refused", os.path.join(directory, "1.gif")),  # 连接被拒绝
+                       (f"{self.base_url}/blob/200", os.path.join(directory, "2.gif"))]
+            results = tools_module.download_imgs(targets)
+
+            self.assertIsNone(results[1])  # 单张失败不影响其他图片
+            self.assertEqual([results[0].size, results[2].size], [100, 200])
+            self.assertEqual(sorted(os.listdir(directory)), ["0.gif", "2.gif"])
+
+    def test_cassette_record_and_replay(self):
+        conf = SimpleNamespace(general={"http": {"max_retries": 0}})
+        client = HttpClient(conf)
+        self.addCleanup(client.close)
+
+        async def _fetch_async(url: str):
+            async_client = AsyncHttpClient(conf)
+            try:
+                return await async_client.request("get", url)
+            finally:
+                await async_client.close()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cassette.json")
+            with use_cassette(path, mode="record"):
+                recorded = client.request("get", f"{self.base_url}/etag/a")
+                recorded_async = run_sync(_fetch_async(f"{self.base_url}/ok/b"))
+            stop_local_server(self.server)
+
+            with use_cassette(path, latency=0.1):  # 服务已关闭，只能回放
+                start = time.perf_counter()
+                replayed = client.request("get", f"{self.base_url}/etag/a")
+                self.assertGreaterEqual(time.perf_counter() - start, 0.1)
+                self.assertEqual((replayed.status_code, replayed.text, replayed.headers["etag"]),
+                                 (recorded.status_code, recorded.text, recorded.headers["ETag"]))
+                self.assertEqual(run_sync(_fetch_async(f"{self.base_url}/ok/b")), recorded_async)
+                with self.assertRaises(CassetteMissError):
+                    client.request("get", f"{self.base_url}/ok/missing")
+
+            guard = HostGuard(lambda: {"127.0.0.1": {"failure_threshold": 2}})
+            guarded_client = HttpClient(conf, guard=guard)
+            self.addCleanup(guarded_client.close)
+            with use_cassette(path, failure_rate=1):
+                for _ in range(3):
+                    with self.assertRaises(requests.ConnectionError):  # 模拟网络异常，不会触发熔断
+                        guarded_client.request("get", f"{self.base_url}/etag/a")
+            with use_cassette(path):
+                with self.assertRaises(CassetteMissError):
+                    guarded_client.request("get", f"{self.base_url}/ok/missing")
+                with self.assertRaises(CassetteMissError):  # 不被包装为网络异常
+                    tools_module.fetch_url(f"{self.base_url}/ok/missing", method="get")
+            self.assertEqual(guard.states(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
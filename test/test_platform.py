@@ -1,14 +1,52 @@
 import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
 import unittest
+from unittest import mock
 
 from dataclasses import asdict
 
+from src.core.util import json_stream
+from src.core.util import tools as tools_module
+from src.core.util.cassette import cassette_from_env
+from src.data import data_cf_problemset, data_cf_submissions
+from src.data.data_cf_problemset import ProblemIndex
 from src.platform.online.atcoder import AtCoder
-from src.platform.online.codeforces import Codeforces
+from src.platform.online.codeforces import Codeforces, ProbInfo
 from src.platform.online.nowcoder import NowCoder
 from src.platform.collect.clist import Clist
 from test.file_output import get_output_path
 
+_cassette = cassette_from_env()  # 设置 OBOT_CASSETTE 后录制或回放请求，可离线运行
+
+
+def _make_problemset_payload(count: int, indent: int | None = None) -> str:
+    """构造与 problemset.problems 格式相同的响应"""
+    rng = random.Random(7)
+    tags = ["dp", "greedy", "math", "graphs", "brute force", "strings", "trees", "number theory"]
+    problems, statistics = [], []
+    for i in range(count):
+        problem = {"contestId": 1 + i // 6, "index": "ABCDEF"[i % 6], "name": f"Problem {i}",
+                   "type": "PROGRAMMING", "points": 500.0, "tags": rng.sample(tags, rng.randint(0, 4))}
+        if i % 5:
+            problem["rating"] = rng.randrange(800, 3600, 100)
+        problems.append(problem)
+        statistics.append({"contestId": problem["contestId"], "index": problem["index"], "solvedCount": i})
+    return json.dumps({"status": "OK", "result": {"problems": problems, "problemStatistics": statistics}},
+                      indent=indent)
+
+
+def setUpModule():
+    _cassette.__enter__()
+
+
+def tearDownModule():
+    _cassette.__exit__(None, None, None)
+
 
 class Platform(unittest.TestCase):
     def test_codeforces_contest_list(self):
@@ -93,5 +131,178 @@ class Platform(unittest.TestCase):
             print(standings_info)
 
 
+class PlatformOffline(unittest.TestCase):
+    """不访问网络的测试，平台接口均以构造的数据代替"""
+
+    def test_json_stream_projection(self):
+        text = _make_problemset_payload(50, indent=2)
+        fields = ("contestId", "index", "rating", "tags")
+        legacy = [tuple(problem.get(field) for field in fields) for problem in json.loads(text)["result"]["problems"]]
+        self.assertEqual(json_stream.project(text, ("result", "problems"), fields), legacy)
+        self.assertEqual(json_stream.extract(text, ("status",)), "OK")
+        self.assertEqual(json_stream.extract(text, ("result", "problemStatistics"))[3]["solvedCount"], 3)
+        self.assertEqual(list(json_stream.iter_items('{"result": {"a": 1, "rows": [ ]}}', ("result", "rows"))), [])
+        self.assertEqual(json_stream.project('[{"party": {"members": [{"handle": "tourist"}]}}, {}]', (),
+                                             ("party.members.0.handle",)), [("tourist",), (None,)])
+        with self.assertRaises(KeyError):
+            json_stream.extract(text, ("result", "rows"))
+
+    def test_json_stream_benchmark(self):
+        """比较完整解析与按需投影的峰值内存与耗时"""
+        text = _make_problemset_payload(20000)
+        fields = ("contestId", "index", "name", "rating", "tags")
+
+        def _legacy():
+            return [tuple(problem.get(field) for field in fields)
+                    for problem in json.loads(text)["result"]["problems"]]
+
+        def _projected():
+            return json_stream.project(text, ("result", "problems"), fields)
+
+        costs = {}
+        for name, func in [("legacy", _legacy), ("projected", _projected)]:
+            tracemalloc.start()
+            start = time.perf_counter()
+            result = func()
+            cost = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            costs[name] = (result, cost, peak)
+
+        self.assertEqual(costs["legacy"][0], costs["projected"][0])
+        self.assertLess(costs["projected"][2], costs["legacy"][2] / 2)
+
+    def test_problem_index_filter_and_persist(self):
+        text = _make_problemset_payload(12000)
+        problems = json_stream.project(text, ("result", "problems"), Codeforces._PROBLEM_FIELDS)
+        index = ProblemIndex.build(problems)
+
+        def _legacy(tag, rating_range, newer, excludes):
+            return sorted((prob[0], prob[1]) for prob in problems
+                          if (tag is None or tag in prob[4])
+                          and (rating_range is None or prob[3] is not None
+                               and rating_range[0] <= prob[3] <= rating_range[1])
+                          and (not newer or prob[0] >= 1000)
+                          and f"{prob[0]}{prob[1]}" not in excludes)
+
+        excludes = {"1500A", "1500B", "12C", "404Z"}
+        queries = [(None, None, False, set()), ("dp", (1200, 1800), False, excludes),
+                   ("brute force", None, True, excludes), ("math", (3000, 3500), True, set()),
+                   ("no such tag", None, False, set())]
+        for query in queries:
+            selected = index.select(*query)
+            self.assertEqual([(int(index.contest_ids[pos]), str(index.indices[pos])) for pos in selected],
+                             _legacy(*query))
+        self.assertEqual(len(index.select(tag="brute-force")), len(index.select(tag="brute force")))
+        origin = next(prob for prob in problems if prob[3] is not None and len(prob[4]) > 1)
+        pos = next(pos for pos in range(len(index))
+                   if (int(index.contest_ids[pos]), str(index.indices[pos])) == origin[:2])
+        self.assertEqual(index.problem_at(pos), dict(zip(Codeforces._PROBLEM_FIELDS, origin), tags=sorted(origin[4])))
+
+        query = ("greedy", (1400, 2000), True, excludes)
+        start = time.perf_counter()
+        for _ in range(20):
+            _legacy(*query)
+        baseline = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(20):
+            index.select(*query)
+        self.assertLess(time.perf_counter() - start, baseline)  # 宽松的相对比较，实际通常快一个数量级以上
+
+        index_dir = tempfile.mkdtemp()
+        origin_path, origin_index = data_cf_problemset._data_path, data_cf_problemset._index
+        data_cf_problemset._data_path = os.path.join(index_dir, "problemset.npz")
+        data_cf_problemset._index = None
+        try:
+            data_cf_problemset.set_problem_index(index)
+            data_cf_problemset._index = None  # 模拟重启
+            with mock.patch.object(Codeforces, "_api", side_effect=ConnectionError("down")):
+                self.assertEqual(Codeforces.get_prob_tags_all(), sorted(tag.replace(" ", "-") for tag in index.tags))
+                prob = Codeforces.get_prob_filtered(ProbInfo(tag="dp", limit="1200-1800", newer=True))
+                self.assertIn("dp", prob["tags"])
+                self.assertTrue(1200 <= prob["rating"] <= 1800 and prob["contestId"] >= 1000)
+                with self.assertRaises(ConnectionError):
+                    Codeforces.refresh_problem_index()  # 更新失败时保留原有的索引
+            self.assertEqual(len(data_cf_problemset.get_problem_index()), len(index))
+        finally:
+            data_cf_problemset._data_path, data_cf_problemset._index = origin_path, origin_index
+            shutil.rmtree(index_dir, ignore_errors=True)
+
+    def test_submission_store_incremental(self):
+        now = int(time.time())
+        rng = random.Random(11)
+        history = []  # 从新到旧，元组的格式见 Codeforces._SUBMISSION_FIELDS
+
+        def _submit(count: int, verdicts=("OK", "WRONG_ANSWER", "TIME_LIMIT_EXCEEDED")):
+            for _ in range(count):
+                submit_id = history[0][0] + 1 if history else 1
+                created = now - rng.randrange(0, 30 * 86400) if submit_id < 2000 else now
+                history.insert(0, (submit_id, created, rng.choice(verdicts),
+                                   rng.choice([rng.randrange(1, 300), None]), rng.choice("ABC")))
+
+        calls = []
+
+        def _fake_api(api, projection=None, **kwargs):
+            self.assertEqual((api, projection), ("user.status", {"": Codeforces._SUBMISSION_FIELDS}))
+            calls.append(kwargs.get("count"))
+            start = kwargs.get("_from_", 1) - 1
+            return {"": history[start:start + kwargs["count"]] if "count" in kwargs else history[start:]}
+
+        def _legacy(handle_history):
+            week_start, today_start = tools_module.get_week_start_timestamp(), tools_module.get_today_start_timestamp()
+            solved = [(f"{item[3]}-{item[4]}", item[1]) for item in handle_history if item[2] == "OK"]
+            return (len({key for key, _ in solved}), len({key for key, created in solved if created >= week_start}),
+                    len({key for key, created in solved if created >= today_start}))
+
+        store_dir = tempfile.mkdtemp()
+        origin_dir = data_cf_submissions._data_dir
+        data_cf_submissions._data_dir = store_dir
+        data_cf_submissions._stores.clear()
+        try:
+            with mock.patch.object(Codeforces, "_api", side_effect=_fake_api), \
+                    mock.patch.object(Codeforces, "_SUBMISSION_SYNC_INTERVAL", 0):
+                _submit(1999)
+                self.assertEqual(Codeforces.get_user_submit_counts("Tourist"), _legacy(history))
+                self.assertEqual(calls, [None])  # 首次一次性下载
+
+                _submit(3, verdicts=("OK",))
+                _submit(1, verdicts=("TESTING",))
+                _submit(250, verdicts=("OK",))
+                calls.clear()
+                self.assertEqual(Codeforces.get_user_submit_counts("tourist"), _legacy(history))
+                self.assertEqual(calls, [100, 100, 100])  # 只获取新的提交
+                self.assertEqual(Codeforces.get_user_submit_prob_id("tourist"),
+                                 {f"{item[3]}{item[4]}" for item in history if item[3] is not None})
+
+                pending = next(i for i, item in enumerate(history) if item[2] == "TESTING")
+                history[pending] = history[pending][:2] + ("OK",) + history[pending][3:]
+                calls.clear()
+                self.assertEqual(Codeforces.get_user_submit_counts("tourist"), _legacy(history))
+                self.assertEqual(calls, [100, 100, 100])  # 评测中的提交之后重新获取
+
+            data_cf_submissions._stores.clear()  # 模拟重启
+            with mock.patch.object(Codeforces, "_api", side_effect=ConnectionError("down")) as api:
+                data_cf_submissions.get_submission_store("tourist").synced_at = time.time()
+                self.assertEqual(Codeforces.get_user_submit_counts("tourist"), _legacy(history))
+                self.assertFalse(api.called)  # 短时间内的重复查询直接使用本地记录
+
+            for handle in ("../../config", "a/b", "..", ""):
+                with self.assertRaises(ValueError):  # 不允许拼接出数据目录以外的路径
+                    data_cf_submissions.get_submission_store(handle)
+            with mock.patch.object(data_cf_submissions, "_MAX_CACHED_HANDLES", 2):
+                for handle in ("user_1", "user.2", "user-3"):
+                    data_cf_submissions.get_submission_store(handle)
+                    data_cf_submissions.lock_of(handle)
+                self.assertEqual(list(data_cf_submissions._stores), ["user.2", "user-3"])  # 淘汰最久未使用的用户
+                self.assertEqual(list(data_cf_submissions._locks), ["user.2", "user-3"])
+            self.assertEqual(data_cf_submissions.get_submission_store("Tourist").count_solved(0, 0)[0],
+                             _legacy(history)[0])  # 淘汰后从磁盘读取
+        finally:
+            data_cf_submissions._data_dir = origin_dir
+            data_cf_submissions._stores.clear()
+            data_cf_submissions._locks.clear()
+            shutil.rmtree(store_dir, ignore_errors=True)
+
+
 if __name__ == '__main__':
     unittest.main()